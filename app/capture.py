@@ -0,0 +1,41 @@
+"""
+Ponto de entrada só de captura, sem a API: `python -m app.capture`.
+
+Sobe os agendadores de captura e a retenção com as mesmas configurações do
+.env (inclusive `CAPTURE_WORKERS` e `CAPTURE_MODE`), sem importar FastAPI,
+pandas ou Plotly. Os agregados do heatmap, os candles e a pirâmide de tiles não
+são mantidos aqui. Uma API rodando à parte não recebe o aviso de cada snapshot
+gravado: ela confere o histórico a cada `store_watch_seconds`
+(`app/schedules/store_watch.py`) para invalidar o cache, publicar o heatmap ao
+vivo e atualizar os agregados. SIGINT/SIGTERM param a captura gravando o que
+estiver pendente no writer.
+"""
+import asyncio
+import signal
+from datetime import datetime
+
+from app.config.settings import settings
+from app.schedules import order_book as order_book_schedule
+
+
+async def run():
+    # Nada é consultado neste processo: não mantém estado em memória para os gráficos
+    settings.aggregate_time_buckets = []
+    settings.candle_intervals = []
+    settings.tile_levels = 0
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    await order_book_schedule.start_schedule()
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [capture] Captura iniciada para {', '.join(settings.symbols)}.")
+    try:
+        await stop.wait()
+    finally:
+        await order_book_schedule.stop_schedule()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -1,5 +1,15 @@
+from pydantic import BaseModel, field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
+
+class RetentionTier(BaseModel):
+    """
+    Camada consolidada do histórico: somas de volume por bucket de tempo ×
+    bucket de preço, mantida por `retention_days` (0 = para sempre).
+    """
+    bucket_time: str
+    bucket_price: float
+    retention_days: float = 0.0
 
 class Settings(BaseSettings):
     app_name: str
@@ -7,6 +17,116 @@ class Settings(BaseSettings):
     capture_interval_seconds: int = 60
     depth_limit: int = 800
 
+    # Agendamento: intervalos/profundidades por símbolo (ex: {"BTCUSDT": 10}),
+    # capturas simultâneas, espalhamento aleatório e backoff para 429/418
+    capture_intervals: Dict[str, int] = {}
+    depth_limits: Dict[str, int] = {}
+    max_inflight_captures: int = 4
+    capture_jitter_seconds: float = 0.5
+    capture_backoff_base_seconds: float = 5.0
+    capture_backoff_max_seconds: float = 300.0
+
+    # Cliente HTTP da exchange (compartilhado entre todos os símbolos)
+    exchange_base_url: str = "https://api.binance.com"
+    http_timeout_seconds: float = 10.0
+    http_max_connections: int = 20
+
+    # Processos de captura separados da API (0 = captura no próprio processo da API)
+    capture_workers: int = 0
+
+    # Modo de captura: "rest" (polling do depth) ou "stream" (livro local via WebSocket de diffs)
+    capture_mode: str = "rest"
+    exchange_ws_url: str = "wss://stream.binance.com:9443"
+    stream_update_speed: str = "100ms"
+    stream_seed_depth_limit: int = 1000
+    # Os snapshots são gravados com timestamp em segundos inteiros: o intervalo mínimo é 1 segundo
+    stream_snapshot_interval_seconds: float = 1.0
+
+    # Formato de armazenamento dos snapshots: "columnar" (binário) ou "csv" (legado)
+    storage_format: str = "columnar"
+    # Leituras longas (histogramas) percorrem o histórico em blocos de até tantos níveis
+    read_chunk_rows: int = 1_000_000
+
+    # Gravação em lote: um lote é gravado a cada `writer_flush_seconds` ou ao somar `writer_flush_bytes`.
+    # Segmentos colunares giram por dia ou ao passar de `segment_max_bytes` (0 = só por dia).
+    writer_flush_seconds: float = 0.2
+    writer_flush_bytes: int = 8 * 1024 * 1024
+    segment_max_bytes: int = 512 * 1024 * 1024
+    compress_closed_segments: bool = True
+    # Apaga o histórico dos símbolos ao iniciar a captura (comportamento antigo)
+    reset_history_on_start: bool = False
+
+    # Retenção: snapshots brutos ficam `raw_retention_hours` (0 = para sempre); o histórico é
+    # consolidado nas camadas, da mais fina para a mais grossa (resoluções múltiplas entre si).
+    # A exportação CSV só tem os dados brutos: com um prazo, ela perde o que já expirou.
+    # Ex: RETENTION_TIERS='[{"bucket_time": "1min", "bucket_price": 1, "retention_days": 30}]'
+    raw_retention_hours: float = 0.0
+    retention_tiers: List[RetentionTier] = [
+        RetentionTier(bucket_time="1min", bucket_price=1.0, retention_days=30.0),
+        RetentionTier(bucket_time="1h", bucket_price=10.0, retention_days=0.0),
+    ]
+    compaction_interval_seconds: float = 3600.0
+
+    # Resoluções padrão do heatmap mantidas pré-agregadas durante a captura
+    aggregate_time_buckets: List[str] = ["1min", "5min", "30min", "1h"]
+    aggregate_price_buckets: List[float] = [1.0, 5.0, 10.0, 50.0, 100.0]
+    # Horas mais recentes cobertas pelos agregados e pelos candles em memória (0 = todo o histórico
+    # bruto); janelas que começam antes disso são calculadas a partir dos dados guardados
+    aggregate_horizon_hours: float = 720.0
+
+    # Intervalos de candle mantidos em memória e atualizados a cada snapshot
+    candle_intervals: List[str] = ["1min", "5min", "15min", "1h", "4h", "1d"]
+
+    # Pirâmide de tiles do heatmap (zoom/pan): níveis (0 = desligada), bucket de tempo do nível mais
+    # fino, bucket de preço do nível mais fino como fração do preço do ativo, intervalo entre as
+    # atualizações em segundo plano (e gravações dos tiles alterados) e tiles em memória por símbolo
+    tile_levels: int = 12
+    tile_finest_seconds: int = 60
+    tile_finest_price_fraction: float = 1e-5
+    tile_refresh_seconds: float = 30.0
+    tile_cache_tiles: int = 256
+
+    # Cache dos heatmaps/histogramas renderizados (LRU por entradas e por tamanho)
+    render_cache_max_entries: int = 128
+    render_cache_max_bytes: int = 256 * 1024 * 1024
+    # Sem captura neste processo (ex.: `python -m app.capture` à parte), intervalo em que a API
+    # confere o histórico gravado para invalidar o cache e publicar o heatmap ao vivo (0 = desliga)
+    store_watch_seconds: float = 2.0
+
+    # Renderização em processos separados (0 = numa thread da API): renderizações aceitas
+    # (em execução + na fila) e tempo máximo de espera; acima disso os endpoints respondem 503
+    render_workers: int = 2
+    render_queue_limit: int = 8
+    render_timeout_seconds: float = 30.0
+    # Sobe e aquece o pool de renderização (pandas/Plotly carregados) em segundo plano ao iniciar a API
+    render_warmup: bool = False
+
+    # Endpoints em lote: limite de símbolos por requisição
+    batch_max_symbols: int = 32
+
+    # Dataset de aprendizado: faixas de profundidade (em pontos-base a partir do preço),
+    # horizontes dos retornos futuros usados como rótulo e linhas por shard
+    dataset_depth_buckets: int = 20
+    dataset_bucket_bps: float = 5.0
+    dataset_horizons_seconds: List[int] = [60, 300, 900]
+    dataset_shard_rows: int = 100_000
+
+    # Instrumentação: atraso do event loop que conta como bloqueio e perfil por requisição (?profile=1)
+    loop_block_threshold_seconds: float = 0.1
+    profiling_enabled: bool = False
+
+    # Heatmap ao vivo (SSE): mensagens pendentes por cliente antes de descartá-lo
+    live_queue_size: int = 16
+    live_keepalive_seconds: float = 15.0
+
+    @field_validator("stream_snapshot_interval_seconds")
+    @classmethod
+    def _whole_second_snapshots(cls, value: float) -> float:
+        # Intervalos menores gravariam vários snapshots com o mesmo timestamp
+        if value < 1:
+            raise ValueError("deve ser de pelo menos 1 segundo (timestamps em segundos inteiros)")
+        return value
+
     class Config:
         env_file = ".env"
         case_sensitive = False
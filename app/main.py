@@ -1,7 +1,16 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from datetime import datetime
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from app.config.settings import settings
 from app.routers import candlestick, order_book, learning
+from app.schedules import store_watch
+from app.services import heatmap_tiles, metrics
+from app.services.render_pool import render_pool
 
 app = FastAPI()
 
@@ -15,3 +24,86 @@ templates = Jinja2Templates(directory="app/templates")
 app.include_router(candlestick.router, prefix="/candlesticks", tags=["Candlestick"])
 app.include_router(order_book.router, prefix="/order-books", tags=["Order Book"])
 app.include_router(learning.router, prefix="/learnings", tags=["Learning"])
+
+
+@app.on_event("shutdown")
+def shutdown_render_pool():
+    # Encerra os processos de renderização junto com a API
+    render_pool.shutdown()
+
+
+async def _warm_up_render():
+    started = time.perf_counter()
+    try:
+        pids = await asyncio.to_thread(render_pool.warm_up)
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [render] Renderização aquecida em "
+              f"{time.perf_counter() - started:.1f}s ({len(pids)} processo(s))")
+    except Exception as e:
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [render] Erro ao aquecer a renderização: {e}")
+
+
+@app.on_event("startup")
+async def warm_up_render():
+    # Opcional: a API já responde enquanto o pool de renderização sobe e carrega pandas/Plotly
+    if settings.render_warmup:
+        app.state.render_warmup = asyncio.create_task(_warm_up_render())
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    # Mede continuamente o quanto o event loop demora a responder
+    app.state.loop_monitor = asyncio.create_task(metrics.monitor_event_loop(settings.loop_block_threshold_seconds))
+
+
+@app.on_event("shutdown")
+def stop_loop_monitor():
+    app.state.loop_monitor.cancel()
+
+
+@app.on_event("startup")
+async def start_store_watch():
+    # Snapshots gravados por uma captura em outro processo (python -m app.capture)
+    store_watch.start()
+
+
+@app.on_event("shutdown")
+async def stop_store_watch():
+    await store_watch.stop()
+
+
+@app.on_event("shutdown")
+def flush_heatmap_tiles():
+    # Grava os tiles do heatmap alterados que ainda estão só em memória
+    heatmap_tiles.flush()
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Tempo de cada requisição por rota e, com `PROFILING_ENABLED` e `?profile=1`
+    (ou `X-Profile: 1`), as etapas da requisição no cabeçalho `Server-Timing`.
+    """
+    wants_profile = settings.profiling_enabled and (
+        request.query_params.get("profile") in ("1", "true") or request.headers.get("x-profile") in ("1", "true"))
+    started = time.perf_counter()
+    if wants_profile:
+        with metrics.profiling() as stages:
+            response = await call_next(request)
+    else:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    metrics.registry.observe("http_request_seconds", elapsed, method=request.method,
+                             route=getattr(route, "path", "outra"), status=response.status_code)
+    if wants_profile:
+        response.headers["Server-Timing"] = metrics.server_timing(stages, elapsed)
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    """
+    Métricas no formato texto do Prometheus.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
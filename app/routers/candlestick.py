@@ -1,16 +1,40 @@
-from fastapi import APIRouter
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query, status
 from app.schemas.candlestick import CandleRequest, CandleResponse
+from app.services import candles, snapshot_store
 
 router = APIRouter()
 
 @router.post("/", response_model=CandleResponse)
 def get_candlestick(data: CandleRequest):
-    # lógica mockada
-    return CandleResponse(
-        symbol=data.symbol,
-        interval=data.interval,
-        open=100.0,
-        close=105.0,
-        high=110.0,
-        low=95.0
-    )
+    """
+    Candle mais recente (ainda aberto) do símbolo no intervalo pedido, a partir
+    do `current_price` dos snapshots capturados.
+    """
+    try:
+        latest = candles.get_candles(data.symbol, data.interval, limit=1)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not latest:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Sem dados capturados para {data.symbol}")
+    return CandleResponse(symbol=data.symbol, interval=data.interval, **latest[0])
+
+
+@router.get("/", response_model=list[CandleResponse])
+def list_candlesticks(
+    symbol: str = Query(..., description="Símbolo da cripto (ex: BTCUSDT)"),
+    interval: str = Query("1min", description="Intervalo do candle (ex: 1min, 15min, 1h, 1d)"),
+    limit: int = Query(500, ge=1, description="Quantidade máxima de candles (os mais recentes da janela)"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601)"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601)"),
+):
+    """
+    Candles do símbolo em ordem de tempo. Intervalos de `CANDLE_INTERVALS` saem
+    da memória; os demais são calculados a partir do histórico gravado.
+    """
+    try:
+        rows = candles.get_candles(symbol, interval, snapshot_store.to_epoch(start), snapshot_store.to_epoch(end), limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return [CandleResponse(symbol=symbol, interval=interval, **row) for row in rows]
@@ -1,12 +1,74 @@
-from fastapi import APIRouter
-from app.schemas.learning import TrainingInput, TrainingResult
+import asyncio
+
+from fastapi import APIRouter, HTTPException, status
+from app.config.settings import settings
+from app.schemas.learning import DatasetBuildResult, DatasetInfo, TrainingInput, TrainingJobStatus
+from app.services import dataset, training
 
 router = APIRouter()
 
-@router.post("/train", response_model=TrainingResult)
+@router.post("/train", response_model=TrainingJobStatus, status_code=status.HTTP_202_ACCEPTED)
 def train_model(data: TrainingInput):
-    # lógica mockada
-    return TrainingResult(
-        accuracy=0.95,
-        message="Modelo treinado com sucesso."
-    )
+    """
+    Inicia o treino do modelo base em segundo plano e retorna o job; o
+    andamento fica em `/learnings/jobs/{job_id}`. Com `resume`, continua do
+    último checkpoint do símbolo até completar `epochs` épocas.
+    """
+    symbol = data.symbol or settings.symbols[0]
+    try:
+        job = training.start_job(symbol, data.epochs, data.learning_rate, data.batch_size,
+                                 data.horizon_seconds, data.resume)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return job.as_dict()
+
+
+@router.get("/jobs", response_model=list[TrainingJobStatus])
+def list_jobs():
+    return [job.as_dict() for job in reversed(list(training.jobs.values()))]
+
+
+@router.get("/jobs/{job_id}", response_model=TrainingJobStatus)
+def get_job(job_id: str):
+    """
+    Estado, progresso (0 a 1) e histórico por época (tempo, perda e acerto de validação) do treino.
+    """
+    job = training.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job não encontrado: {job_id}")
+    return job.as_dict()
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=TrainingJobStatus)
+def cancel_job(job_id: str):
+    """
+    Pede o cancelamento do treino; ele para no próximo lote, mantendo o checkpoint da última época concluída.
+    """
+    job = training.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job não encontrado: {job_id}")
+    job.cancel()
+    return job.as_dict()
+
+
+@router.post("/datasets/{symbol}/build", response_model=DatasetBuildResult)
+async def build_dataset(symbol: str):
+    """
+    Acrescenta ao dataset do símbolo as linhas dos snapshots capturados desde a
+    última construção (só os que já têm todos os horizontes dos rótulos).
+    """
+    try:
+        return await asyncio.to_thread(dataset.build, symbol)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/datasets/{symbol}", response_model=DatasetInfo)
+def get_dataset(symbol: str):
+    """
+    Especificação, nomes das features/rótulos, shards e marca d'água do dataset do símbolo.
+    """
+    manifest = dataset.load_manifest(symbol)
+    if manifest is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dataset não encontrado: {symbol}")
+    return DatasetInfo(symbol=symbol, **manifest)
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, status, Request, Query
-from fastapi.responses import JSONResponse
+import asyncio
+import csv
+import io
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, status, Request, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-from app.schedules import order_book as order_book_schedule
-from app.services.heatmap import generate_heatmap_data
-from app.services.histogram import generate_histograms  # Importa o gerador de histogramas
+from app.config.settings import settings
+from app.schedules import capture_workers, order_book as order_book_schedule, retention
+from app.services import batch_render, heatmap_tiles, snapshot_store
+from app.services.heatmap_grid import bucket_seconds
+from app.services.live_heatmap import live_heatmap
+from app.services.render_cache import render_cache
+from app.services.snapshot_writer import snapshot_writer
+from app.services.heatmap import generate_heatmap_data, generate_heatmap_json
+from app.services.histogram import generate_histograms, generate_histogram_json  # Importa o gerador de histogramas
+from app.services.render_pool import RenderOverloaded, render_pool
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -37,10 +49,210 @@ async def stop_schedule():
 @router.get("/capture/status", status_code=status.HTTP_200_OK)
 def get_schedule_status():
     """
-    Retorna se o agendador está ativo ou não.
+    Retorna se o agendador está ativo ou não, os contadores de disparos por
+    símbolo (atrasados, pulados, limitados pela exchange) e, no modo com
+    workers, a saúde de cada processo.
     """
     status_str = "ativo" if order_book_schedule.is_running() else "inativo"
-    return {"status": status_str}
+    response = {"status": status_str}
+    if order_book_schedule.tick_stats:
+        response["agendamento"] = order_book_schedule.schedule_status()
+        response["gravacao"] = snapshot_writer.stats()
+    if order_book_schedule.streams:
+        response["streams"] = order_book_schedule.stream_status()
+    if capture_workers.active():
+        response["workers"] = capture_workers.status()
+    response["retencao"] = retention.status()
+    return response
+
+
+@router.post("/retention/compact", status_code=status.HTTP_200_OK)
+async def compact_history():
+    """
+    Consolida nas camadas de retenção e expira o histórico de todos os símbolos agora.
+    """
+    return await retention.run_once()
+
+
+@router.get("/cache/stats", status_code=status.HTTP_200_OK)
+def get_cache_stats():
+    """
+    Retorna os contadores do cache de renderização (hits, misses, evictions...).
+    """
+    return render_cache.stats()
+
+
+@router.get("/render/stats", status_code=status.HTTP_200_OK)
+def get_render_stats():
+    """
+    Retorna os contadores do pool de renderização (pendentes, recusadas por fila
+    cheia, tempo esgotado...).
+    """
+    return render_pool.stats()
+
+
+def _data_url(request: Request) -> str:
+    """
+    URL do endpoint de dados equivalente à página pedida (mesmos parâmetros).
+    """
+    url = request.url.remove_query_params(["client", "live"])
+    return f"{url.path}/data?{url.query}"
+
+
+def _tiles_url(request: Request) -> str:
+    """
+    URL da viewport na pirâmide de tiles equivalente à página pedida.
+    """
+    url = request.url.remove_query_params(["client", "live", "tiles", "bucket_price", "bucket_time"])
+    return f"{url.path}/tiles?{url.query}"
+
+
+def _stream_url(request: Request) -> str:
+    """
+    URL do stream ao vivo equivalente à página pedida (sem janela fixa).
+    """
+    url = request.url.remove_query_params(["client", "live", "start", "end", "encoding"])
+    return f"{url.path}/stream?{url.query}"
+
+
+async def _render(key: tuple, func, *args, **kwargs) -> str:
+    """
+    Valor em cache ou calculado por `func` no pool de renderização. Sem dados
+    vira 404; fila cheia ou tempo esgotado viram 503.
+    """
+    try:
+        return await render_cache.get_or_compute(key, lambda: render_pool.run(func, *args, **kwargs))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except RenderOverloaded as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                            headers={"Retry-After": "5"})
+
+
+@router.get("/heatmap/data")
+async def get_heatmap_data(
+    symbol: str = Query(..., description="Símbolo da cripto (ex: BTCUSDT)"),
+    bucket_price: float = Query(None, description="Intervalo de preços no eixo Y (ex: 100.0)"),
+    bucket_time: str = Query("5min", description="Intervalo de tempo no eixo X (ex: 5min, 30min, 1h)"),
+    side: str = Query(None, description="Filtrar por lado: 'ask', 'bid' ou deixar vazio para ambos"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601)"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601)"),
+    encoding: str = Query("b64", description="Matriz z: 'b64' (float32 em base64) ou 'json' (listas)")
+):
+    """
+    Retorna a matriz do heatmap e seus eixos (buckets de preço, buckets de tempo
+    em epoch e preço de mercado), para desenho no cliente.
+    """
+    if encoding not in ("b64", "json"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Encoding inválido: use 'b64' ou 'json'")
+
+    key = render_cache.make_key("heatmap-data", symbol, side, bucket_price, bucket_time, (start, end), encoding)
+    payload = await _render(key, generate_heatmap_json, symbol, bucket_price, bucket_time, side, start, end, encoding)
+    return Response(payload, media_type="application/json")
+
+
+@router.get("/heatmap/stream")
+async def stream_heatmap(
+    symbol: str = Query(..., description="Símbolo da cripto (ex: BTCUSDT)"),
+    bucket_price: float = Query(None, description="Intervalo de preços no eixo Y (use o bucket_price devolvido por /heatmap/data)"),
+    bucket_time: str = Query("5min", description="Intervalo de tempo no eixo X (ex: 5min, 30min, 1h)"),
+    side: str = Query(None, description="Filtrar por lado: 'ask', 'bid' ou deixar vazio para ambos")
+):
+    """
+    Server-Sent Events: após cada captura envia um evento `column` com a coluna
+    do bucket de tempo mais recente. Clientes lentos recebem `dropped` e são
+    desconectados (devem recarregar /heatmap/data e reabrir o stream).
+    """
+    if bucket_seconds(bucket_time) is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"bucket_time inválido: {bucket_time}")
+
+    subscriber = live_heatmap.subscribe(symbol, side, bucket_price, bucket_time)
+
+    async def _events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), settings.live_keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+                yield f"event: column\ndata: {message}\n\n"
+        finally:
+            live_heatmap.unsubscribe(subscriber)
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/heatmap/tiles")
+async def get_heatmap_tiles(
+    symbol: str = Query(..., description="Símbolo da cripto (ex: BTCUSDT)"),
+    side: str = Query(None, description="Filtrar por lado: 'ask', 'bid' ou deixar vazio para ambos"),
+    start: datetime = Query(None, description="Início da viewport (ISO 8601); vazio = primeiro snapshot"),
+    end: datetime = Query(None, description="Fim da viewport (ISO 8601); vazio = último snapshot"),
+    price_min: float = Query(None, description="Menor preço da viewport; vazio = menor preço já visto"),
+    price_max: float = Query(None, description="Maior preço da viewport; vazio = maior preço já visto"),
+    width: int = Query(512, ge=16, le=4096, description="Máximo de colunas (buckets de tempo) desejadas"),
+    height: int = Query(256, ge=16, le=4096, description="Máximo de linhas (buckets de preço) desejadas"),
+    encoding: str = Query("b64", description="Matriz z: 'b64' (float32 em base64) ou 'json' (listas)")
+):
+    """
+    Retorna o heatmap da viewport a partir da pirâmide de tiles, no nível mais
+    fino em que ela cabe em `width` × `height` células (mesmo formato de
+    /heatmap/data, mais `level`, `levels` e os limites dos dados em `bounds`).
+    O custo e o tamanho da resposta dependem da viewport, não do período.
+    Enquanto a pirâmide é montada em segundo plano (primeira consulta), responde 503.
+    """
+    if encoding not in ("b64", "json"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Encoding inválido: use 'b64' ou 'json'")
+    if not heatmap_tiles.enabled():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Pirâmide de tiles indisponível (armazenamento csv ou TILE_LEVELS=0)")
+
+    key = render_cache.make_key("heatmap-tiles", symbol, side, None, None, (start, end),
+                                price_min, price_max, width, height, encoding)
+    try:
+        payload = await render_cache.get_or_compute(key, lambda: asyncio.to_thread(
+            heatmap_tiles.viewport_json, symbol, side, snapshot_store.to_epoch(start), snapshot_store.to_epoch(end),
+            price_min, price_max, width, height, encoding))
+    except heatmap_tiles.PyramidNotReady as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                            headers={"Retry-After": "5"})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return Response(payload, media_type="application/json")
+
+
+@router.get("/heatmap/stream/stats", status_code=status.HTTP_200_OK)
+def get_stream_stats():
+    """
+    Retorna os contadores do heatmap ao vivo (inscritos, mensagens, clientes descartados).
+    """
+    return live_heatmap.stats()
+
+
+@router.get("/histogram/data")
+async def get_histogram_data(
+    symbol: str = Query(..., description="Símbolo da cripto (ex: BTC)"),
+    top: int = Query(None, description="Número de maiores barras a exibir (ex: 10)"),
+    minutes: int = Query(60, description="Intervalo de tempo em minutos (0 = considera todos os dados)"),
+    bucket_size: float = Query(30.0, description="Tamanho fixo da faixa de preço"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601)"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601)")
+):
+    """
+    Retorna as barras dos histogramas de asks e bids (faixas, volumes e faixa do
+    preço de mercado), para desenho no cliente.
+    """
+    key = render_cache.make_key("histogram-data", symbol, None, bucket_size, None, (minutes, start, end), top)
+    payload = await _render(key, generate_histogram_json, symbol, top, minutes, bucket_size, start, end)
+    return Response(payload, media_type="application/json")
 
 
 @router.get("/heatmap")
@@ -49,16 +261,31 @@ async def render_heatmap(
     symbol: str = Query(..., description="Símbolo da cripto (ex: BTCUSDT)"),
     bucket_price: float = Query(None, description="Intervalo de preços no eixo Y (ex: 100.0)"),
     bucket_time: str = Query("5min", description="Intervalo de tempo no eixo X (ex: 5min, 30min, 1h)"),
-    side: str = Query(None, description="Filtrar por lado: 'ask', 'bid' ou deixar vazio para ambos")
+    side: str = Query(None, description="Filtrar por lado: 'ask', 'bid' ou deixar vazio para ambos"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601, ex: 2025-06-01T10:00:00)"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601); vazio = até o último snapshot"),
+    client: bool = Query(False, description="Desenha no navegador a partir de /heatmap/data em vez de renderizar no servidor"),
+    live: bool = Query(False, description="Desenha no navegador e acrescenta as novas colunas recebidas de /heatmap/stream"),
+    tiles: bool = Query(False, description="Desenha no navegador a partir da pirâmide de tiles, com zoom e pan")
 ):
     """
     Renderiza o heatmap para o símbolo especificado,
     com controle de buckets de preço, tempo e lado ('ask', 'bid' ou ambos).
+    Com `start`/`end`, só a janela pedida é lida do armazenamento. Com `tiles`,
+    cada zoom ou pan no navegador pede só a nova viewport a /heatmap/tiles.
     """
-    heatmap_data = generate_heatmap_data(symbol, bucket_price, bucket_time, side)
+    client = client or live or tiles
+    if client:
+        heatmap_data = ""
+    else:
+        key = render_cache.make_key("heatmap", symbol, side, bucket_price, bucket_time, (start, end))
+        heatmap_data = await _render(key, generate_heatmap_data, symbol, bucket_price, bucket_time, side, start, end)
     return templates.TemplateResponse("heatmap.html", {
         "request": request,
         "heatmap_data": heatmap_data,
+        "chart": "heatmap",
+        "data_url": (_tiles_url(request) if tiles else _data_url(request)) if client else None,
+        "stream_url": _stream_url(request) if live and not tiles else None,
         "symbol": symbol,
         "bucket_price": bucket_price,
         "bucket_time": bucket_time,
@@ -72,24 +299,156 @@ async def render_histogram(
     symbol: str = Query(..., description="Símbolo da cripto (ex: BTC)"),
     top: int = Query(None, description="Número de maiores barras a exibir (ex: 10)"),
     minutes: int = Query(60, description="Intervalo de tempo em minutos (0 = considera todos os dados)"),
-    bucket_size: float = Query(30.0, description="Tamanho fixo da faixa de preço (ex: 30.0 para buckets de 30 em 30)")
+    bucket_size: float = Query(30.0, description="Tamanho fixo da faixa de preço (ex: 30.0 para buckets de 30 em 30)"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601); tem precedência sobre 'minutes'"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601); vazio = até o último snapshot"),
+    client: bool = Query(False, description="Desenha no navegador a partir de /histogram/data em vez de renderizar no servidor")
 ):
     """
     Gera dois histogramas de liquidez (asks e bids) com base no intervalo de tempo fornecido.
     Destaque em amarelo o bucket do preço de mercado mais recente.
     """
-    histogram_html = generate_histograms(
+    key = render_cache.make_key("histogram", symbol, None, bucket_size, None, (minutes, start, end), top)
+    histogram_html = "" if client else await _render(
+        key,
+        generate_histograms,
         symbol=symbol,
         top=top,
         minutes=minutes,
-        bucket_size=bucket_size
+        bucket_size=bucket_size,
+        start=start,
+        end=end
     )
-    tempo_str = "todos os dados" if minutes == 0 else f"últimos {minutes} minutos"
+    if start or end:
+        tempo_str = f"{start or 'início'} até {end or 'agora'}"
+    else:
+        tempo_str = "todos os dados" if minutes == 0 else f"últimos {minutes} minutos"
 
     return templates.TemplateResponse("heatmap.html", {
         "request": request,
         "heatmap_data": histogram_html,
+        "chart": "histogram",
+        "data_url": _data_url(request) if client else None,
+        "stream_url": None,
         "symbol": symbol,
         "bucket_price": f"Buckets de {bucket_size:.0f}",
         "bucket_time": tempo_str
     })
+
+
+def _batch_response(request: Request, kind: str, title: str, params: str, format: str,
+                    results: list[dict], total_ms: float) -> Response:
+    if format == "json":
+        return Response(batch_render.batch_json(kind, results, total_ms), media_type="application/json")
+    return templates.TemplateResponse("batch.html", {
+        "request": request,
+        "title": title,
+        "params": params,
+        "results": results,
+        "total_ms": total_ms,
+    })
+
+
+def _batch_symbols(symbols: str, format: str) -> list[str]:
+    if format not in ("html", "json"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Formato inválido: use 'html' ou 'json'")
+    try:
+        return batch_render.parse_symbols(symbols)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/batch/heatmap")
+async def render_heatmap_batch(
+    request: Request,
+    symbols: str = Query(..., description="Símbolos separados por vírgula (ex: BTCUSDT,ETHUSDT,SOLUSDT)"),
+    bucket_price: float = Query(None, description="Intervalo de preços no eixo Y (ex: 100.0)"),
+    bucket_time: str = Query("5min", description="Intervalo de tempo no eixo X (ex: 5min, 30min, 1h)"),
+    side: str = Query(None, description="Filtrar por lado: 'ask', 'bid' ou deixar vazio para ambos"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601)"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601)"),
+    format: str = Query("html", description="'html' (página com todos os heatmaps) ou 'json' (payloads de /heatmap/data)"),
+    encoding: str = Query("b64", description="Com format=json, matriz z: 'b64' (float32 em base64) ou 'json' (listas)")
+):
+    """
+    Heatmaps de vários símbolos com os mesmos parâmetros, calculados em paralelo
+    e devolvidos numa resposta só, com o tempo de cálculo de cada símbolo.
+    """
+    symbol_list = _batch_symbols(symbols, format)
+    if encoding not in ("b64", "json"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Encoding inválido: use 'b64' ou 'json'")
+
+    if format == "json":
+        requests = [(symbol, render_cache.make_key("heatmap-data", symbol, side, bucket_price, bucket_time, (start, end), encoding),
+                     generate_heatmap_json, (symbol, bucket_price, bucket_time, side, start, end, encoding), {})
+                    for symbol in symbol_list]
+    else:
+        requests = [(symbol, render_cache.make_key("heatmap-fragment", symbol, side, bucket_price, bucket_time, (start, end)),
+                     generate_heatmap_data, (symbol, bucket_price, bucket_time, side, start, end), {"include_script": False})
+                    for symbol in symbol_list]
+    results, total_ms = await batch_render.render_batch(requests)
+    params = f"bucket de preço {bucket_price or 'automático'}, tempo {bucket_time}, lado {side or 'ask + bid'}"
+    return _batch_response(request, "heatmap", "Heatmaps de Liquidez", params, format, results, total_ms)
+
+
+@router.get("/batch/histogram")
+async def render_histogram_batch(
+    request: Request,
+    symbols: str = Query(..., description="Símbolos separados por vírgula (ex: BTC,ETH,SOL)"),
+    top: int = Query(None, description="Número de maiores barras a exibir (ex: 10)"),
+    minutes: int = Query(60, description="Intervalo de tempo em minutos (0 = considera todos os dados)"),
+    bucket_size: float = Query(30.0, description="Tamanho fixo da faixa de preço"),
+    start: datetime = Query(None, description="Início da janela (ISO 8601)"),
+    end: datetime = Query(None, description="Fim da janela (ISO 8601)"),
+    format: str = Query("html", description="'html' (página com todos os histogramas) ou 'json' (payloads de /histogram/data)")
+):
+    """
+    Histogramas de vários símbolos com os mesmos parâmetros, calculados em
+    paralelo e devolvidos numa resposta só, com o tempo de cálculo de cada símbolo.
+    """
+    symbol_list = _batch_symbols(symbols, format)
+
+    window_key = (minutes, start, end)
+    if format == "json":
+        requests = [(symbol, render_cache.make_key("histogram-data", symbol, None, bucket_size, None, window_key, top),
+                     generate_histogram_json, (symbol, top, minutes, bucket_size, start, end), {})
+                    for symbol in symbol_list]
+    else:
+        requests = [(symbol, render_cache.make_key("histogram-fragment", symbol, None, bucket_size, None, window_key, top),
+                     generate_histograms, (symbol, top, minutes, bucket_size, start, end), {"include_script": False})
+                    for symbol in symbol_list]
+    results, total_ms = await batch_render.render_batch(requests)
+    window = f"{start or 'início'} até {end or 'agora'}" if start or end else \
+        ("todos os dados" if minutes == 0 else f"últimos {minutes} minutos")
+    params = f"buckets de {bucket_size:g}, {window}"
+    return _batch_response(request, "histogram", "Histogramas de Liquidez", params, format, results, total_ms)
+
+
+@router.get("/export")
+def export_csv(
+    symbol: str = Query(..., description="Símbolo da cripto (ex: BTC)"),
+    side: str = Query(..., description="Lado do livro: 'bids' ou 'asks'")
+):
+    """
+    Exporta o histórico do símbolo no formato CSV original
+    (timestamp, datetime_local, price, volume, current_price), usado pelo rkd-htf-core.
+    """
+    if side not in snapshot_store.SIDES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lado inválido: use 'bids' ou 'asks'")
+    if not snapshot_store.list_segments(symbol, side):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dados não encontrados: {symbol} ({side})")
+
+    def _stream():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for i, row in enumerate(snapshot_store.iter_csv_rows(symbol, side)):
+            writer.writerow(row)
+            if i % 5000 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    filename = f"{snapshot_store.symbol_key(symbol)}_{side}.csv"
+    return StreamingResponse(_stream(), media_type="text/csv",
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
@@ -0,0 +1,318 @@
+"""
+Captura em processos separados da API (`CAPTURE_WORKERS` > 0).
+
+Os símbolos são divididos entre os workers (round-robin). Cada worker roda os
+mesmos laços de captura do modo em processo (`_run_schedule`/`_run_stream`)
+no seu próprio event loop, e avisa a API por um pipe próprio a cada snapshot
+gravado e periodicamente (heartbeat). A API só trata esses avisos: invalida
+o cache, publica a coluna ao vivo e atualiza os agregados do heatmap, que
+continuam vivendo no processo da API. Um pipe por worker (em vez de uma fila
+compartilhada) garante que um worker morto não trava os avisos dos demais.
+
+Workers que morrem são reiniciados pelo supervisor enquanto a captura estiver ativa.
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from multiprocessing.connection import wait
+
+from app.config.settings import settings
+from app.schedules.clock import collect_schedule_metrics
+from app.services import candles, heatmap_aggregates, heatmap_tiles, metrics
+from app.services.live_heatmap import live_heatmap
+from app.services.render_cache import render_cache
+
+HEARTBEAT_SECONDS = 2.0
+STOP_TIMEOUT_SECONDS = 10.0
+
+_context = multiprocessing.get_context("spawn")
+
+
+def shard_symbols(symbols: list[str], workers: int) -> list[list[str]]:
+    """
+    Divide os símbolos entre no máximo `workers` processos (nenhum fica vazio).
+    """
+    count = max(1, min(workers, len(symbols)))
+    return [symbols[i::count] for i in range(count)]
+
+
+# --- processo do worker -----------------------------------------------------
+
+def _worker_main(symbols: list[str], overrides: dict, events):
+    """
+    Ponto de entrada do processo. `overrides` replica a configuração da API
+    (inclusive alterações feitas em tempo de execução).
+    """
+    # Revalida para recuperar os tipos aninhados (ex.: camadas de retenção) a partir do dump
+    for name, value in type(settings)(**overrides):
+        setattr(settings, name, value)
+    # Os agregados e a pirâmide de tiles do heatmap e os candles são mantidos pelo processo da API
+    settings.aggregate_time_buckets = []
+    settings.candle_intervals = []
+    settings.tile_levels = 0
+    # As métricas são servidas pela API: as observações vão no heartbeat
+    metrics.registry.forwarding = True
+    try:
+        asyncio.run(_worker_loop(symbols, events))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(symbols: list[str], events):
+    """
+    Roda a captura dos símbolos até receber SIGTERM/SIGINT (parada pela API).
+    """
+    from app.schedules import order_book as schedule
+    from app.services.order_book import close_http_client
+    from app.services.snapshot_writer import snapshot_writer
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    captures = {symbol: 0 for symbol in symbols}
+    last_capture: dict[str, float] = {}
+
+    def on_capture(symbol: str, timestamp: int):
+        captures[symbol] += 1
+        last_capture[symbol] = time.time()
+        events.send(("capture", symbol, timestamp))
+
+    schedule.running = True
+    runner = schedule._run_stream if settings.capture_mode == "stream" else schedule._run_schedule
+    tasks = [asyncio.create_task(runner(symbol, on_capture)) for symbol in symbols]
+    try:
+        while not stopping.is_set():
+            events.send(("heartbeat", {
+                "pid": os.getpid(),
+                "captures": dict(captures),
+                "last_capture": dict(last_capture),
+                "streams": schedule.stream_status(),
+                "schedule": schedule.schedule_status(),
+                "writer": snapshot_writer.stats(),
+                "metrics": metrics.registry.drain(),
+            }))
+            try:
+                await asyncio.wait_for(stopping.wait(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        schedule.running = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_http_client()
+        await asyncio.to_thread(snapshot_writer.close)
+
+
+# --- processo da API ----------------------------------------------------------
+
+class _Worker:
+    def __init__(self, worker_id: int, symbols: list[str]):
+        self.id = worker_id
+        self.symbols = symbols
+        self.process = None
+        self.events = None
+        self.started_at: float | None = None
+        self.heartbeat_at: float | None = None
+        self.info: dict = {}
+        self.captures = 0
+        self.restarts = 0
+
+
+_workers: list[_Worker] = []
+_listener: threading.Thread | None = None
+_listening = threading.Event()
+# Fecha as pontas de leitura (thread de leitura e supervisor) sem fechar o mesmo fd duas vezes
+_close_lock = threading.Lock()
+_supervisor: asyncio.Task | None = None
+_refreshing: set[str] = set()
+
+
+def active() -> bool:
+    return bool(_workers)
+
+
+def _close_events(worker: _Worker):
+    with _close_lock:
+        if worker.events is not None:
+            worker.events.close()
+
+
+def _spawn(worker: _Worker):
+    # O pipe do processo anterior é descartado mesmo que a thread de leitura não tenha visto o EOF
+    _close_events(worker)
+    reader, writer = _context.Pipe(duplex=False)
+    worker.process = _context.Process(
+        target=_worker_main,
+        args=(worker.symbols, settings.model_dump(), writer),
+        name=f"capture-worker-{worker.id}",
+        daemon=True,
+    )
+    worker.process.start()
+    writer.close()
+    worker.events = reader
+    worker.started_at = time.time()
+    worker.heartbeat_at = None
+
+
+async def start(symbols: list[str]):
+    """
+    Sobe um processo por shard de símbolos e começa a ouvir os avisos deles.
+    """
+    global _listener, _supervisor
+    loop = asyncio.get_running_loop()
+    for worker_id, shard in enumerate(shard_symbols(symbols, settings.capture_workers)):
+        worker = _Worker(worker_id, shard)
+        _spawn(worker)
+        _workers.append(worker)
+        print(f"  ✔ Worker {worker_id} (pid {worker.process.pid}) capturando {', '.join(shard)}.")
+
+    _listening.set()
+    _listener = threading.Thread(target=_listen, args=(loop,), name="capture-events", daemon=True)
+    _listener.start()
+    _supervisor = asyncio.create_task(_supervise())
+
+
+async def stop():
+    """
+    Pede para os workers pararem (SIGTERM), espera cada um terminar e encerra
+    à força quem não terminar a tempo.
+    """
+    global _listener, _supervisor
+    if _supervisor is not None:
+        _supervisor.cancel()
+        _supervisor = None
+    for worker in _workers:
+        worker.process.terminate()
+    for worker in _workers:
+        await asyncio.to_thread(worker.process.join, STOP_TIMEOUT_SECONDS)
+        if worker.process.is_alive():
+            worker.process.kill()
+            await asyncio.to_thread(worker.process.join)
+        print(f"  ✖ Worker {worker.id} parado (exitcode {worker.process.exitcode}).")
+    _listening.clear()
+    await asyncio.to_thread(_listener.join)
+    for worker in _workers:
+        _close_events(worker)
+    _workers.clear()
+    _listener = None
+
+
+def _listen(loop: asyncio.AbstractEventLoop):
+    """
+    Thread que lê os pipes dos workers e repassa cada aviso ao event loop da API.
+    """
+    while _listening.is_set():
+        readers = {worker.events: worker for worker in list(_workers) if not worker.events.closed}
+        if not readers:
+            time.sleep(0.2)
+            continue
+        try:
+            ready = wait(list(readers), timeout=0.5)
+        except (OSError, ValueError):
+            # O supervisor fechou um pipe durante a espera (worker reiniciado)
+            continue
+        for reader in ready:
+            try:
+                event = reader.recv()
+            except (EOFError, OSError):
+                # Worker saiu: o supervisor cria um pipe novo ao reiniciá-lo
+                with _close_lock:
+                    reader.close()
+                continue
+            loop.call_soon_threadsafe(_handle, readers[reader], event)
+
+
+def _handle(worker: _Worker, event: tuple):
+    if worker not in _workers:
+        return
+    kind = event[0]
+    if kind == "capture":
+        _, symbol, timestamp = event
+        worker.captures += 1
+        render_cache.invalidate(symbol)
+        live_heatmap.notify(symbol, timestamp)
+        refresh_aggregates(symbol)
+    elif kind == "heartbeat":
+        worker.heartbeat_at = time.time()
+        metrics.registry.apply(event[1].pop("metrics", []))
+        worker.info = event[1]
+
+
+def refresh_aggregates(symbol: str):
+    """
+    Incorpora o snapshot novo aos agregados e candles da API fora do event loop
+    (capturas feitas por outro processo). Se já houver uma atualização em
+    andamento, ela mesma alcança o snapshot novo ou a próxima consulta o faz.
+    """
+    if symbol in _refreshing:
+        return
+    _refreshing.add(symbol)
+    task = asyncio.create_task(asyncio.to_thread(_refresh_in_memory, symbol))
+    task.add_done_callback(lambda _: _refreshing.discard(symbol))
+
+
+def _refresh_in_memory(symbol: str):
+    heatmap_aggregates.refresh(symbol)
+    candles.refresh(symbol)
+    heatmap_tiles.notify(symbol)
+
+
+async def _supervise():
+    """
+    Reinicia workers que morreram enquanto a captura está ativa.
+    """
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        for worker in _workers:
+            if not worker.process.is_alive():
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [workers] Worker {worker.id} saiu "
+                      f"(exitcode {worker.process.exitcode}); reiniciando.")
+                worker.restarts += 1
+                worker.process.close()
+                _spawn(worker)
+
+
+def status() -> list[dict]:
+    """
+    Saúde de cada worker: vivo, idade do último heartbeat, capturas e reinícios.
+    """
+    now = time.time()
+    result = []
+    for worker in _workers:
+        alive = worker.process.is_alive()
+        heartbeat_age = None if worker.heartbeat_at is None else round(now - worker.heartbeat_at, 1)
+        if not alive:
+            health = "parado"
+        elif heartbeat_age is None or heartbeat_age > 3 * HEARTBEAT_SECONDS:
+            health = "sem heartbeat"
+        else:
+            health = "ok"
+        result.append({
+            "worker": worker.id,
+            "pid": worker.process.pid,
+            "simbolos": worker.symbols,
+            "saude": health,
+            "heartbeat_ha_segundos": heartbeat_age,
+            "capturas": worker.captures,
+            "capturas_por_simbolo": worker.info.get("captures", {}),
+            "reinicios": worker.restarts,
+            "streams": worker.info.get("streams", {}),
+            "agendamento": worker.info.get("schedule", {}),
+            "gravacao": worker.info.get("writer", {}),
+        })
+    return result
+
+
+def _collect_metrics():
+    for worker in list(_workers):
+        yield from collect_schedule_metrics(worker.info.get("schedule", {}).get("simbolos", {}))
+
+
+metrics.registry.register_collector(_collect_metrics)
@@ -0,0 +1,130 @@
+"""
+Relógio dos agendadores: disparos alinhados a múltiplos exatos do intervalo
+(ex.: 60s → hh:mm:00), sem deriva acumulada, com contagem de disparos
+atrasados/pulados, e backoff compartilhado quando a exchange limita a taxa.
+"""
+import asyncio
+import math
+import random
+import time
+
+# Um disparo conta como atrasado se começar mais que esta fração do intervalo depois do previsto
+LATE_FRACTION = 0.1
+
+
+class TickStats:
+    """
+    Contadores de um agendador (um por símbolo).
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.ticks = 0
+        self.captures = 0
+        self.late = 0
+        self.skipped = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.last_lag_ms: float | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "intervalo_segundos": self.interval,
+            "disparos": self.ticks,
+            "capturas": self.captures,
+            "atrasados": self.late,
+            "pulados": self.skipped,
+            "limitados_pela_exchange": self.rate_limited,
+            "erros": self.errors,
+            "ultimo_atraso_ms": self.last_lag_ms,
+        }
+
+
+# Contadores de TickStats.as_dict expostos em /metrics
+SCHEDULE_METRICS = {"disparos": "ticks", "capturas": "captures", "atrasados": "late", "pulados": "skipped",
+                    "limitados_pela_exchange": "rate_limited", "erros": "errors"}
+
+
+def collect_schedule_metrics(symbols: dict):
+    """
+    Converte os contadores de `schedule_status()["simbolos"]` (do próprio
+    processo ou do heartbeat de um worker) em amostras do `/metrics`.
+    """
+    for symbol, counters in symbols.items():
+        for key, kind in SCHEDULE_METRICS.items():
+            yield ("scheduler_ticks_total", "counter", "Disparos do agendador por símbolo e desfecho",
+                   {"symbol": symbol, "kind": kind}, counters[key])
+
+
+async def aligned_ticks(interval: float, stats: TickStats, jitter: float = 0.0, is_running=lambda: True):
+    """
+    Gera o instante (epoch) de cada disparo, sempre em múltiplos de `interval`.
+    Dorme até o próximo limite mais um atraso aleatório de até `jitter`
+    segundos (espalha as requisições de vários símbolos). Se o consumidor
+    demorar mais que um intervalo, os limites que já passaram são pulados e
+    contados, em vez de disparar em rajada para recuperar o atraso.
+    `interval <= 0` significa laço contínuo, sem alinhamento.
+    """
+    if interval <= 0:
+        while is_running():
+            await asyncio.sleep(0)
+            stats.ticks += 1
+            yield time.time()
+        return
+
+    next_tick = math.floor(time.time() / interval + 1) * interval
+    while is_running():
+        offset = random.uniform(0, jitter) if jitter > 0 else 0.0
+        delay = next_tick + offset - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not is_running():
+            return
+
+        now = time.time()
+        behind = int((now - next_tick) // interval)
+        if behind > 0:
+            stats.skipped += behind
+            next_tick += behind * interval
+        lag = now - next_tick - offset
+        stats.last_lag_ms = round(max(lag, 0.0) * 1000, 1)
+        if lag > interval * LATE_FRACTION:
+            stats.late += 1
+        stats.ticks += 1
+        yield next_tick
+        next_tick += interval
+
+
+class RateLimitBackoff:
+    """
+    Pausa compartilhada por todos os símbolos do processo quando a exchange
+    responde 429 (limite de requisições) ou 418 (IP banido temporariamente).
+    Respeita o `Retry-After` quando vier; senão dobra a espera a cada
+    resposta limitada seguida, até `max_seconds`.
+    """
+
+    STATUS_CODES = (418, 429)
+
+    def __init__(self, base_seconds: float, max_seconds: float):
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.until = 0.0
+        self.streak = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.until - time.time())
+
+    def register(self, retry_after: str | None = None) -> float:
+        """
+        Registra uma resposta limitada e retorna quantos segundos esperar.
+        """
+        self.streak += 1
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(self.max_seconds, self.base_seconds * 2 ** (self.streak - 1))
+        self.until = max(self.until, time.time() + delay)
+        return delay
+
+    def reset(self):
+        self.streak = 0
@@ -1,24 +1,109 @@
 import asyncio
 from datetime import datetime
-from app.services.order_book import capture_order_book, reset_order_book_files
+
+import httpx
+
+from app.schedules import capture_workers, retention
+from app.schedules.clock import RateLimitBackoff, TickStats, aligned_ticks, collect_schedule_metrics
+from app.services.depth_stream import DepthStream, capture_from_stream
+from app.services import heatmap_tiles, metrics
+from app.services.order_book import capture_order_book, close_http_client, reset_order_book_files
+from app.services.snapshot_writer import snapshot_writer
+from app.services.live_heatmap import live_heatmap
+from app.services.render_cache import render_cache
 from app.config.settings import settings
 
 # Mapeia símbolo → task assíncrona
 tasks: dict[str, asyncio.Task] = {}
+# Mapeia símbolo → livro local (apenas no modo de captura "stream")
+streams: dict[str, DepthStream] = {}
+# Mapeia símbolo → contadores de disparos do agendador
+tick_stats: dict[str, TickStats] = {}
 running = False
 
-async def _run_schedule(symbol: str):
+# Limite de capturas simultâneas (criado no event loop em uso) e pausa por limite de taxa
+_inflight: asyncio.Semaphore | None = None
+backoff = RateLimitBackoff(settings.capture_backoff_base_seconds, settings.capture_backoff_max_seconds)
+
+def capture_interval_for(symbol: str) -> int:
+    """
+    Intervalo de captura do símbolo (`capture_intervals` por símbolo, senão o padrão).
     """
-    Executa captura contínua de order book para um símbolo específico.
+    return settings.capture_intervals.get(symbol.upper(), settings.capture_interval_seconds)
+
+def _inflight_limit() -> asyncio.Semaphore:
+    global _inflight
+    if _inflight is None:
+        _inflight = asyncio.Semaphore(settings.max_inflight_captures)
+    return _inflight
+
+def _is_running() -> bool:
+    return running
+
+def _after_capture(symbol: str, timestamp: int):
     """
-    while running:
+    Ações após cada snapshot gravado no próprio processo da API (`timestamp` é o do snapshot).
+    """
+    render_cache.invalidate(symbol)
+    live_heatmap.notify(symbol, timestamp)
+
+def _observe_lag(symbol: str, stats: TickStats):
+    if stats.last_lag_ms is not None:
+        metrics.registry.observe("scheduler_lag_seconds", stats.last_lag_ms / 1000, symbol=symbol)
+
+async def _run_schedule(symbol: str, on_capture=_after_capture):
+    """
+    Executa captura contínua de order book para um símbolo específico, em
+    disparos alinhados ao relógio (o snapshot é gravado com o instante do
+    disparo, então símbolos com o mesmo intervalo caem nos mesmos buckets).
+    """
+    stats = tick_stats[symbol] = TickStats(capture_interval_for(symbol))
+    async for tick in aligned_ticks(stats.interval, stats, settings.capture_jitter_seconds, _is_running):
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _observe_lag(symbol, stats)
+        if backoff.remaining() > 0:
+            stats.skipped += 1
+            continue
         print(f"[{timestamp}] [schedule] Capturando order book de {symbol}...")
         try:
-            capture_order_book(symbol)
+            async with _inflight_limit():
+                stored = await capture_order_book(symbol, int(tick) if stats.interval > 0 else None)
+            backoff.reset()
+            stats.captures += 1
+            on_capture(symbol, stored)
+        except httpx.HTTPStatusError as e:
+            stats.errors += 1
+            if e.response.status_code in RateLimitBackoff.STATUS_CODES:
+                stats.rate_limited += 1
+                delay = backoff.register(e.response.headers.get("Retry-After"))
+                print(f"[{timestamp}] [schedule] Exchange limitou as requisições ({e.response.status_code}); "
+                      f"pausando capturas por {delay:.0f}s")
+            else:
+                print(f"[{timestamp}] [schedule] Erro ao capturar {symbol}: {e}")
         except Exception as e:
+            stats.errors += 1
             print(f"[{timestamp}] [schedule] Erro ao capturar {symbol}: {e}")
-        await asyncio.sleep(settings.capture_interval_seconds)
+
+async def _run_stream(symbol: str, on_capture=_after_capture):
+    """
+    Mantém o livro local do símbolo via WebSocket e grava um snapshot dele
+    a cada `stream_snapshot_interval_seconds`, com o instante do disparo.
+    """
+    stream = streams[symbol] = DepthStream(symbol)
+    stats = tick_stats[symbol] = TickStats(settings.stream_snapshot_interval_seconds)
+    feeder = asyncio.create_task(stream.run())
+    try:
+        async for tick in aligned_ticks(stats.interval, stats, is_running=_is_running):
+            _observe_lag(symbol, stats)
+            try:
+                if await capture_from_stream(stream, int(tick)):
+                    stats.captures += 1
+                    on_capture(symbol, int(tick))
+            except Exception as e:
+                stats.errors += 1
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [schedule] Erro ao gravar snapshot de {symbol}: {e}")
+    finally:
+        feeder.cancel()
 
 async def start_schedule() -> bool:
     """
@@ -31,30 +116,85 @@ async def start_schedule() -> bool:
 
     running = True
     print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [schedule] Iniciando agendadores...")
+    if settings.capture_workers > 0:
+        # Captura fora do processo da API, com os símbolos divididos entre os workers
+        if settings.reset_history_on_start:
+            for symbol in settings.symbols:
+                reset_order_book_files(symbol)
+        await capture_workers.start(settings.symbols)
+        retention.start()
+        return True
+
     for symbol in settings.symbols:
         try:
-            reset_order_book_files(symbol)
-            task = asyncio.create_task(_run_schedule(symbol))
+            if settings.reset_history_on_start:
+                reset_order_book_files(symbol)
+            runner = _run_stream if settings.capture_mode == "stream" else _run_schedule
+            task = asyncio.create_task(runner(symbol))
             tasks[symbol] = task
             print(f"  ✔ Agendador para {symbol} iniciado.")
         except Exception as e:
             print(f"  ✖ Erro ao iniciar agendador para {symbol}: {e}")
+    retention.start()
     return True
 
 async def stop_schedule():
     """
     Interrompe todos os agendadores em execução.
     """
-    global running, tasks
+    global running, tasks, _inflight
     running = False
     print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [schedule] Parando todos os agendadores...")
+    await retention.stop()
+    if capture_workers.active():
+        await capture_workers.stop()
     for symbol, task in tasks.items():
         task.cancel()
         print(f"  ✖ Agendador para {symbol} cancelado.")
     tasks.clear()
+    streams.clear()
+    tick_stats.clear()
+    _inflight = None
+    await close_http_client()
+    # Grava o que ainda estiver no buffer do writer
+    await asyncio.to_thread(snapshot_writer.close)
+    await asyncio.to_thread(heatmap_tiles.flush)
 
 def is_running() -> bool:
     """
     Retorna True se os agendadores estão em execução.
     """
     return running
+
+
+def stream_status() -> dict:
+    """
+    Retorna, por símbolo, o estado do livro local no modo "stream".
+    """
+    return {
+        symbol: {
+            "sincronizado": stream.ready,
+            "eventos": stream.events,
+            "ressincronizacoes": stream.resyncs,
+            "reconexoes": stream.reconnects,
+            "ultimo_update_id": stream.book.last_update_id if stream.book else None,
+        }
+        for symbol, stream in streams.items()
+    }
+
+
+def schedule_status() -> dict:
+    """
+    Retorna os contadores de disparos por símbolo e a pausa por limite de taxa.
+    """
+    return {
+        "simbolos": {symbol: stats.as_dict() for symbol, stats in tick_stats.items()},
+        "pausa_limite_exchange_segundos": round(backoff.remaining(), 1),
+    }
+
+
+def _collect_metrics():
+    yield from collect_schedule_metrics({symbol: stats.as_dict() for symbol, stats in tick_stats.items()})
+
+
+metrics.registry.register_collector(_collect_metrics)
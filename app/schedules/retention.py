@@ -0,0 +1,60 @@
+"""
+Job de retenção: a cada `compaction_interval_seconds`, consolida e expira o
+histórico de todos os símbolos configurados, fora do event loop.
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from app.config.settings import settings
+from app.services import retention
+from app.services.render_cache import render_cache
+
+task: asyncio.Task | None = None
+last_run: dict = {}
+
+
+async def run_once() -> dict:
+    """
+    Roda a consolidação de todos os símbolos agora e retorna o resumo por símbolo.
+    """
+    started = time.perf_counter()
+    summary = {}
+    for symbol in settings.symbols:
+        try:
+            summary[symbol] = await asyncio.to_thread(retention.compact, symbol)
+            render_cache.invalidate(symbol)
+        except Exception as e:
+            summary[symbol] = {"erro": str(e)}
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [retention] Erro ao consolidar {symbol}: {e}")
+    last_run.clear()
+    last_run.update({
+        "executado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "duracao_segundos": round(time.perf_counter() - started, 2),
+        "simbolos": summary,
+    })
+    return summary
+
+
+async def _run():
+    while True:
+        await run_once()
+        await asyncio.sleep(settings.compaction_interval_seconds)
+
+
+def start():
+    global task
+    if task is None and (settings.retention_tiers or settings.raw_retention_hours > 0):
+        task = asyncio.create_task(_run())
+
+
+async def stop():
+    global task
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        task = None
+
+
+def status() -> dict:
+    return {"ativo": task is not None, "ultima_execucao": dict(last_run) or None}
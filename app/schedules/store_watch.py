@@ -0,0 +1,72 @@
+"""
+Acompanha pelo disco os snapshots gravados por outro processo.
+
+Com a captura rodando fora da API (`python -m app.capture`), a API não recebe
+o aviso de cada snapshot gravado: o cache de renderização não seria
+invalidado e o heatmap ao vivo não seria publicado. Enquanto a captura não
+está ativa neste processo, este job confere a cada `store_watch_seconds` o
+primeiro e o último snapshot gravado de cada símbolo e, quando mudam, faz o
+que o aviso da captura faria: invalida o cache e, se há snapshot novo, publica
+a coluna ao vivo e atualiza agregados, candles e tiles. A expiração pela
+retenção (que só muda o primeiro) apenas invalida o cache.
+"""
+import asyncio
+from datetime import datetime
+
+from app.config.settings import settings
+from app.schedules import capture_workers, order_book as order_book_schedule
+from app.services import snapshot_store
+from app.services.live_heatmap import live_heatmap
+from app.services.render_cache import render_cache
+
+task: asyncio.Task | None = None
+# Símbolo → (primeiro, último) timestamp gravado em cada lado, na última conferência
+_seen: dict[str, tuple] = {}
+
+
+def _bounds(symbol: str) -> tuple:
+    return tuple((snapshot_store.first_timestamp(symbol, side), snapshot_store.last_timestamp(symbol, side))
+                 for side in snapshot_store.SIDES)
+
+
+async def check_once():
+    """
+    Confere o histórico de todos os símbolos configurados uma vez.
+    """
+    if order_book_schedule.is_running():
+        # A captura deste processo já avisa a cada snapshot; recomeça do zero quando ela parar
+        _seen.clear()
+        return
+    for symbol in settings.symbols:
+        bounds = await asyncio.to_thread(_bounds, symbol)
+        previous, _seen[symbol] = _seen.get(symbol), bounds
+        if previous is None or bounds == previous:
+            continue
+        render_cache.invalidate(symbol)
+        lasts = [last for _, last in bounds]
+        if None not in lasts and lasts != [last for _, last in previous]:
+            live_heatmap.notify(symbol, min(lasts))
+            capture_workers.refresh_aggregates(symbol)
+
+
+async def _run():
+    while True:
+        try:
+            await check_once()
+        except Exception as e:
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [store-watch] Erro ao conferir o histórico: {e}")
+        await asyncio.sleep(settings.store_watch_seconds)
+
+
+def start():
+    global task
+    if task is None and settings.store_watch_seconds > 0 and settings.storage_format != "csv":
+        task = asyncio.create_task(_run())
+
+
+async def stop():
+    global task
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        task = None
@@ -7,7 +7,9 @@ class CandleRequest(BaseModel):
 class CandleResponse(BaseModel):
     symbol: str
     interval: str
+    open_time: int
     open: float
     close: float
     high: float
     low: float
+    samples: int
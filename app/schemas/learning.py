@@ -1,9 +1,44 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class TrainingInput(BaseModel):
+    epochs: int = Field(gt=0)
+    learning_rate: float = Field(gt=0)
+    symbol: str | None = None
+    horizon_seconds: int | None = None
+    batch_size: int = Field(default=512, gt=0)
+    resume: bool = True
+
+class DatasetBuildResult(BaseModel):
+    symbol: str
+    rows_added: int
+    total_rows: int
+    shards: int
+    watermark: int | None
+    seconds: float
+    snapshots_per_second: float
+
+class DatasetInfo(BaseModel):
+    symbol: str
+    spec: dict
+    features: list[str]
+    labels: list[str]
+    rows: int
+    watermark: int | None
+    shards: list[dict]
+
+class TrainingJobStatus(BaseModel):
+    id: str
+    symbol: str
+    status: str
+    epoch: int
     epochs: int
+    progress: float
     learning_rate: float
-
-class TrainingResult(BaseModel):
-    accuracy: float
+    batch_size: int
+    horizon_seconds: int
+    history: list[dict]
+    accuracy: float | None
     message: str
+    created_at: str
+    started_at: str | None
+    finished_at: str | None
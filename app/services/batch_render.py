@@ -0,0 +1,87 @@
+"""
+Cálculo em lote de heatmaps/histogramas de vários símbolos.
+
+Cada símbolo é calculado em paralelo no pool de renderização (`render_pool`),
+passando pelo cache de renderização com as mesmas chaves dos endpoints de um
+símbolo só, então um painel com 20 símbolos reaproveita o que já foi calculado
+e vice-versa. Um lote ocupa no máximo as vagas livres da fila do pool quando
+começa (`render_queue_limit`): os demais símbolos esperam a vez em vez de
+serem recusados. O resultado de cada símbolo traz o tempo de cálculo, para os
+lentos aparecerem; só voltam com erro os recusados porque outras requisições
+encheram a fila ou que passaram do tempo limite.
+"""
+import asyncio
+import json
+import time
+from typing import Callable
+
+from app.config.settings import settings
+from app.services.render_cache import render_cache
+from app.services.render_pool import RenderOverloaded, render_pool
+from app.services.snapshot_store import symbol_key
+
+
+def parse_symbols(symbols: str) -> list[str]:
+    """
+    Lista de símbolos separados por vírgula, sem repetições (BTC e BTCUSDT são
+    o mesmo símbolo) e na ordem pedida.
+    """
+    unique = {}
+    for symbol in (symbol.strip() for symbol in symbols.split(",")):
+        if symbol:
+            unique.setdefault(symbol_key(symbol), symbol)
+    parsed = list(unique.values())
+    if not parsed:
+        raise ValueError("Informe ao menos um símbolo")
+    if len(parsed) > settings.batch_max_symbols:
+        raise ValueError(f"Máximo de {settings.batch_max_symbols} símbolos por requisição")
+    return parsed
+
+
+async def _render_one(slots: asyncio.Semaphore, symbol: str, key: tuple, func: Callable, args: tuple,
+                      kwargs: dict) -> dict:
+    timing = {"tempo_ms": 0.0, "cache": True}
+
+    async def _compute():
+        async with slots:
+            started = time.perf_counter()
+            try:
+                return await render_pool.run(func, *args, **kwargs)
+            finally:
+                timing.update(tempo_ms=round((time.perf_counter() - started) * 1000, 1), cache=False)
+
+    try:
+        value, error = await render_cache.get_or_compute(key, _compute), None
+    except (FileNotFoundError, RenderOverloaded) as e:
+        value, error = None, str(e)
+    except Exception as e:
+        value, error = None, f"Erro: {e}"
+    return {"symbol": symbol, **timing, "erro": error, "value": value}
+
+
+async def render_batch(requests: list[tuple[str, tuple, Callable, tuple, dict]]) -> tuple[list[dict], float]:
+    """
+    Calcula em paralelo cada (símbolo, chave do cache, função, args, kwargs) e
+    retorna os resultados na ordem pedida (`value` é o valor da função, ou None
+    com `erro`) e o tempo total em ms. Um símbolo com erro não derruba os outros.
+    """
+    started = time.perf_counter()
+    # Só os cálculos (cache vazio) ocupam vaga; acertos no cache não esperam
+    slots = asyncio.Semaphore(max(settings.render_queue_limit - render_pool.pending, 1))
+    results = await asyncio.gather(*(_render_one(slots, *request) for request in requests))
+    return list(results), round((time.perf_counter() - started) * 1000, 1)
+
+
+def batch_json(kind: str, results: list[dict], total_ms: float) -> str:
+    """
+    Resposta JSON do lote. Os payloads já vêm serializados do cache e entram
+    como estão, sem decodificar e codificar de novo.
+    """
+    entries = []
+    for result in results:
+        meta = {key: value for key, value in result.items() if key != "value"}
+        body = json.dumps(meta, separators=(",", ":"))
+        data = result["value"] if result["value"] is not None else "null"
+        entries.append(f'{body[:-1]},"data":{data}}}')
+    header = json.dumps({"kind": kind, "tempo_total_ms": total_ms}, separators=(",", ":"))
+    return f'{header[:-1]},"symbols":[{",".join(entries)}]}}'
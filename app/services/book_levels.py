@@ -0,0 +1,210 @@
+"""
+Representação em memória de um order book: cada lado guarda arrays NumPy de
+preço e quantidade ordenados por preço (crescente), sem strings nem DataFrames.
+
+A busca de um nível é O(log n) (`searchsorted`); atualizar um nível existente
+é feito no próprio array, e inserções/remoções deslocam um bloco contíguo de
+memória. Lotes de alterações (um evento de diff, por exemplo) são aplicados de
+forma vetorizada. O mesmo tipo é usado pela captura REST, pelo livro local do
+stream e pela gravação no armazenamento.
+"""
+import numpy as np
+
+
+def bucket_codes(prices: np.ndarray, bucket_size: float) -> np.ndarray:
+    """
+    Código inteiro do bucket de cada preço (`preço // bucket_size`); o preço do
+    bucket é `código * bucket_size`. Regra única de bucketing do projeto.
+    """
+    return np.floor_divide(prices, bucket_size).astype(np.int64)
+
+
+def rebucket(prices: np.ndarray, volumes: np.ndarray, bucket_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Soma `volumes` por bucket de preço. Retorna (preços dos buckets em ordem
+    crescente, somas). Aceita preços em qualquer ordem.
+    """
+    if len(prices) == 0:
+        return np.empty(0), np.empty(0)
+    codes, inverse = np.unique(bucket_codes(prices, bucket_size), return_inverse=True)
+    return codes * bucket_size, np.bincount(inverse, weights=volumes)
+
+
+def group_cells(times: np.ndarray, step: int, codes: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Soma `values` por par (tempo, código), retornando os pares ordenados por tempo e código.
+    `times` devem ser múltiplos de `step`.
+    """
+    code_min = codes.min()
+    span = int(codes.max() - code_min) + 1
+    time_min = times.min()
+    keys = (times - time_min) // step * span + (codes - code_min)
+    n_bins = int(keys.max()) + 1
+    if n_bins <= max(4 * len(keys), 1 << 20):
+        # Espaço de chaves compacto: contagem densa evita a ordenação do np.unique
+        occupied = np.flatnonzero(np.bincount(keys, minlength=n_bins))
+        unique_keys = occupied
+        sums = np.bincount(keys, weights=values, minlength=n_bins)[occupied]
+    else:
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=values)
+    return unique_keys // span * step + time_min, unique_keys % span + code_min, sums
+
+
+class BookSide:
+    """
+    Um lado do livro. `prices` é sempre crescente; `descending=True` (bids)
+    indica que o melhor nível é o maior preço.
+    """
+
+    def __init__(self, descending: bool, prices: np.ndarray = None, quantities: np.ndarray = None):
+        self.descending = descending
+        self.prices = np.empty(0) if prices is None else prices
+        self.quantities = np.empty(0) if quantities is None else quantities
+
+    @classmethod
+    def from_levels(cls, levels, descending: bool) -> "BookSide":
+        """
+        Monta o lado a partir de pares (preço, quantidade) em qualquer ordem,
+        inclusive as strings do endpoint de depth. Quantidade zero é descartada.
+        """
+        side = cls(descending)
+        side.apply(levels)
+        return side
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def copy(self, depth: int = None) -> "BookSide":
+        """
+        Cópia independente com no máximo os `depth` melhores níveis.
+        """
+        if depth is None or depth >= len(self.prices):
+            sl = slice(None)
+        else:
+            sl = slice(len(self.prices) - depth, None) if self.descending else slice(0, depth)
+        return BookSide(self.descending, self.prices[sl].copy(), self.quantities[sl].copy())
+
+    def upsert(self, price: float, quantity: float):
+        """
+        Define a quantidade de um nível (zero remove o nível).
+        """
+        pos = int(np.searchsorted(self.prices, price))
+        found = pos < len(self.prices) and self.prices[pos] == price
+        if found and quantity == 0.0:
+            self.prices = np.delete(self.prices, pos)
+            self.quantities = np.delete(self.quantities, pos)
+        elif found:
+            self.quantities[pos] = quantity
+        elif quantity != 0.0:
+            self.prices = np.insert(self.prices, pos, price)
+            self.quantities = np.insert(self.quantities, pos, quantity)
+
+    def apply(self, levels):
+        """
+        Aplica um lote de pares (preço, quantidade) de uma vez. Se um preço
+        aparecer mais de uma vez no lote, vale a última ocorrência.
+        """
+        levels = np.asarray(levels, dtype=np.float64).reshape(-1, 2)
+        if len(levels) == 0:
+            return
+        # Deduplica mantendo a última ocorrência de cada preço (resultado já ordenado)
+        _, last = np.unique(levels[::-1, 0], return_index=True)
+        levels = levels[len(levels) - 1 - last]
+        prices, quantities = levels[:, 0], levels[:, 1]
+
+        pos = np.searchsorted(self.prices, prices)
+        found = pos < len(self.prices)
+        found[found] = self.prices[pos[found]] == prices[found]
+
+        self.quantities[pos[found]] = quantities[found]
+        removed = found.any() and (quantities[found] == 0.0).any()
+
+        new = ~found & (quantities != 0.0)
+        if new.any():
+            self.prices = np.insert(self.prices, pos[new], prices[new])
+            self.quantities = np.insert(self.quantities, pos[new], quantities[new])
+        if removed:
+            keep = self.quantities != 0.0
+            self.prices = self.prices[keep]
+            self.quantities = self.quantities[keep]
+
+    def best(self) -> float | None:
+        if len(self.prices) == 0:
+            return None
+        return float(self.prices[-1] if self.descending else self.prices[0])
+
+    def levels(self, depth: int = None) -> np.ndarray:
+        """
+        Os `depth` melhores níveis como array N×2 (preço, quantidade), do melhor
+        para o pior — a mesma ordem do endpoint de depth.
+        """
+        side = self.copy(depth) if depth is not None else self
+        levels = np.column_stack([side.prices, side.quantities])
+        return levels[::-1] if self.descending else levels
+
+    def cumulative(self, depth: int = None) -> np.ndarray:
+        """
+        Profundidade acumulada a partir do melhor nível: array N×2 (preço, quantidade acumulada).
+        """
+        levels = self.levels(depth).copy()
+        np.cumsum(levels[:, 1], out=levels[:, 1])
+        return levels
+
+    def rebucket(self, bucket_size: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Soma as quantidades por bucket de preço. Como os preços já estão
+        ordenados, os buckets saem de `reduceat` sem ordenação.
+        """
+        if len(self.prices) == 0:
+            return np.empty(0), np.empty(0)
+        codes = bucket_codes(self.prices, bucket_size)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+        return codes[starts] * bucket_size, np.add.reduceat(self.quantities, starts)
+
+
+class OrderBook:
+    """
+    Livro de um símbolo: bids, asks e o `lastUpdateId` da exchange.
+    """
+
+    def __init__(self, bids: BookSide = None, asks: BookSide = None, last_update_id: int = None):
+        self.bids = bids if bids is not None else BookSide(descending=True)
+        self.asks = asks if asks is not None else BookSide(descending=False)
+        self.last_update_id = last_update_id
+
+    @classmethod
+    def from_depth(cls, payload: dict) -> "OrderBook":
+        """
+        Converte a resposta do endpoint de depth (`bids`/`asks` como pares de strings).
+        """
+        last_update_id = payload.get("lastUpdateId")
+        return cls(
+            BookSide.from_levels(payload["bids"], descending=True),
+            BookSide.from_levels(payload["asks"], descending=False),
+            int(last_update_id) if last_update_id is not None else None,
+        )
+
+    def side(self, name: str) -> BookSide:
+        return self.bids if name == "bids" else self.asks
+
+    def apply(self, bids, asks, update_id: int = None):
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        if update_id is not None:
+            self.last_update_id = update_id
+
+    def copy(self, depth: int = None) -> "OrderBook":
+        return OrderBook(self.bids.copy(depth), self.asks.copy(depth), self.last_update_id)
+
+    def mid_price(self) -> float | None:
+        best_bid, best_ask = self.bids.best(), self.asks.best()
+        if best_bid is None or best_ask is None:
+            return None
+        return (best_bid + best_ask) / 2
+
+    def spread(self) -> float | None:
+        best_bid, best_ask = self.bids.best(), self.asks.best()
+        if best_bid is None or best_ask is None:
+            return None
+        return best_ask - best_bid
@@ -0,0 +1,263 @@
+"""
+Candles (OHLC) a partir do `current_price` gravado em cada snapshot.
+
+Nos intervalos padrão (`settings.candle_intervals`) os candles de cada símbolo
+ficam em memória e são atualizados a cada snapshot gravado (`refresh`), lendo
+do armazenamento só os cabeçalhos novos; pedir os últimos candles vira um
+recorte das listas, sem ler arquivo. Intervalos fora do padrão, ou janelas
+mais antigas que o que está em memória, são calculados de uma vez a partir dos
+cabeçalhos da janela (incluindo as camadas de retenção, cujo preço é a média
+do bucket).
+
+Os candles são alinhados ao epoch (UTC), como os da exchange. O livro de
+ofertas não traz volume negociado: no lugar do volume cada candle informa
+quantos snapshots (`samples`) o compõem.
+
+Em memória ficam só as últimas `aggregate_horizon_hours` (o mesmo horizonte
+dos agregados do heatmap) e o que a retenção ainda guarda em dados brutos;
+janelas mais antigas saem do armazenamento.
+"""
+import bisect
+import math
+import threading
+import time
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import snapshot_store
+from app.services.heatmap_grid import bucket_seconds
+
+# O current_price é o mesmo nos dois lados; os candles saem dos cabeçalhos dos bids
+PRICE_SIDE = "bids"
+# Intervalo mínimo entre as conferências do que saiu da memória
+_PRUNE_CHECK_SECONDS = 60.0
+
+
+def ohlc(timestamps: np.ndarray, prices: np.ndarray, seconds: int, with_bounds: bool = False) -> dict[str, np.ndarray]:
+    """
+    Agrupa a série de preços em candles de `seconds` segundos: retorna as
+    colunas open_time, open, high, low, close e samples, em ordem de tempo.
+    Com `with_bounds`, também first_time e last_time (timestamps do primeiro e
+    do último snapshot de cada candle).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(timestamps) and np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, prices = timestamps[order], prices[order]
+    open_times = timestamps // seconds * seconds
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(open_times)) + 1]) if len(open_times) else np.empty(0, np.int64)
+    ends = np.append(starts[1:], len(open_times)).astype(np.int64)
+    if not len(starts):
+        empty = np.empty(0)
+        columns = {"open_time": empty.astype(np.int64), "open": empty, "high": empty, "low": empty, "close": empty,
+                   "samples": empty.astype(np.int64)}
+        if with_bounds:
+            columns["first_time"] = columns["last_time"] = empty.astype(np.int64)
+        return columns
+    columns = {
+        "open_time": open_times[starts],
+        "open": prices[starts],
+        "high": np.maximum.reduceat(prices, starts),
+        "low": np.minimum.reduceat(prices, starts),
+        "close": prices[ends - 1],
+        "samples": ends - starts,
+    }
+    if with_bounds:
+        columns["first_time"] = timestamps[starts]
+        columns["last_time"] = timestamps[ends - 1]
+    return columns
+
+
+class _Series:
+    """
+    Candles de um intervalo, em listas ordenadas pelo início do candle. Os
+    timestamps do primeiro e do último snapshot de cada candle decidem o
+    open/close quando chegam snapshots fora de ordem.
+    """
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.open_time: list[int] = []
+        self.open: list[float] = []
+        self.high: list[float] = []
+        self.low: list[float] = []
+        self.close: list[float] = []
+        self.samples: list[int] = []
+        self.first_time: list[int] = []
+        self.last_time: list[int] = []
+
+    _COLUMNS = ("open_time", "open", "high", "low", "close", "samples", "first_time", "last_time")
+
+    def merge(self, candles: dict[str, np.ndarray]):
+        """
+        Incorpora candles calculados por `ohlc(..., with_bounds=True)`.
+        """
+        rows = zip(*(candles[name].tolist() for name in self._COLUMNS))
+        for row in rows:
+            open_time, open_, high, low, close, samples, first_time, last_time = row
+            if not self.open_time or open_time > self.open_time[-1]:
+                for name, value in zip(self._COLUMNS, row):
+                    getattr(self, name).append(value)
+                continue
+            pos = bisect.bisect_left(self.open_time, open_time)
+            if pos < len(self.open_time) and self.open_time[pos] == open_time:
+                # Candle já existe (normalmente o último, ainda aberto)
+                self.high[pos] = max(self.high[pos], high)
+                self.low[pos] = min(self.low[pos], low)
+                self.samples[pos] += samples
+                if first_time < self.first_time[pos]:
+                    self.open[pos], self.first_time[pos] = open_, first_time
+                if last_time >= self.last_time[pos]:
+                    self.close[pos], self.last_time[pos] = close, last_time
+            else:
+                # Snapshot fora de ordem num candle que ainda não existia
+                for name, value in zip(self._COLUMNS, row):
+                    getattr(self, name).insert(pos, value)
+
+    def prune(self, before: int):
+        """
+        Descarta os candles que terminam antes de `before`.
+        """
+        cut = bisect.bisect_right(self.open_time, before - self.seconds)
+        for name in self._COLUMNS:
+            del getattr(self, name)[:cut]
+
+    def window(self, start: int | None, end: int | None, limit: int | None) -> list[dict]:
+        first = 0 if start is None else bisect.bisect_left(self.open_time, start // self.seconds * self.seconds)
+        last = len(self.open_time) if end is None else bisect.bisect_right(self.open_time, end)
+        if limit:
+            first = max(first, last - limit)
+        return [
+            {"open_time": self.open_time[k], "open": self.open[k], "high": self.high[k], "low": self.low[k],
+             "close": self.close[k], "samples": self.samples[k]}
+            for k in range(first, last)
+        ]
+
+
+class _SymbolCandles:
+    def __init__(self, intervals: list[int]):
+        self.lock = threading.Lock()
+        self.cursor = None
+        # Primeiro snapshot incorporado: antes disso os candles vêm do armazenamento
+        self.since: int | None = None
+        self.series = {seconds: _Series(seconds) for seconds in intervals}
+        self.prune_checked = -math.inf
+
+    def fold(self, headers: np.ndarray):
+        if not len(headers):
+            return
+        if self.since is None:
+            self.since = int(headers["timestamp"][0])
+        for seconds, series in self.series.items():
+            series.merge(ohlc(headers["timestamp"], headers["current_price"], seconds, with_bounds=True))
+
+    def prune(self, before: int):
+        for series in self.series.values():
+            series.prune(before)
+        if self.since is not None:
+            self.since = max(self.since, before)
+
+
+_states: dict[str, _SymbolCandles] = {}
+_states_lock = threading.Lock()
+
+
+def _standard_intervals() -> list[int]:
+    return sorted({bucket_seconds(interval) for interval in settings.candle_intervals} - {None})
+
+
+def _state(symbol: str) -> _SymbolCandles:
+    key = snapshot_store.symbol_key(symbol)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = _SymbolCandles(_standard_intervals())
+        return state
+
+
+def _horizon() -> int | None:
+    # Início da janela mantida em memória (None = todo o histórico bruto)
+    if settings.aggregate_horizon_hours <= 0:
+        return None
+    return int(time.time() - settings.aggregate_horizon_hours * 3600)
+
+
+def enabled() -> bool:
+    return settings.storage_format != "csv" and bool(settings.candle_intervals)
+
+
+def refresh(symbol: str):
+    """
+    Incorpora aos candles em memória os snapshots gravados desde a última
+    atualização e, de tempos em tempos, descarta os que saíram do horizonte
+    ou cujos dados brutos a retenção já apagou. Chamado logo após gravar cada
+    snapshot.
+    """
+    if not enabled():
+        return
+    horizon = _horizon()
+    state = _state(symbol)
+    with state.lock:
+        if state.cursor is None and horizon is not None:
+            # Carga inicial: começa no segmento que contém o início do horizonte
+            state.cursor = snapshot_store.cursor_at(symbol, PRICE_SIDE, horizon)
+        headers, _, state.cursor = snapshot_store.read_since(symbol, PRICE_SIDE, state.cursor, with_levels=False)
+        state.fold(headers)
+        if time.monotonic() - state.prune_checked >= _PRUNE_CHECK_SECONDS:
+            state.prune_checked = time.monotonic()
+            limits = [limit for limit in (snapshot_store.first_timestamp(symbol, PRICE_SIDE), horizon) if limit is not None]
+            if limits:
+                state.prune(max(limits))
+
+
+def reset(symbol: str):
+    """
+    Descarta os candles do símbolo (usado quando o histórico é apagado).
+    """
+    with _states_lock:
+        _states.pop(snapshot_store.symbol_key(symbol), None)
+
+
+def _from_memory(symbol: str, seconds: int, start: int | None, end: int | None, limit: int | None) -> list[dict] | None:
+    if not enabled() or seconds not in _standard_intervals():
+        return None
+    refresh(symbol)
+    state = _state(symbol)
+    with state.lock:
+        candles = state.series[seconds].window(start, end, limit)
+        since = state.since
+        if since is not None:
+            if start is not None and start // seconds * seconds >= since:
+                return candles
+            if start is None and limit and len(candles) == limit and candles[0]["open_time"] >= since:
+                return candles
+    # A janela começa antes do que está em memória: só serve se a memória tiver
+    # todos os dados brutos e as camadas de retenção não guardarem histórico mais antigo
+    first = snapshot_store.first_timestamp(symbol, PRICE_SIDE)
+    if first is not None and (since is None or since > first):
+        return None
+    if snapshot_store.read_plan(symbol, PRICE_SIDE, start, end)[0][0] is None:
+        return candles
+    return None
+
+
+def get_candles(symbol: str, interval: str, start: int = None, end: int = None, limit: int = None) -> list[dict]:
+    """
+    Candles do símbolo no intervalo pedido ("1min", "15min", "1h"...), na
+    janela `[start, end]` (epoch em segundos) e, com `limit`, só os últimos.
+    Levanta ValueError se o intervalo não for reconhecido.
+    """
+    seconds = bucket_seconds(interval)
+    if seconds is None:
+        raise ValueError(f"Intervalo inválido: {interval} (use por exemplo 1min, 15min, 1h, 1d)")
+    candles = _from_memory(symbol, seconds, start, end, limit)
+    if candles is not None:
+        return candles
+
+    headers = snapshot_store.read_headers(symbol, PRICE_SIDE, start, end)
+    columns = ohlc(headers["timestamp"], headers["current_price"], seconds)
+    first = max(len(columns["open_time"]) - limit, 0) if limit else 0
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[name][first:].tolist() for name in names))]
@@ -0,0 +1,288 @@
+"""
+Dataset de aprendizado a partir do histórico de order book.
+
+Cada snapshot com bids e asks no mesmo timestamp vira uma linha de features de
+tamanho fixo (float32), calculada em relação ao `current_price`:
+
+- profundidade de bids e de asks em `dataset_depth_buckets` faixas de
+  `dataset_bucket_bps` pontos-base a partir do preço (faixa 0 = mais perto);
+- profundidade acumulada de cada lado nas mesmas faixas;
+- desequilíbrio acumulado por faixa, `(bids - asks) / (bids + asks)`;
+- spread e deslocamento do mid em relação ao preço, em pontos-base.
+
+Os rótulos são os retornos logarítmicos futuros do `current_price` em cada
+horizonte de `dataset_horizons_seconds` (NaN quando não há snapshot perto do
+horizonte, ex.: captura parada).
+
+As linhas ficam em `data/datasets/<SÍMBOLO>/` em shards append-only de até
+`dataset_shard_rows` linhas, no mesmo esquema do armazenamento colunar:
+arquivos binários crus (`<shard>.features`, `<shard>.labels`,
+`<shard>.timestamps`) que os leitores abrem por memory-map, e um
+`manifest.json` gravado por último com a especificação, as contagens e a marca
+d'água. A construção é incremental: cada execução só processa os snapshots
+depois da marca d'água cujos horizontes já estão no histórico. Mudar a
+especificação (faixas, horizontes) recomeça o dataset do zero.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import snapshot_store
+
+FEATURE_DTYPE = np.dtype("<f4")
+TIMESTAMP_DTYPE = np.dtype("<i8")
+# Um rótulo só vale se o snapshot usado estiver a no máximo esta fração do horizonte depois dele
+LABEL_TOLERANCE = 0.5
+# Janela de histórico lida por vez (limita a memória da construção)
+CHUNK_SECONDS = 3600
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def dataset_dir(symbol: str) -> Path:
+    return snapshot_store.DATA_DIR / "datasets" / snapshot_store.symbol_key(symbol)
+
+
+def current_spec() -> dict:
+    return {
+        "depth_buckets": settings.dataset_depth_buckets,
+        "bucket_bps": settings.dataset_bucket_bps,
+        "horizons_seconds": list(settings.dataset_horizons_seconds),
+    }
+
+
+def feature_names(depth_buckets: int) -> list[str]:
+    names = []
+    for group in ("bid_depth", "ask_depth", "bid_cum", "ask_cum", "imbalance"):
+        names += [f"{group}_{i}" for i in range(depth_buckets)]
+    return names + ["spread_bps", "mid_offset_bps"]
+
+
+def load_manifest(symbol: str) -> dict | None:
+    path = dataset_dir(symbol) / "manifest.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def _save_manifest(symbol: str, manifest: dict):
+    path = dataset_dir(symbol) / "manifest.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, path)
+
+
+def _new_manifest() -> dict:
+    spec = current_spec()
+    return {
+        "spec": spec,
+        "features": feature_names(spec["depth_buckets"]),
+        "labels": [f"return_{h}s" for h in spec["horizons_seconds"]],
+        "rows": 0,
+        "watermark": None,
+        "shards": [],
+    }
+
+
+def side_features(headers: np.ndarray, levels: np.ndarray, pair_of: np.ndarray, n_pairs: int,
+                  current_price: np.ndarray, bid: bool, depth_buckets: int, bucket_bps: float
+                  ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Profundidade por faixa de distância ao preço `(n_pairs, depth_buckets)` e
+    melhor preço de cada snapshot de um lado. `pair_of[k]` é a linha do dataset
+    do snapshot `k` do lado (-1 = sem par no outro lado).
+    """
+    counts = headers["count"]
+    rows = np.repeat(pair_of, counts)
+    prices = np.asarray(levels["price"])
+    keep = rows >= 0
+    rows, prices, volumes = rows[keep], prices[keep], np.asarray(levels["volume"])[keep]
+
+    reference = current_price[rows]
+    distance = (reference - prices) if bid else (prices - reference)
+    buckets = np.floor(distance / reference * (10_000 / bucket_bps)).astype(np.int64)
+    inside = (buckets >= 0) & (buckets < depth_buckets)
+    depth = np.bincount(rows[inside] * depth_buckets + buckets[inside], weights=volumes[inside],
+                        minlength=n_pairs * depth_buckets).reshape(n_pairs, depth_buckets)
+
+    # Melhor preço: maior bid / menor ask de cada snapshot (NaN se o lado veio vazio)
+    best = np.full(n_pairs, np.nan)
+    if len(prices):
+        starts = np.flatnonzero(np.diff(rows, prepend=-1))
+        reduce = np.maximum.reduceat if bid else np.minimum.reduceat
+        best[rows[starts]] = reduce(prices, starts)
+    return depth, best
+
+
+def compute_features(bids: tuple[np.ndarray, np.ndarray], asks: tuple[np.ndarray, np.ndarray],
+                     depth_buckets: int, bucket_bps: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Features dos snapshots presentes nos dois lados. Recebe (cabeçalhos, níveis)
+    de cada lado e retorna (timestamps, preços de mercado, features float32).
+    """
+    bid_headers, ask_headers = bids[0], asks[0]
+    timestamps, bid_index, ask_index = np.intersect1d(bid_headers["timestamp"], ask_headers["timestamp"],
+                                                      return_indices=True)
+    n_pairs = len(timestamps)
+    current_price = bid_headers["current_price"][bid_index]
+
+    def _pair_of(index: np.ndarray, n_side: int) -> np.ndarray:
+        pair_of = np.full(n_side, -1, dtype=np.int64)
+        pair_of[index] = np.arange(n_pairs)
+        return pair_of
+
+    bid_depth, best_bid = side_features(*bids, _pair_of(bid_index, len(bid_headers)), n_pairs,
+                                        current_price, True, depth_buckets, bucket_bps)
+    ask_depth, best_ask = side_features(*asks, _pair_of(ask_index, len(ask_headers)), n_pairs,
+                                        current_price, False, depth_buckets, bucket_bps)
+    bid_cum = np.cumsum(bid_depth, axis=1)
+    ask_cum = np.cumsum(ask_depth, axis=1)
+    total = bid_cum + ask_cum
+    imbalance = np.divide(bid_cum - ask_cum, total, out=np.zeros_like(total), where=total > 0)
+    spread_bps = (best_ask - best_bid) / current_price * 10_000
+    mid_offset_bps = ((best_ask + best_bid) / 2 - current_price) / current_price * 10_000
+
+    features = np.empty((n_pairs, 5 * depth_buckets + 2), dtype=FEATURE_DTYPE)
+    for k, block in enumerate((bid_depth, ask_depth, bid_cum, ask_cum, imbalance)):
+        features[:, k * depth_buckets:(k + 1) * depth_buckets] = block
+    features[:, -2] = spread_bps
+    features[:, -1] = mid_offset_bps
+    return timestamps, current_price, features
+
+
+def forward_returns(timestamps: np.ndarray, current_price: np.ndarray, series_timestamps: np.ndarray,
+                    series_prices: np.ndarray, horizons: list[int]) -> np.ndarray:
+    """
+    Retorno logarítmico do preço de mercado entre cada timestamp e o primeiro
+    snapshot da série em `timestamp + horizonte`, para cada horizonte.
+    """
+    labels = np.full((len(timestamps), len(horizons)), np.nan, dtype=FEATURE_DTYPE)
+    for k, horizon in enumerate(horizons):
+        target = timestamps + horizon
+        index = np.searchsorted(series_timestamps, target, side="left")
+        found = index < len(series_timestamps)
+        index = np.minimum(index, len(series_timestamps) - 1)
+        valid = found & (series_timestamps[index] - target <= horizon * LABEL_TOLERANCE)
+        labels[valid, k] = np.log(series_prices[index[valid]] / current_price[valid])
+    return labels
+
+
+def _append_rows(symbol: str, manifest: dict, timestamps: np.ndarray, features: np.ndarray, labels: np.ndarray):
+    """
+    Acrescenta linhas aos shards (abrindo shards novos ao encher). Os arquivos
+    são gravados antes do manifest, que é quem torna as linhas visíveis.
+    """
+    directory = dataset_dir(symbol)
+    directory.mkdir(parents=True, exist_ok=True)
+    position = 0
+    while position < len(timestamps):
+        if not manifest["shards"] or manifest["shards"][-1]["rows"] >= settings.dataset_shard_rows:
+            manifest["shards"].append({"name": f"{len(manifest['shards']):05d}", "rows": 0, "first": None, "last": None})
+        shard = manifest["shards"][-1]
+        take = min(settings.dataset_shard_rows - shard["rows"], len(timestamps) - position)
+        part = slice(position, position + take)
+        for suffix, values in (("timestamps", timestamps[part].astype(TIMESTAMP_DTYPE)),
+                               ("features", features[part]), ("labels", labels[part])):
+            path = directory / f"{shard['name']}.{suffix}"
+            with open(path, "ab") as f:
+                # Descarta restos de uma execução interrompida antes do manifest
+                f.truncate(shard["rows"] * values.itemsize * (values.shape[1] if values.ndim > 1 else 1))
+                f.write(np.ascontiguousarray(values).tobytes())
+        shard["first"] = shard["first"] if shard["first"] is not None else int(timestamps[position])
+        shard["last"] = int(timestamps[position + take - 1])
+        shard["rows"] += take
+        manifest["rows"] += take
+        position += take
+
+
+def build(symbol: str) -> dict:
+    """
+    Processa os snapshots novos do símbolo e acrescenta as linhas ao dataset.
+    Retorna um resumo (linhas acrescentadas, total, snapshots/s...).
+    """
+    if settings.storage_format == "csv":
+        raise ValueError("O dataset é construído a partir do armazenamento colunar (STORAGE_FORMAT=columnar)")
+    with _locks_guard:
+        lock = _locks.setdefault(snapshot_store.symbol_key(symbol), threading.Lock())
+    # Duas construções do mesmo símbolo ao mesmo tempo gravariam as mesmas linhas
+    with lock:
+        return _build(symbol)
+
+
+def _build(symbol: str) -> dict:
+    started = time.perf_counter()
+    manifest = load_manifest(symbol)
+    if manifest is None or manifest["spec"] != current_spec():
+        shutil.rmtree(dataset_dir(symbol), ignore_errors=True)
+        manifest = _new_manifest()
+
+    spec = manifest["spec"]
+    horizons = spec["horizons_seconds"]
+    lookahead = int(max(horizons) * (1 + LABEL_TOLERANCE)) if horizons else 0
+
+    firsts = [snapshot_store.first_timestamp(symbol, side) for side in snapshot_store.SIDES]
+    lasts = [snapshot_store.last_timestamp(symbol, side) for side in snapshot_store.SIDES]
+    added = 0
+    if None not in firsts and None not in lasts:
+        start = max(firsts) if manifest["watermark"] is None else max(manifest["watermark"] + 1, max(firsts))
+        # Só entram snapshots cujo horizonte mais longo já foi capturado
+        until = min(lasts) - (max(horizons) if horizons else 0)
+        for window_start in range(start, until + 1, CHUNK_SECONDS):
+            window_end = min(window_start + CHUNK_SECONDS - 1, until)
+            bids = snapshot_store.read_snapshots(symbol, "bids", window_start, window_end)
+            asks = snapshot_store.read_snapshots(symbol, "asks", window_start, window_end)
+            if len(bids[0]) and len(asks[0]):
+                timestamps, current_price, features = compute_features(bids, asks, spec["depth_buckets"],
+                                                                      spec["bucket_bps"])
+                series, _ = snapshot_store.read_snapshots(symbol, "bids", window_start, window_end + lookahead)
+                labels = forward_returns(timestamps, current_price, series["timestamp"], series["current_price"],
+                                         horizons)
+                _append_rows(symbol, manifest, timestamps, features, labels)
+                added += len(timestamps)
+            manifest["watermark"] = window_end
+            _save_manifest(symbol, manifest)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "symbol": symbol,
+        "rows_added": added,
+        "total_rows": manifest["rows"],
+        "shards": len(manifest["shards"]),
+        "watermark": manifest["watermark"],
+        "seconds": round(elapsed, 3),
+        "snapshots_per_second": round(added / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [dataset] {symbol} → {added} linhas novas "
+          f"({manifest['rows']} no total, {summary['snapshots_per_second']} snapshots/s)")
+    return summary
+
+
+def open_shards(symbol: str) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Memory-map dos shards do dataset: lista de (timestamps, features, labels),
+    só com as linhas registradas no manifest.
+    """
+    manifest = load_manifest(symbol)
+    if manifest is None:
+        return []
+    directory = dataset_dir(symbol)
+    n_features, n_labels = len(manifest["features"]), len(manifest["labels"])
+    shards = []
+    for shard in manifest["shards"]:
+        rows = shard["rows"]
+        if rows == 0:
+            continue
+        shards.append((
+            np.memmap(directory / f"{shard['name']}.timestamps", dtype=TIMESTAMP_DTYPE, mode="r", shape=(rows,)),
+            np.memmap(directory / f"{shard['name']}.features", dtype=FEATURE_DTYPE, mode="r", shape=(rows, n_features)),
+            np.memmap(directory / f"{shard['name']}.labels", dtype=FEATURE_DTYPE, mode="r", shape=(rows, n_labels)),
+        ))
+    return shards
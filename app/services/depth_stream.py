@@ -0,0 +1,156 @@
+"""
+Captura por stream: mantém um order book local por símbolo, semeado por um
+snapshot REST e atualizado pelos eventos de diff de profundidade da Binance
+(`<symbol>@depth@100ms`).
+
+Regras de sincronização (documentação da Binance):
+- eventos com `u` <= `lastUpdateId` do snapshot são descartados;
+- cada evento aplicado precisa começar no máximo em `último u + 1`
+  (`U <= último_u + 1`); caso contrário houve perda de eventos e o livro é
+  ressincronizado com um novo snapshot, sem derrubar a conexão.
+
+Os snapshots para o armazenamento saem do livro local, na cadência que for
+configurada, sem custo extra de rede.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from websockets.asyncio.client import connect
+
+from app.config.settings import settings
+from app.services.book_levels import OrderBook
+from app.services.order_book import fetch_depth, write_order_book
+
+
+class SequenceGap(Exception):
+    """
+    Evento fora de sequência: o livro local precisa ser ressincronizado.
+    """
+
+
+def apply_event(book: OrderBook, event: dict) -> bool:
+    """
+    Aplica um evento de diff ao livro. Retorna False se o evento já estava
+    contido no livro; levanta SequenceGap se houver eventos faltando antes dele.
+    """
+    if event["u"] <= book.last_update_id:
+        return False
+    if event["U"] > book.last_update_id + 1:
+        raise SequenceGap(f"esperado U <= {book.last_update_id + 1}, recebido U={event['U']}")
+    book.apply(event["b"], event["a"], event["u"])
+    return True
+
+
+class DepthStream:
+    """
+    Conexão de diff-depth de um símbolo com reconexão e ressincronização automáticas.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.book: OrderBook | None = None
+        self.events = 0
+        self.resyncs = 0
+        self.reconnects = 0
+        self.last_event_at: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.book is not None
+
+    @property
+    def url(self) -> str:
+        return f"{settings.exchange_ws_url}/ws/{self.symbol.lower()}@depth@{settings.stream_update_speed}"
+
+    async def run(self):
+        """
+        Mantém o livro local atualizado até ser cancelado.
+        """
+        while True:
+            try:
+                async with connect(self.url, max_size=None) as websocket:
+                    await self._consume(websocket)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[stream] {self.symbol}: conexão perdida ({e}), reconectando...")
+            self.book = None
+            self.reconnects += 1
+            await asyncio.sleep(1)
+
+    async def _consume(self, websocket):
+        pending: list[dict] = []
+        seed = asyncio.create_task(fetch_depth(self.symbol, settings.stream_seed_depth_limit))
+        try:
+            async for message in websocket:
+                event = json.loads(message)
+                self.events += 1
+                self.last_event_at = time.time()
+
+                if self.book is None:
+                    pending.append(event)
+                    if seed.done():
+                        seed = self._seed(seed, pending)
+                    continue
+
+                try:
+                    apply_event(self.book, event)
+                except SequenceGap as e:
+                    print(f"[stream] {self.symbol}: {e}; ressincronizando")
+                    self.resyncs += 1
+                    self.book = None
+                    pending = [event]
+                    seed = asyncio.create_task(fetch_depth(self.symbol, settings.stream_seed_depth_limit))
+        finally:
+            seed.cancel()
+
+    def _seed(self, seed: asyncio.Task, pending: list[dict]) -> asyncio.Task:
+        """
+        Monta o livro com o snapshot REST e reaplica os eventos acumulados.
+        Se o snapshot for mais novo ou mais velho que o stream, busca outro.
+        """
+        book = OrderBook.from_depth(seed.result())
+        try:
+            for event in pending:
+                apply_event(book, event)
+        except SequenceGap:
+            # O snapshot é anterior ao primeiro evento disponível: tenta de novo
+            return asyncio.create_task(fetch_depth(self.symbol, settings.stream_seed_depth_limit))
+        pending.clear()
+        self.book = book
+        return seed
+
+    def snapshot(self) -> tuple[OrderBook, float] | None:
+        """
+        Retorna (cópia dos `depth_limit` melhores níveis, preço médio) do livro
+        local. A cópia pode ser gravada em outra thread enquanto o livro segue
+        recebendo eventos.
+        """
+        if self.book is None:
+            return None
+        mid = self.book.mid_price()
+        if mid is None:
+            return None
+        return self.book.copy(settings.depth_limit), mid
+
+
+async def capture_from_stream(stream: DepthStream, timestamp: int = None) -> bool:
+    """
+    Grava um snapshot do livro local no armazenamento (pelo writer em lote).
+    O `current_price` é o preço médio entre melhor bid e melhor ask.
+    `timestamp` permite gravar o instante do disparo do agendador em vez do
+    instante atual. Retorna False se o livro ainda não estiver sincronizado.
+    """
+    snapshot = stream.snapshot()
+    if snapshot is None:
+        return False
+    book, current_price = snapshot
+
+    if timestamp is None:
+        timestamp = int(datetime.now().timestamp())
+    datetime_local = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+    await write_order_book(stream.symbol, book, timestamp, datetime_local, current_price)
+    return True
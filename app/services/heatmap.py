@@ -1,11 +1,18 @@
-import os
-import pandas as pd
+import base64
+import json
 import numpy as np
-import plotly.graph_objects as go
-import plotly.io as pio
 import logging
-from pathlib import Path
 from datetime import datetime
+from typing import TYPE_CHECKING
+from app.services import heatmap_aggregates, metrics, snapshot_store
+from app.services.book_levels import bucket_codes
+from app.services.heatmap_grid import TIMEZONE, HeatmapGrid, sides_for
+
+# pandas e Plotly são importados só no primeiro uso: a captura e a subida da API não os carregam
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+PLOTLY_SCRIPT = '<script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>'
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -17,175 +24,319 @@ def definir_bucket_size(preco_min: float, preco_max: float) -> float:
     return round(bucket, 6)
 
 
-def _load_and_prepare_data(file_path: Path, bucket_price: float = None, bucket_time: str = "5min"):
+def _load_columns(symbol: str, side: str, start: datetime = None, end: datetime = None):
     try:
-        if not file_path.exists():
-            return None, f"Arquivo não encontrado: {file_path}", None
-
-        df = pd.read_csv(file_path)
-        if not {"timestamp", "price", "volume"}.issubset(df.columns):
-            return None, "Arquivo CSV inválido", None
-
-        df["timestamp"] = (
-            pd.to_datetime(df["timestamp"], unit='s')
-            .dt.tz_localize("UTC")
-            .dt.tz_convert("America/Sao_Paulo")
-        )
-
-        df["price"] = pd.to_numeric(df["price"])
-        df["volume"] = pd.to_numeric(df["volume"])
-        df["current_price"] = pd.to_numeric(df.get("current_price", np.nan))
+        columns = snapshot_store.read_columns(symbol, side, snapshot_store.to_epoch(start), snapshot_store.to_epoch(end))
+        if columns is None:
+            return None, f"Dados não encontrados: {symbol} ({side})"
+        return columns, None
 
-        preco_min = df["price"].min()
-        preco_max = df["price"].max()
-        bucket_size = bucket_price if bucket_price else definir_bucket_size(preco_min, preco_max)
-        avg_price = df["price"].mean()
+    except Exception as e:
+        logger.error(f"Erro ao carregar dados de {symbol} ({side}): {str(e)}")
+        return None, f"Erro: {str(e)}"
+
+
+def _snapshot_runs(timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Divide as linhas em trechos consecutivos com o mesmo timestamp (um snapshot
+    por trecho). Retorna o timestamp e o tamanho de cada trecho.
+    """
+    starts = np.flatnonzero(np.diff(timestamps)) + 1
+    bounds = np.concatenate([[0], starts, [len(timestamps)]])
+    return timestamps[bounds[:-1]], np.diff(bounds)
+
+
+def _floor_local(timestamps: np.ndarray, bucket_time: str) -> np.ndarray:
+    """
+    Início do bucket de tempo (no horário de TIMEZONE) de cada timestamp, em epoch.
+    Recebe só os timestamps distintos dos snapshots, nunca as linhas.
+    """
+    import pandas as pd
+
+    local = pd.to_datetime(timestamps, unit="s", utc=True).tz_convert(TIMEZONE)
+    return local.floor(bucket_time).asi8 // 10**9
+
+
+def _price_rows(codes: list[np.ndarray]) -> tuple[np.ndarray, list[np.ndarray]]:
+    """
+    Códigos de preço ocupados (ordenados) e a linha do grid de cada preço.
+    """
+    code_min = min(int(c.min()) for c in codes)
+    span = max(int(c.max()) for c in codes) - code_min + 1
+    total = sum(len(c) for c in codes)
+    if span <= max(4 * total, 1 << 20):
+        # Faixa compacta: contagem densa + tabela de tradução, sem ordenar as linhas
+        counts = np.zeros(span, dtype=np.int64)
+        for c in codes:
+            counts += np.bincount(c - code_min, minlength=span)
+        occupied = np.flatnonzero(counts)
+        row_of = np.full(span, -1, dtype=np.int64)
+        row_of[occupied] = np.arange(len(occupied))
+        return occupied + code_min, [row_of[c - code_min] for c in codes]
+    occupied = np.unique(np.concatenate(codes))
+    return occupied, [np.searchsorted(occupied, c) for c in codes]
+
+
+def grid_from_columns(parts: list[dict], bucket_price: float = None, bucket_time: str = "5min") -> HeatmapGrid:
+    """
+    Agrega os dados brutos (colunas de `read_columns`, um dict por lado) em
+    buckets de preço × tempo, para resoluções sem agregado materializado.
+
+    Tudo em NumPy: preços viram códigos inteiros de bucket, o fuso só é aplicado
+    aos timestamps distintos dos snapshots, e o volume é somado com `np.bincount`
+    direto na matriz preço × tempo.
+    """
+    preco_min = min(float(part["price"].min()) for part in parts)
+    preco_max = max(float(part["price"].max()) for part in parts)
+    bucket_size = bucket_price if bucket_price else definir_bucket_size(preco_min, preco_max)
+
+    # Eixo do tempo: um bucket por snapshot, depois repetido pelas linhas dele
+    runs = [_snapshot_runs(np.asarray(part["timestamp"])) for part in parts]
+    run_buckets = _floor_local(np.concatenate([run_ts for run_ts, _ in runs]), bucket_time)
+    time_buckets, run_columns = np.unique(run_buckets, return_inverse=True)
+    bounds = np.cumsum([0] + [len(run_ts) for run_ts, _ in runs])
+
+    # Eixo do preço
+    codes = [bucket_codes(np.asarray(part["price"]), bucket_size) for part in parts]
+    price_codes, rows = _price_rows(codes)
+    price_buckets = price_codes * bucket_size
+
+    n_times = len(time_buckets)
+    cells = len(price_buckets) * n_times
+    z = np.zeros(cells)
+    market_sum = np.zeros(n_times)
+    market_count = np.zeros(n_times)
+    for part, (_, lengths), row, a, b in zip(parts, runs, rows, bounds[:-1], bounds[1:]):
+        columns = np.repeat(run_columns[a:b], lengths)
+        market_sum += np.bincount(columns, weights=part["current_price"], minlength=n_times)
+        market_count += np.bincount(columns, minlength=n_times)
+        row *= n_times
+        row += columns
+        z += np.bincount(row, weights=part["volume"], minlength=cells)
+
+    return HeatmapGrid(
+        price_buckets=price_buckets,
+        time_buckets=time_buckets,
+        z=z.reshape(len(price_buckets), n_times),
+        market_price=market_sum / market_count,
+        bucket_price=bucket_size,
+        bucket_time=bucket_time
+    )
 
-        df["price_bucket"] = (df["price"] // bucket_size) * bucket_size
-        df["time_bucket"] = df["timestamp"].dt.floor(bucket_time)
 
-        return df, None, avg_price
+def build_heatmap_grid(symbol: str, bucket_price: float = None, bucket_time: str = "5min", side: str = None,
+                       start: datetime = None, end: datetime = None) -> tuple[HeatmapGrid | None, str | None]:
+    """
+    Retorna (grid, erro). Resoluções padrão saem dos agregados materializados;
+    as demais são calculadas a partir dos dados brutos da janela.
+    """
+    with metrics.span("heatmap.aggregates") as aggregated:
+        grid = heatmap_aggregates.query(symbol, side, bucket_price, bucket_time,
+                                        snapshot_store.to_epoch(start), snapshot_store.to_epoch(end))
+        if grid is not None:
+            aggregated["rows"] = int(grid.z.size)
+    if grid is not None and not grid.empty:
+        return grid, None
+
+    parts = []
+    with metrics.span("heatmap.load", rows=0, nbytes=0) as loaded:
+        for store_side in sides_for(side):
+            columns, err = _load_columns(symbol, store_side, start, end)
+            if isinstance(err, str):
+                return None, f"Erro em {store_side}: {err}"
+            if len(columns["price"]):
+                parts.append(columns)
+                loaded["rows"] += len(columns["price"])
+                loaded["bytes"] += sum(column.nbytes for column in columns.values())
+    if not parts:
+        return None, "Dados insuficientes"
+    with metrics.span("heatmap.grid", rows=loaded["rows"]):
+        return grid_from_columns(parts, bucket_price, bucket_time), None
+
+
+def _fill_gaps(values: np.ndarray) -> np.ndarray:
+    """
+    Preenche NaN com o último valor válido (e os iniciais com o primeiro válido).
+    """
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return values
+    positions = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(positions, out=positions)
+    filled = values[positions]
+    filled[:np.argmax(valid)] = values[np.argmax(valid)]
+    return filled
+
+
+def nearest_bucket_index(price_buckets: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    """
+    Índice do bucket de preço mais próximo de cada preço (buckets ordenados).
+    """
+    right = np.clip(np.searchsorted(price_buckets, prices), 1, max(len(price_buckets) - 1, 1))
+    left = right - 1
+    if len(price_buckets) == 1:
+        return np.zeros(len(prices), dtype=np.int64)
+    return np.where(np.abs(prices - price_buckets[left]) <= np.abs(price_buckets[right] - prices), left, right)
+
+
+def heatmap_payload(symbol: str, side: str, grid: HeatmapGrid, encoding: str = "b64") -> dict:
+    """
+    Serializa o grid para o cliente desenhar com Plotly.js. Com `encoding="b64"`,
+    a matriz vai como float32 little-endian em base64 (linha = bucket de preço).
+    """
+    market_price = _fill_gaps(np.asarray(grid.market_price, dtype=np.float64))
+    has_market = ~np.isnan(market_price)
+    market_bucket = np.full(len(market_price), -1, dtype=np.int64)
+    if has_market.any() and len(grid.price_buckets):
+        market_bucket[has_market] = nearest_bucket_index(grid.price_buckets, market_price[has_market])
+
+    if encoding == "b64":
+        z = base64.b64encode(np.ascontiguousarray(grid.z, dtype="<f4").tobytes()).decode("ascii")
+    else:
+        z = grid.z.tolist()
+
+    return {
+        "symbol": symbol,
+        "side": side,
+        "bucket_price": float(grid.bucket_price),
+        "bucket_time": grid.bucket_time,
+        "timezone": TIMEZONE,
+        "shape": list(grid.z.shape),
+        "price_buckets": np.asarray(grid.price_buckets, dtype=np.float64).tolist(),
+        "time_buckets": np.asarray(grid.time_buckets, dtype=np.int64).tolist(),
+        "market_price": [None if np.isnan(p) else p for p in market_price.tolist()],
+        "market_bucket": market_bucket.tolist(),
+        "encoding": "f32-b64" if encoding == "b64" else "json",
+        "z": z,
+    }
+
+
+def _heatmap_figure(grid: HeatmapGrid, side: str = None) -> "go.Figure":
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    price_buckets = grid.price_buckets
+    z = grid.z
+    z_normalized = (z - np.min(z)) / (np.max(z) - np.min(z) + 0.001)
+    z_normalized = np.nan_to_num(z_normalized, nan=0, posinf=1, neginf=0)
+
+    # Rótulos formatados só sobre os eixos (um por bucket, não por linha)
+    time_labels = (
+        pd.to_datetime(grid.time_buckets, unit="s", utc=True)
+        .tz_convert(TIMEZONE)
+        .strftime("%d, %H:%M")
+    )
+    price_labels = np.char.mod("%.2f", price_buckets)
+
+    # Linha de preço de mercado (média de current_price por bucket de tempo)
+    market_line = _fill_gaps(np.asarray(grid.market_price, dtype=np.float64))
+    line_y = price_labels[nearest_bucket_index(price_buckets, market_line)]
+
+    # Mesma escala de cores para ask, bid e combinado
+    colorscale = [
+        [0.0, "#520D6B"],
+        [0.2, "#3111A4"],
+        [0.4, "#1717d8"],
+        [0.6, "#0d49ff"],
+        [0.8, "#d7f209"],
+        [1.0, "#d4ca0c"]
+    ]
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Heatmap(
+        z=z_normalized,
+        x=time_labels,
+        y=price_labels.tolist(),
+        colorscale=colorscale,
+        zmin=0,
+        zmax=1,
+        colorbar=dict(title="Volume Normalizado")
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=time_labels,
+        y=line_y.tolist(),
+        mode="lines+markers",
+        name="Preço de Mercado",
+        line=dict(color="white", width=2),
+        marker=dict(size=4, color="white")
+    ))
+
+    titulo = f"Heatmap de Liquidez – {side.upper()}" if side in ("ask", "bid") else "Heatmap de Liquidez – ASK + BID"
+
+    fig.update_layout(
+        title=dict(text=titulo, x=0.5),
+        xaxis_title="Tempo (Horário Local)",
+        yaxis_title="Faixa de Preço",
+        height=500,
+        margin=dict(t=40, b=50, l=40, r=60),
+        plot_bgcolor="white",
+        paper_bgcolor="white",
+        font=dict(color="black")
+    )
+    return fig
 
-    except Exception as e:
-        logger.error(f"Erro ao carregar dados de {file_path}: {str(e)}")
-        return None, f"Erro: {str(e)}", None
 
+def _create_combined_heatmap(grid: HeatmapGrid, side: str = None, include_plotlyjs: bool = True):
+    import plotly.io as pio
 
-def _create_combined_heatmap(bids_df: pd.DataFrame, asks_df: pd.DataFrame, avg_price: float, side: str = None):
     try:
-        if (bids_df is None or bids_df.empty) and (asks_df is None or asks_df.empty):
+        if grid is None or grid.empty:
             return "<p style='color:red;'>Dados insuficientes</p>"
 
-        # Filtra conforme o lado
-        if side == "bid":
-            combined_df = bids_df.assign(tipo="BID")
-        elif side == "ask":
-            combined_df = asks_df.assign(tipo="ASK")
-        else:
-            combined_df = pd.concat([bids_df.assign(tipo="BID"), asks_df.assign(tipo="ASK")])
-
-        # Prepara malha de grid
-        price_buckets = np.sort(combined_df["price_bucket"].unique())
-        time_buckets = np.sort(combined_df["time_bucket"].unique())
-        index_grid = pd.MultiIndex.from_product([price_buckets, time_buckets], names=["price_bucket", "time_bucket"])
-
-        grouped = (
-            combined_df.groupby(["price_bucket", "time_bucket"])["volume"]
-            .sum()
-            .reindex(index_grid, fill_value=0)
-            .sort_index()
-        )
-
-        z = grouped.values
-        z_normalized = (z - np.min(z)) / (np.max(z) - np.min(z) + 0.001)
-        z_normalized = np.nan_to_num(z_normalized, nan=0, posinf=1, neginf=0)
-
-        pivot = grouped.reset_index()
-        time_labels = pivot["time_bucket"].dt.strftime("%d, %H:%M").unique()
-        price_labels = [f"{p:.2f}" for p in sorted(price_buckets)]
-
-        # Linha de preço de mercado (usando média de current_price)
-        market_prices = combined_df
-        market_line = market_prices.groupby(market_prices["timestamp"].dt.floor("5min"))["current_price"].mean()
-        market_line = market_line.reindex(time_buckets, method="nearest").fillna(method="ffill")
-
-        line_y = []
-        for price in market_line:
-            closest_bucket = price_buckets[np.abs(price_buckets - price).argmin()]
-            line_y.append(f"{closest_bucket:.2f}")
-
-        # Escolher cores conforme o lado
-        if side == "ask":
-            colorscale = [
-                [0.0, "#520D6B"],
-                [0.2, "#3111A4"],
-                [0.4, "#1717d8"],
-                [0.6, "#0d49ff"],
-                [0.8, "#d7f209"],
-                [1.0, "#d4ca0c"]
-            ]
-        elif side == "bid":
-            colorscale = [
-                [0.0, "#520D6B"],
-                [0.2, "#3111A4"],
-                [0.4, "#1717d8"],
-                [0.6, "#0d49ff"],
-                [0.8, "#d7f209"],
-                [1.0, "#d4ca0c"]
-            ]
-        else:
-            colorscale = [
-                [0.0, "#520D6B"],
-                [0.2, "#3111A4"],
-                [0.4, "#1717d8"],
-                [0.6, "#0d49ff"],
-                [0.8, "#d7f209"],
-                [1.0, "#d4ca0c"]
-            ]
-
-        fig = go.Figure()
-
-        fig.add_trace(go.Heatmap(
-            z=z_normalized.reshape(len(price_buckets), len(time_buckets)),
-            x=time_labels,
-            y=price_labels,
-            colorscale=colorscale,
-            zmin=0,
-            zmax=1,
-            colorbar=dict(title="Volume Normalizado")
-        ))
-
-        fig.add_trace(go.Scatter(
-            x=time_labels,
-            y=line_y,
-            mode="lines+markers",
-            name="Preço de Mercado",
-            line=dict(color="white", width=2),
-            marker=dict(size=4, color="white")
-        ))
-
-        titulo = f"Heatmap de Liquidez – {side.upper()}" if side in ("ask", "bid") else "Heatmap de Liquidez – ASK + BID"
-
-        fig.update_layout(
-            title=dict(text=titulo, x=0.5),
-            xaxis_title="Tempo (Horário Local)",
-            yaxis_title="Faixa de Preço",
-            height=500,
-            margin=dict(t=40, b=50, l=40, r=60),
-            plot_bgcolor="white",
-            paper_bgcolor="white",
-            font=dict(color="black")
-        )
-
-        return pio.to_html(fig, full_html=False)
+        with metrics.span("heatmap.figure", rows=int(grid.z.size)):
+            fig = _heatmap_figure(grid, side)
+        with metrics.span("heatmap.to_html") as serialized:
+            html = pio.to_html(fig, full_html=False, include_plotlyjs=include_plotlyjs)
+            serialized["bytes"] = len(html)
+        return html
 
     except Exception as e:
         return f"<p style='color:red;'>Erro ao gerar heatmap: {str(e)}</p>"
 
 
-def generate_heatmap_data(symbol: str, bucket_price: float = None, bucket_time: str = "5min", side: str = None):
-    bids_path = Path(f"data/bids/{symbol}.csv")
-    asks_path = Path(f"data/asks/{symbol}.csv")
-
-    bids_df, bids_err, bids_avg = _load_and_prepare_data(bids_path, bucket_price, bucket_time)
-    asks_df, asks_err, asks_avg = _load_and_prepare_data(asks_path, bucket_price, bucket_time)
-
-    if isinstance(bids_err, str) and side in (None, "bid"):
-        return f"<p style='color:red;'>Erro em bids: {bids_err}</p>"
-    if isinstance(asks_err, str) and side in (None, "ask"):
-        return f"<p style='color:red;'>Erro em asks: {asks_err}</p>"
-
-    avg_price = (bids_avg or 0) + (asks_avg or 0)
-    if side == "bid":
-        avg_price = bids_avg
-    elif side == "ask":
-        avg_price = asks_avg
-    else:
-        avg_price = (bids_avg + asks_avg) / 2
+def generate_heatmap_data(symbol: str, bucket_price: float = None, bucket_time: str = "5min", side: str = None,
+                          start: datetime = None, end: datetime = None, include_script: bool = True):
+    """
+    HTML do heatmap. Com `include_script=False` sai sem o Plotly.js (nem a tag
+    nem o embutido pelo plotly), para páginas com vários gráficos que carregam
+    o script uma vez só.
+    """
+    grid, err = build_heatmap_grid(symbol, bucket_price, bucket_time, side, start, end)
+    if isinstance(err, str):
+        return f"<p style='color:red;'>{err}</p>"
 
     return (
-        '<script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>'
-        '<div style="display: flex; flex-direction: column; gap: 20px; padding: 20px;">'
-        f'{_create_combined_heatmap(bids_df, asks_df, avg_price, side)}'
+        (PLOTLY_SCRIPT if include_script else '')
+        + '<div style="display: flex; flex-direction: column; gap: 20px; padding: 20px;">'
+        f'{_create_combined_heatmap(grid, side, include_script)}'
         '</div>'
     )
+
+
+def generate_heatmap_payload(symbol: str, bucket_price: float = None, bucket_time: str = "5min", side: str = None,
+                             start: datetime = None, end: datetime = None, encoding: str = "b64") -> tuple[dict | None, str | None]:
+    """
+    Versão de dados do heatmap (sem Plotly no servidor). Retorna (payload, erro).
+    """
+    grid, err = build_heatmap_grid(symbol, bucket_price, bucket_time, side, start, end)
+    if isinstance(err, str):
+        return None, err
+    with metrics.span("heatmap.payload", rows=int(grid.z.size)):
+        return heatmap_payload(symbol, side, grid, encoding), None
+
+
+def generate_heatmap_json(symbol: str, bucket_price: float = None, bucket_time: str = "5min", side: str = None,
+                          start: datetime = None, end: datetime = None, encoding: str = "b64") -> str:
+    """
+    Payload de `generate_heatmap_payload` já serializado em JSON (formato do
+    cache e do pool de renderização). Levanta FileNotFoundError se não houver dados.
+    """
+    payload, err = generate_heatmap_payload(symbol, bucket_price, bucket_time, side, start, end, encoding)
+    if isinstance(err, str):
+        raise FileNotFoundError(err)
+    with metrics.span("heatmap.serialize") as serialized:
+        body = json.dumps(payload, separators=(",", ":"))
+        serialized["bytes"] = len(body)
+    return body
@@ -0,0 +1,290 @@
+"""
+Agregados materializados do heatmap.
+
+Para cada símbolo/lado são mantidas somas de volume por (bucket de tempo,
+bucket de preço) nas resoluções padrão de `settings.aggregate_time_buckets` ×
+`settings.aggregate_price_buckets`. Cada novo snapshot gravado é incorporado
+incrementalmente (`refresh`), lendo do armazenamento apenas o que foi gravado
+depois do último cursor. Um heatmap numa resolução padrão vira a montagem de
+uma matriz densa a partir dessas linhas, com custo proporcional ao número de
+células e não ao número de linhas brutas.
+
+Cada linha de tempo guarda arrays esparsos ordenados (códigos de preço, somas),
+então resoluções finas sobre históricos longos não viram matrizes gigantes.
+Os agregados cobrem só as últimas `aggregate_horizon_hours` (e o que a
+retenção ainda não apagou do bruto); janelas que começam antes disso voltam
+para o cálculo sobre os dados guardados.
+"""
+import bisect
+import math
+import threading
+import time
+from functools import reduce
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import snapshot_store
+from app.services.book_levels import bucket_codes, group_cells
+from app.services.heatmap_grid import HeatmapGrid, bucket_seconds, sides_for
+
+
+class _Grid:
+    """
+    Somas de volume de uma resolução (tempo, preço): uma linha esparsa por bucket de tempo.
+    """
+
+    def __init__(self, time_seconds: int, price_size: float):
+        self.time_seconds = time_seconds
+        self.price_size = price_size
+        self.times: list[int] = []
+        self.rows: list[tuple[np.ndarray, np.ndarray]] = []
+
+    def add(self, time_bucket: int, codes: np.ndarray, sums: np.ndarray):
+        pos = bisect.bisect_left(self.times, time_bucket)
+        if pos < len(self.times) and self.times[pos] == time_bucket:
+            old_codes, old_sums = self.rows[pos]
+            merged, inverse = np.unique(np.concatenate([old_codes, codes]), return_inverse=True)
+            self.rows[pos] = (merged, np.bincount(inverse, weights=np.concatenate([old_sums, sums])))
+        else:
+            self.times.insert(pos, time_bucket)
+            self.rows.insert(pos, (codes, sums))
+
+    def window(self, start: int | None, end: int | None) -> tuple[list[int], list[tuple[np.ndarray, np.ndarray]]]:
+        first = 0 if start is None else bisect.bisect_left(self.times, start // self.time_seconds * self.time_seconds)
+        last = len(self.times) if end is None else bisect.bisect_right(self.times, end)
+        return self.times[first:last], self.rows[first:last]
+
+
+class _SideAggregates:
+    """
+    Estado incremental de um símbolo/lado: grids por resolução e preço médio por bucket.
+    """
+
+    def __init__(self, time_resolutions: list[int], price_sizes: list[float]):
+        self.lock = threading.Lock()
+        self.cursor = None
+        self.time_resolutions = time_resolutions
+        self.price_sizes = price_sizes
+        self.base_seconds = reduce(math.gcd, time_resolutions)
+        self.grids = {(t, p): _Grid(t, p) for t in time_resolutions for p in price_sizes}
+        # time_seconds → {bucket: [soma do current_price, quantidade de snapshots]}
+        self.market: dict[int, dict[int, list[float]]] = {t: {} for t in time_resolutions}
+
+    def fold(self, headers: np.ndarray, levels: np.ndarray):
+        """
+        Incorpora um lote de snapshots (cabeçalhos + níveis contíguos) em todas as resoluções.
+        """
+        counts = headers["count"]
+        row_times = np.repeat(headers["timestamp"], counts) // self.base_seconds * self.base_seconds
+        prices = np.asarray(levels["price"])
+        volumes = np.asarray(levels["volume"])
+
+        for price_size in self.price_sizes:
+            codes = bucket_codes(prices, price_size)
+            if codes.size == 0:
+                break
+            # Agrega primeiro na resolução de tempo base e depois sobe para as demais
+            base_times, base_codes, base_sums = group_cells(row_times, self.base_seconds, codes, volumes)
+            for time_seconds in self.time_resolutions:
+                if time_seconds == self.base_seconds:
+                    times, cell_codes, sums = base_times, base_codes, base_sums
+                else:
+                    times, cell_codes, sums = group_cells(base_times // time_seconds * time_seconds, time_seconds,
+                                                     base_codes, base_sums)
+                grid = self.grids[(time_seconds, price_size)]
+                bounds = np.concatenate([[0], np.flatnonzero(np.diff(times)) + 1, [len(times)]]).tolist()
+                for first, last in zip(bounds[:-1], bounds[1:]):
+                    grid.add(int(times[first]), cell_codes[first:last], sums[first:last])
+
+        for time_seconds in self.time_resolutions:
+            market = self.market[time_seconds]
+            for timestamp, current_price in zip(headers["timestamp"].tolist(), headers["current_price"].tolist()):
+                entry = market.setdefault(timestamp // time_seconds * time_seconds, [0.0, 0])
+                entry[0] += current_price
+                entry[1] += 1
+
+
+_states: dict[tuple[str, str], _SideAggregates] = {}
+_states_lock = threading.Lock()
+# Símbolo → início do histórico bruto até onde os agregados já foram podados
+_pruned: dict[str, int] = {}
+# Símbolo → quando `refresh` conferiu a poda pela última vez
+_prune_checked: dict[str, float] = {}
+# Intervalo mínimo entre conferências da poda feitas por `refresh` (a retenção roda de hora em hora)
+_PRUNE_CHECK_SECONDS = 60.0
+
+
+def _standard_resolutions() -> tuple[list[int], list[float]]:
+    time_resolutions = sorted({bucket_seconds(b) for b in settings.aggregate_time_buckets} - {None})
+    return time_resolutions, sorted(set(settings.aggregate_price_buckets))
+
+
+def _state(symbol: str, side: str) -> _SideAggregates:
+    key = (snapshot_store.symbol_key(symbol), side)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = _SideAggregates(*_standard_resolutions())
+        return state
+
+
+def enabled() -> bool:
+    return settings.storage_format != "csv" and bool(settings.aggregate_time_buckets) and bool(settings.aggregate_price_buckets)
+
+
+def _horizon() -> int | None:
+    # Início da janela coberta pelos agregados (None = todo o histórico bruto)
+    if settings.aggregate_horizon_hours <= 0:
+        return None
+    return int(time.time() - settings.aggregate_horizon_hours * 3600)
+
+
+def refresh(symbol: str):
+    """
+    Incorpora aos agregados os snapshots gravados desde a última atualização e
+    descarta o que saiu do horizonte ou a retenção já apagou (`prune_expired`).
+    Chamado depois de cada lote gravado e antes de cada consulta.
+    """
+    if not enabled():
+        return
+    horizon = _horizon()
+    for side in snapshot_store.SIDES:
+        state = _state(symbol, side)
+        with state.lock:
+            if state.cursor is None and horizon is not None:
+                # Carga inicial: começa no segmento que contém o início do horizonte
+                state.cursor = snapshot_store.cursor_at(symbol, side, horizon)
+            # Em blocos: a carga inicial percorre o histórico sem carregá-lo inteiro
+            for headers, levels, cursor in snapshot_store.iter_since(symbol, side, state.cursor):
+                state.fold(headers, levels)
+                state.cursor = cursor
+    # Também nos processos em que a retenção não roda (renderização); basta conferir de tempos em tempos
+    key = snapshot_store.symbol_key(symbol)
+    if time.monotonic() - _prune_checked.get(key, -math.inf) >= _PRUNE_CHECK_SECONDS:
+        _prune_checked[key] = time.monotonic()
+        prune_expired(symbol)
+
+
+def prune(symbol: str, before: int):
+    """
+    Descarta os buckets de tempo que terminam antes de `before` (dados brutos
+    já expirados pela retenção; janelas antigas são lidas das camadas).
+    """
+    for side in snapshot_store.SIDES:
+        with _states_lock:
+            state = _states.get((snapshot_store.symbol_key(symbol), side))
+        if state is None:
+            continue
+        with state.lock:
+            for grid in state.grids.values():
+                cut = bisect.bisect_right(grid.times, before - grid.time_seconds)
+                del grid.times[:cut], grid.rows[:cut]
+            for time_seconds, market in state.market.items():
+                for time_bucket in [t for t in market if t + time_seconds <= before]:
+                    del market[time_bucket]
+
+
+def prune_expired(symbol: str):
+    """
+    Poda os agregados até o início do horizonte (`aggregate_horizon_hours`) ou
+    até o snapshot bruto mais antigo ainda guardado, o que vier depois, se isso
+    mudou desde a última poda.
+    """
+    firsts = [snapshot_store.first_timestamp(symbol, side) for side in snapshot_store.SIDES]
+    limits = [first for first in firsts if first is not None]
+    if _horizon() is not None:
+        limits.append(_horizon())
+    key = snapshot_store.symbol_key(symbol)
+    if limits and _pruned.get(key) != max(limits):
+        prune(symbol, max(limits))
+        _pruned[key] = max(limits)
+
+
+def reset(symbol: str):
+    """
+    Descarta os agregados do símbolo (usado quando o histórico é apagado).
+    """
+    _pruned.pop(snapshot_store.symbol_key(symbol), None)
+    _prune_checked.pop(snapshot_store.symbol_key(symbol), None)
+    with _states_lock:
+        for side in snapshot_store.SIDES:
+            _states.pop((snapshot_store.symbol_key(symbol), side), None)
+
+
+def _pick_price_size(symbol: str, sides: tuple[str, ...], time_seconds: int, start: int | None, end: int | None) -> float | None:
+    """
+    Escolhe o bucket de preço padrão mais próximo do automático (faixa / 30).
+    Retorna None se nenhum padrão estiver a menos de um fator 2 dele.
+    """
+    finest = min(settings.aggregate_price_buckets)
+    code_min, code_max = None, None
+    for side in sides:
+        state = _state(symbol, side)
+        with state.lock:
+            _, rows = state.grids[(time_seconds, finest)].window(start, end)
+        for codes, _ in rows:
+            code_min = codes[0] if code_min is None else min(code_min, codes[0])
+            code_max = codes[-1] if code_max is None else max(code_max, codes[-1])
+    if code_min is None:
+        return None
+    auto = max((code_max - code_min) * finest / 30, 0.001)
+    best = min(settings.aggregate_price_buckets, key=lambda size: abs(math.log(size / auto)))
+    return best if abs(math.log(best / auto)) <= math.log(2) else None
+
+
+def query(symbol: str, side: str | None, bucket_price: float | None, bucket_time: str,
+          start: int | None = None, end: int | None = None) -> HeatmapGrid | None:
+    """
+    Monta o heatmap a partir dos agregados, ou retorna None se a resolução pedida
+    não for padrão (o chamador deve então calcular a partir dos dados brutos).
+    """
+    time_seconds = bucket_seconds(bucket_time)
+    if not enabled() or time_seconds is None or time_seconds not in _standard_resolutions()[0]:
+        return None
+
+    sides = sides_for(side)
+    if any(snapshot_store.read_plan(symbol, store_side, start, end)[0][0] is not None for store_side in sides):
+        # Parte da janela só existe nas camadas de retenção: o chamador lê de lá
+        return None
+    horizon = _horizon()
+    if horizon is not None and (start is None or start < horizon) and any(
+            (first := snapshot_store.first_timestamp(symbol, store_side)) is not None and first < horizon
+            for store_side in sides):
+        # A janela começa antes do horizonte dos agregados e há dados brutos lá
+        return None
+
+    refresh(symbol)
+    if bucket_price is None:
+        bucket_price = _pick_price_size(symbol, sides, time_seconds, start, end)
+        if bucket_price is None:
+            return None
+    elif bucket_price not in settings.aggregate_price_buckets:
+        return None
+
+    times_parts, codes_parts, sums_parts = [], [], []
+    market_sum, market_count = {}, {}
+    for store_side in sides:
+        state = _state(symbol, store_side)
+        with state.lock:
+            times, rows = state.grids[(time_seconds, bucket_price)].window(start, end)
+            for time_bucket, (codes, sums) in zip(times, rows):
+                times_parts.append(np.full(len(codes), time_bucket, dtype=np.int64))
+                codes_parts.append(codes)
+                sums_parts.append(sums)
+            if store_side == sides[0]:
+                for time_bucket in times:
+                    total, count = state.market[time_seconds][time_bucket]
+                    market_sum[time_bucket], market_count[time_bucket] = total, count
+
+    if not times_parts:
+        empty = np.empty(0)
+        return HeatmapGrid(empty, empty.astype(np.int64), np.empty((0, 0)), empty, bucket_price, bucket_time)
+
+    time_buckets, time_idx = np.unique(np.concatenate(times_parts), return_inverse=True)
+    codes, price_idx = np.unique(np.concatenate(codes_parts), return_inverse=True)
+    z = np.zeros((len(codes), len(time_buckets)))
+    np.add.at(z, (price_idx, time_idx), np.concatenate(sums_parts))
+    market_price = np.array([market_sum[t] / market_count[t] if t in market_sum else np.nan
+                             for t in time_buckets.tolist()])
+    return HeatmapGrid(codes * bucket_price, time_buckets, z, market_price, bucket_price, bucket_time)
@@ -0,0 +1,55 @@
+"""
+Estrutura comum de um heatmap já agregado (matriz densa preço × tempo),
+compartilhada entre o caminho pré-agregado e o cálculo sobre dados brutos.
+"""
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+TIMEZONE = "America/Sao_Paulo"
+
+_BUCKET_UNITS = {"s": 1, "min": 60, "t": 60, "h": 3600, "d": 86400}
+_BUCKET_PATTERN = re.compile(r"^\s*(\d*)\s*(s|min|t|h|d)\s*$", re.IGNORECASE)
+
+
+def bucket_seconds(bucket_time: str) -> int | None:
+    """
+    Converte um intervalo no formato do pandas ("5min", "1h", "30s") em segundos.
+    Retorna None se o formato não for reconhecido.
+    """
+    match = _BUCKET_PATTERN.match(bucket_time or "")
+    if not match:
+        return None
+    amount = int(match.group(1) or 1)
+    return amount * _BUCKET_UNITS[match.group(2).lower()] or None
+
+
+def sides_for(side: str | None) -> tuple[str, ...]:
+    """
+    Traduz o filtro do endpoint ('bid', 'ask' ou vazio) nos lados do armazenamento.
+    """
+    if side == "bid":
+        return ("bids",)
+    if side == "ask":
+        return ("asks",)
+    return ("bids", "asks")
+
+
+@dataclass
+class HeatmapGrid:
+    """
+    Heatmap agregado: `z[i, j]` é o volume somado no bucket de preço
+    `price_buckets[i]` e no bucket de tempo `time_buckets[j]` (epoch em segundos,
+    início do bucket). `market_price[j]` é a média do `current_price` no bucket.
+    """
+    price_buckets: np.ndarray
+    time_buckets: np.ndarray
+    z: np.ndarray
+    market_price: np.ndarray
+    bucket_price: float
+    bucket_time: str
+
+    @property
+    def empty(self) -> bool:
+        return self.z.size == 0
@@ -0,0 +1,456 @@
+"""
+Pirâmide de tiles do heatmap, para zoom e pan com custo constante.
+
+O nível 0 é o mais grosso e cada nível seguinte divide pela metade o bucket de
+tempo e o de preço. No nível mais fino (`tile_levels - 1`) o bucket de tempo é
+`tile_finest_seconds` e o de preço é a potência de 2 mais próxima de
+`tile_finest_price_fraction` × o primeiro preço visto do símbolo (fixada no
+meta da pirâmide). Cada nível é dividido em tiles de `TILE_CELLS` × `TILE_CELLS`
+células (preço × tempo) com as somas de volume por lado; cada coluna de tiles
+tem também a soma e a contagem do `current_price` (linha do preço de mercado).
+
+Os tiles ficam em `data/tiles/<SÍMBOLO>/<lado>/<nível>/` e são estendidos
+incrementalmente (`refresh`, lendo do armazenamento só o que veio depois do
+cursor). A captura só avisa (`notify`): uma thread em segundo plano incorpora
+os snapshots novos a cada `tile_refresh_seconds`, fora do caminho da gravação,
+e cada consulta incorpora o que faltar antes de ler. A carga inicial (que
+percorre o histórico bruto) também só roda nessa thread: até ela terminar,
+`query` levanta `PyramidNotReady` em vez de montar a pirâmide na requisição. Os tiles alterados ficam
+em memória e vão para o disco no mesmo intervalo; o meta marca a gravação em
+andamento, e uma pirâmide encontrada no meio de uma gravação é refeita a
+partir dos snapshots brutos.
+
+`query` escolhe o nível mais fino em que a janela pedida cabe em `width` ×
+`height` células e monta só os tiles que a cobrem: o custo e o tamanho da
+resposta dependem da viewport, não da largura da janela nem do histórico.
+
+Como os agregados do heatmap, a pirâmide é mantida só pelo processo da API. A
+carga inicial usa os snapshots brutos existentes: o histórico que já só
+existe nas camadas de retenção não entra.
+"""
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import metrics, snapshot_store
+from app.services.book_levels import bucket_codes, group_cells
+from app.services.heatmap import heatmap_payload
+from app.services.heatmap_grid import HeatmapGrid, sides_for
+
+# Células por lado de um tile (tempo e preço)
+TILE_CELLS = 128
+# Uma viewport não pode passar disto × width × height células (janela maior que o nível 0 comporta)
+_MAX_OVERSIZE = 16
+
+
+class PyramidNotReady(Exception):
+    """
+    A pirâmide do símbolo ainda está na carga inicial, em segundo plano.
+    """
+
+
+def tiles_dir(symbol: str) -> Path:
+    return snapshot_store.DATA_DIR / "tiles" / snapshot_store.symbol_key(symbol)
+
+
+class _Pyramid:
+    """
+    Estado de um símbolo: cursores por lado, faixas de tempo/preço já vistas,
+    tiles carregados (LRU) e os alterados desde a última gravação.
+    """
+
+    def __init__(self, symbol: str):
+        self.directory = tiles_dir(symbol)
+        self.lock = threading.Lock()
+        self.levels = settings.tile_levels
+        self.finest_seconds = settings.tile_finest_seconds
+        self.finest_price: float | None = None
+        self.cursors: dict[str, tuple[str, int] | None] = {side: None for side in snapshot_store.SIDES}
+        self.time_range: list[int] | None = None
+        self.price_range: list[float] | None = None
+        # Maior distância já vista entre um nível e o current_price (faixa padrão de preço da viewport)
+        self.depth = 0.0
+        # (lado, nível, tx, ty) → volumes [preço, tempo]; ty None = mercado [soma, contagem] por coluna
+        self.tiles: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self.dirty: set[tuple] = set()
+        # Em meio a um `refresh` (cursores ainda não avançados)
+        self.folding = False
+        # Já alcançou o fim do histórico gravado neste processo (carga inicial concluída)
+        self.ready = False
+        self.flushed_at = time.monotonic()
+        self._load_meta()
+
+    def _meta(self) -> dict:
+        return {
+            "levels": self.levels,
+            "finest_seconds": self.finest_seconds,
+            "finest_price_fraction": settings.tile_finest_price_fraction,
+            "tile_cells": TILE_CELLS,
+        }
+
+    def _load_meta(self):
+        path = self.directory / "meta.json"
+        if not path.exists():
+            return
+        with open(path) as f:
+            meta = json.load(f)
+        if meta.get("writing") or any(meta.get(name) != value for name, value in self._meta().items()):
+            # Gravação interrompida ou parâmetros diferentes: refaz do histórico bruto
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+        self.finest_price = meta["finest_price"]
+        self.cursors = {side: tuple(cursor) if cursor else None for side, cursor in meta["cursors"].items()}
+        self.time_range = meta["time_range"]
+        self.price_range = meta["price_range"]
+        self.depth = meta["depth"]
+
+    def _write_meta(self, writing: bool):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / "meta.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({**self._meta(), "writing": writing, "finest_price": self.finest_price,
+                       "cursors": self.cursors, "time_range": self.time_range, "price_range": self.price_range, "depth": self.depth}, f)
+        os.replace(tmp, path)
+
+    def resolution(self, level: int) -> tuple[int, float]:
+        """
+        (segundos, tamanho do bucket de preço) do nível.
+        """
+        scale = 2 ** (self.levels - 1 - level)
+        return self.finest_seconds * scale, self.finest_price * scale
+
+    def _path(self, key: tuple) -> Path:
+        side, level, tx, ty = key
+        return self.directory / side / str(level) / (f"{tx}_m.npz" if ty is None else f"{tx}_{ty}.npz")
+
+    def tile(self, key: tuple, create: bool = False) -> np.ndarray | None:
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        path = self._path(key)
+        if path.exists():
+            with np.load(path) as stored:
+                tile = stored["values"]
+        elif create:
+            tile = np.zeros((2 if key[3] is None else TILE_CELLS, TILE_CELLS))
+        else:
+            return None
+        self.tiles[key] = tile
+        while len(self.tiles) > max(settings.tile_cache_tiles, 1):
+            oldest = next(iter(self.tiles))
+            if oldest in self.dirty:
+                # Tile alterado prestes a sair da memória: grava os pendentes
+                self.flush(complete=not self.folding)
+            del self.tiles[oldest]
+        return tile
+
+    def flush(self, complete: bool = True):
+        """
+        Grava os tiles alterados. Com `complete=False` (no meio de um lote) o meta
+        continua marcado como em gravação até a próxima gravação completa.
+        """
+        with metrics.span("tiles.flush", rows=len(self.dirty)):
+            self._write_meta(writing=True)
+            for key in self.dirty:
+                path = self._path(key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                with open(tmp, "wb") as f:
+                    np.savez_compressed(f, values=self.tiles[key])
+                os.replace(tmp, path)
+            self.dirty.clear()
+            self._write_meta(writing=not complete)
+        self.flushed_at = time.monotonic()
+
+    def _add(self, side: str, level: int, time_codes: np.ndarray, price_codes: np.ndarray, sums: np.ndarray):
+        # Pares (tempo, preço) já únicos: agrupa por tile e soma direto nas células
+        tx, ty = time_codes // TILE_CELLS, price_codes // TILE_CELLS
+        tile_ids = (tx - tx.min()) * (int(ty.max() - ty.min()) + 1) + (ty - ty.min())
+        order = np.argsort(tile_ids, kind="stable")
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(tile_ids[order])) + 1, [len(order)]]).tolist()
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            rows = order[first:last]
+            key = (side, level, int(tx[rows[0]]), int(ty[rows[0]]))
+            self.tile(key, create=True)[price_codes[rows] % TILE_CELLS, time_codes[rows] % TILE_CELLS] += sums[rows]
+            self.dirty.add(key)
+
+    def _add_market(self, side: str, level: int, column_codes: np.ndarray, current_prices: np.ndarray):
+        codes, inverse = np.unique(column_codes, return_inverse=True)
+        price_sums = np.bincount(inverse, weights=current_prices)
+        counts = np.bincount(inverse)
+        for tx in np.unique(codes // TILE_CELLS).tolist():
+            mask = codes // TILE_CELLS == tx
+            key = (side, level, tx, None)
+            market = self.tile(key, create=True)
+            market[0, codes[mask] % TILE_CELLS] += price_sums[mask]
+            market[1, codes[mask] % TILE_CELLS] += counts[mask]
+            self.dirty.add(key)
+
+    def fold(self, side: str, headers: np.ndarray, levels: np.ndarray):
+        """
+        Incorpora um lote de snapshots (cabeçalhos + níveis contíguos) em todos os níveis.
+        """
+        timestamps = headers["timestamp"]
+        current_prices = headers["current_price"]
+        if self.finest_price is None:
+            reference = float(current_prices[0]) if current_prices[0] > 0 else 1.0
+            self.finest_price = 2.0 ** round(math.log2(reference * settings.tile_finest_price_fraction))
+        prices = np.asarray(levels["price"])
+        volumes = np.asarray(levels["volume"])
+        row_times = np.repeat(timestamps, headers["count"])
+
+        first, last = int(timestamps.min()), int(timestamps.max())
+        self.time_range = [first, last] if self.time_range is None else \
+            [min(self.time_range[0], first), max(self.time_range[1], last)]
+        if len(prices):
+            low, high = float(prices.min()), float(prices.max())
+            self.price_range = [low, high] if self.price_range is None else \
+                [min(self.price_range[0], low), max(self.price_range[1], high)]
+            self.depth = max(self.depth, float(np.abs(prices - np.repeat(current_prices, headers["count"])).max()))
+
+        for level in range(self.levels):
+            seconds, size = self.resolution(level)
+            if len(prices):
+                self._add(side, level, *group_cells(row_times // seconds, 1, bucket_codes(prices, size), volumes))
+            self._add_market(side, level, timestamps // seconds, current_prices)
+
+    def market_range(self, side: str, start: int, end: int, width: int, height: int) -> tuple[float, float] | None:
+        """
+        Menor e maior preço de mercado da janela (no nível que o tempo permite), ou None.
+        """
+        level = self.level_for(end - start, 0.0, width, height)
+        seconds, _ = self.resolution(level)
+        t0, t1 = start // seconds, end // seconds
+        low, high = math.inf, -math.inf
+        for tx in range(t0 // TILE_CELLS, t1 // TILE_CELLS + 1):
+            market = self.tile((side, level, tx, None))
+            if market is None:
+                continue
+            first, last = max(t0 - tx * TILE_CELLS, 0), min(t1 - tx * TILE_CELLS, TILE_CELLS - 1)
+            counts = market[1, first:last + 1]
+            if counts.any():
+                means = market[0, first:last + 1][counts > 0] / counts[counts > 0]
+                low, high = min(low, float(means.min())), max(high, float(means.max()))
+        return (low, high) if low <= high else None
+
+    def level_for(self, seconds_span: float, price_span: float, width: int, height: int) -> int:
+        """
+        Nível mais fino em que a janela cabe em `width` × `height` células (senão o 0).
+        """
+        for level in range(self.levels - 1, -1, -1):
+            seconds, size = self.resolution(level)
+            if seconds_span / seconds + 1 <= width and price_span / size + 1 <= height:
+                return level
+        return 0
+
+
+_pyramids: dict[str, _Pyramid] = {}
+_pyramids_lock = threading.Lock()
+# Símbolos com snapshots novos desde a última passada da thread de atualização
+_pending: set[str] = set()
+_pending_lock = threading.Lock()
+# Antecipa a próxima passada (carga inicial pedida por uma consulta)
+_wake = threading.Event()
+_refresher: threading.Thread | None = None
+
+
+def _pyramid(symbol: str) -> _Pyramid:
+    key = snapshot_store.symbol_key(symbol)
+    with _pyramids_lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is None:
+            pyramid = _pyramids[key] = _Pyramid(symbol)
+        return pyramid
+
+
+def enabled() -> bool:
+    return settings.storage_format != "csv" and settings.tile_levels > 0
+
+
+def refresh(symbol: str):
+    """
+    Incorpora à pirâmide os snapshots gravados desde a última atualização e
+    grava os tiles alterados se a última gravação tiver mais de `tile_refresh_seconds`.
+    """
+    if not enabled():
+        return
+    pyramid = _pyramid(symbol)
+    with pyramid.lock, metrics.span("tiles.refresh", rows=0) as refreshed:
+        pyramid.folding = True
+        try:
+            for side in snapshot_store.SIDES:
+                for headers, levels, cursor in snapshot_store.iter_since(symbol, side, pyramid.cursors[side]):
+                    pyramid.fold(side, headers, levels)
+                    pyramid.cursors[side] = cursor
+                    refreshed["rows"] += len(levels)
+        finally:
+            pyramid.folding = False
+        pyramid.ready = True
+        if pyramid.dirty and time.monotonic() - pyramid.flushed_at >= settings.tile_refresh_seconds:
+            pyramid.flush()
+
+
+def notify(symbol: str):
+    """
+    Avisa que há snapshots novos do símbolo (chamado após cada lote gravado);
+    a pirâmide é estendida na próxima passada da thread de atualização.
+    """
+    _schedule(symbol, wake=False)
+
+
+def _schedule(symbol: str, wake: bool):
+    global _refresher
+    if not enabled():
+        return
+    with _pending_lock:
+        _pending.add(symbol)
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = threading.Thread(target=_refresh_loop, name="tiles-refresher", daemon=True)
+            _refresher.start()
+    if wake:
+        _wake.set()
+
+
+def _refresh_loop():
+    while True:
+        _wake.wait(settings.tile_refresh_seconds)
+        _wake.clear()
+        with _pending_lock:
+            symbols = list(_pending)
+            _pending.clear()
+        for symbol in symbols:
+            try:
+                refresh(symbol)
+            except Exception as e:
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [tiles] Erro ao atualizar a pirâmide de {symbol}: {e}")
+        # Tiles alterados por consultas ou por símbolos que pararam de receber snapshots
+        flush(older_than=settings.tile_refresh_seconds)
+
+
+def flush(older_than: float = 0.0):
+    """
+    Grava os tiles alterados de todos os símbolos cuja última gravação tenha
+    mais de `older_than` segundos (ao parar a captura, todos).
+    """
+    with _pyramids_lock:
+        pyramids = list(_pyramids.values())
+    for pyramid in pyramids:
+        with pyramid.lock:
+            if pyramid.dirty and time.monotonic() - pyramid.flushed_at >= older_than:
+                pyramid.flush()
+
+
+def reset(symbol: str):
+    """
+    Apaga a pirâmide do símbolo (usado quando o histórico é apagado).
+    """
+    with _pyramids_lock:
+        pyramid = _pyramids.pop(snapshot_store.symbol_key(symbol), None)
+    if pyramid is not None:
+        with pyramid.lock:
+            shutil.rmtree(pyramid.directory, ignore_errors=True)
+    else:
+        shutil.rmtree(tiles_dir(symbol), ignore_errors=True)
+
+
+def query(symbol: str, side: str | None, start: int | None = None, end: int | None = None,
+          price_min: float | None = None, price_max: float | None = None,
+          width: int = 512, height: int = 256) -> tuple[HeatmapGrid, int, dict] | None:
+    """
+    Heatmap da viewport (janela de tempo × faixa de preço), no nível mais fino
+    que cabe em `width` × `height`. Sem janela, vale todo o histórico da
+    pirâmide; sem faixa de preço, o preço de mercado da janela ± a maior
+    distância já vista entre um nível do livro e o preço.
+    Retorna (grid, nível, limites dos dados) ou None se não houver dados.
+    Levanta ValueError para janelas inválidas e PyramidNotReady enquanto a
+    carga inicial (pedida aqui, se ainda não estava) não terminar.
+    """
+    pyramid = _pyramid(symbol)
+    if not pyramid.ready:
+        # A carga inicial percorre todo o histórico: fica com a thread de atualização
+        _schedule(symbol, wake=True)
+        raise PyramidNotReady(f"Pirâmide de tiles de {symbol} em montagem; tente novamente em instantes")
+    refresh(symbol)
+    with pyramid.lock, metrics.span("tiles.query") as queried:
+        if pyramid.time_range is None or pyramid.price_range is None:
+            return None
+        bounds = {"start": pyramid.time_range[0], "end": pyramid.time_range[1],
+                  "price_min": pyramid.price_range[0], "price_max": pyramid.price_range[1]}
+        start = bounds["start"] if start is None else start
+        end = bounds["end"] if end is None else end
+        if end < start:
+            raise ValueError("Janela inválida: o fim vem antes do início")
+        sides = sides_for(side)
+        if price_min is None or price_max is None:
+            # Faixa padrão: preço de mercado da janela ± a profundidade do livro
+            span = pyramid.market_range(sides[0], start, end, width, height)
+            low, high = (span[0] - pyramid.depth, span[1] + pyramid.depth) if span else \
+                (bounds["price_min"], bounds["price_max"])
+            price_min = max(low, bounds["price_min"]) if price_min is None else price_min
+            price_max = min(high, bounds["price_max"]) if price_max is None else price_max
+        if price_max < price_min:
+            raise ValueError("Faixa de preço inválida: price_max menor que price_min")
+
+        level = pyramid.level_for(end - start, price_max - price_min, width, height)
+        seconds, size = pyramid.resolution(level)
+        t0, t1 = start // seconds, end // seconds
+        c0, c1 = math.floor(price_min / size), math.floor(price_max / size)
+        if (t1 - t0 + 1) * (c1 - c0 + 1) > _MAX_OVERSIZE * width * height:
+            raise ValueError("Janela grande demais para a pirâmide: reduza o período ou a faixa de preço")
+
+        z = np.zeros((c1 - c0 + 1, t1 - t0 + 1))
+        market = np.zeros((2, t1 - t0 + 1))
+        tiles = 0
+        for tx in range(t0 // TILE_CELLS, t1 // TILE_CELLS + 1):
+            col_lo, col_hi = max(t0, tx * TILE_CELLS), min(t1, tx * TILE_CELLS + TILE_CELLS - 1)
+            cols = slice(col_lo - t0, col_hi - t0 + 1)
+            tile_cols = slice(col_lo - tx * TILE_CELLS, col_hi - tx * TILE_CELLS + 1)
+            market_tile = pyramid.tile((sides[0], level, tx, None))
+            if market_tile is not None:
+                market[:, cols] += market_tile[:, tile_cols]
+            for store_side in sides:
+                for ty in range(c0 // TILE_CELLS, c1 // TILE_CELLS + 1):
+                    tile = pyramid.tile((store_side, level, tx, ty))
+                    if tile is None:
+                        continue
+                    row_lo, row_hi = max(c0, ty * TILE_CELLS), min(c1, ty * TILE_CELLS + TILE_CELLS - 1)
+                    z[row_lo - c0:row_hi - c0 + 1, cols] += tile[row_lo - ty * TILE_CELLS:row_hi - ty * TILE_CELLS + 1,
+                                                               tile_cols]
+                    tiles += 1
+        queried["rows"] = int(z.size)
+
+    market_price = np.divide(market[0], market[1], out=np.full(market.shape[1], np.nan), where=market[1] > 0)
+    grid = HeatmapGrid(np.arange(c0, c1 + 1) * size, np.arange(t0, t1 + 1, dtype=np.int64) * seconds, z,
+                       market_price, size, f"{seconds}s")
+    return grid, level, {**bounds, "tiles": tiles}
+
+
+def viewport_json(symbol: str, side: str | None, start: int | None = None, end: int | None = None,
+                  price_min: float | None = None, price_max: float | None = None,
+                  width: int = 512, height: int = 256, encoding: str = "b64") -> str:
+    """
+    Viewport de `query` no formato de `/heatmap/data`, mais o nível usado, o
+    número de níveis e os limites dos dados. Levanta FileNotFoundError se não
+    houver dados e PyramidNotReady durante a carga inicial.
+    """
+    result = query(symbol, side, start, end, price_min, price_max, width, height)
+    if result is None:
+        raise FileNotFoundError(f"Pirâmide de tiles vazia: {symbol}")
+    grid, level, bounds = result
+    payload = heatmap_payload(symbol, side, grid, encoding)
+    payload.update(level=level, levels=settings.tile_levels, bounds=bounds)
+    with metrics.span("heatmap.serialize") as serialized:
+        body = json.dumps(payload, separators=(",", ":"))
+        serialized["bytes"] = len(body)
+    return body
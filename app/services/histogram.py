@@ -1,51 +1,107 @@
-from pathlib import Path
+import json
 from datetime import datetime, timedelta
-import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-import plotly.io as pio
+from app.services import metrics, snapshot_store
+from app.services.book_levels import bucket_codes
+from app.services.heatmap import PLOTLY_SCRIPT
 
 
-def _load_filtered_data(file_path: Path, minutes_back: int = 60) -> pd.DataFrame:
-    if not file_path.exists():
-        raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
-
-    df = pd.read_csv(file_path)
-    if not {"timestamp", "datetime_local", "price", "volume", "current_price"}.issubset(df.columns):
-        raise ValueError("Arquivo CSV inválido")
-
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
-    df["datetime_local"] = pd.to_datetime(df["datetime_local"])
-    df["price"] = pd.to_numeric(df["price"])
-    df["volume"] = pd.to_numeric(df["volume"])
-    df["current_price"] = pd.to_numeric(df["current_price"])
-
-    if minutes_back > 0:
-        time_limit = datetime.utcnow() - timedelta(minutes=minutes_back)
-        df = df[df["timestamp"] >= time_limit]
-
-    return df
-
-
-def _create_histogram(df: pd.DataFrame, title_base: str, side: str, top: int = None, bucket_size: float = 100.0):
-    if df.empty:
-        return f"<p style='color:red;'>{title_base} – Dados insuficientes</p>"
-
-    df["price_bucket"] = (df["price"] // bucket_size) * bucket_size
-    grouped = df.groupby("price_bucket")["volume"].sum().reset_index()
+def _sum_by_code(codes: np.ndarray, volumes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Soma `volumes` por código de bucket. Retorna (códigos ocupados em ordem, somas).
+    """
+    code_min = int(codes.min())
+    span = int(codes.max()) - code_min + 1
+    if span <= max(4 * len(codes), 1 << 16):
+        # Faixa compacta: contagem densa, sem ordenar o bloco
+        offsets = codes - code_min
+        occupied = np.flatnonzero(np.bincount(offsets, minlength=span))
+        return occupied + code_min, np.bincount(offsets, weights=volumes, minlength=span)[occupied]
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    return unique_codes, np.bincount(inverse, weights=volumes)
+
+
+def _accumulate(symbol: str, side: str, minutes_back: int = 60, start: datetime = None, end: datetime = None,
+                bucket_size: float = 100.0) -> dict | None:
+    """
+    Percorre a janela pedida em blocos (`snapshot_store.iter_snapshots`) e
+    mantém só os totais: volume por faixa de preço, preço de mercado do último
+    snapshot e timestamp mais antigo. A janela é `[start, end]` quando
+    informados, senão os últimos `minutes_back` minutos (0 = todos os dados).
+    Retorna None se não houver dados.
+    """
+    if start is None and minutes_back > 0:
+        start = datetime.now() - timedelta(minutes=minutes_back)
+
+    codes, volumes = np.empty(0, dtype=np.int64), np.empty(0)
+    since, latest_timestamp, current_price = None, None, None
+    with metrics.span("histogram.accumulate", rows=0, nbytes=0) as accumulated:
+        for headers, levels in snapshot_store.iter_snapshots(symbol, side, snapshot_store.to_epoch(start),
+                                                             snapshot_store.to_epoch(end)):
+            accumulated["rows"] += len(levels)
+            accumulated["bytes"] += levels.nbytes + headers.nbytes
+            if len(levels):
+                chunk_codes, chunk_volumes = _sum_by_code(bucket_codes(levels["price"], bucket_size), levels["volume"])
+                codes, volumes = _sum_by_code(np.concatenate([codes, chunk_codes]),
+                                              np.concatenate([volumes, chunk_volumes]))
+
+            timestamps = headers["timestamp"]
+            since = int(timestamps.min()) if since is None else min(since, int(timestamps.min()))
+            # Último snapshot gravado entre os de maior timestamp
+            latest = len(timestamps) - 1 - int(np.argmax(timestamps[::-1]))
+            if latest_timestamp is None or timestamps[latest] >= latest_timestamp:
+                latest_timestamp = int(timestamps[latest])
+                current_price = float(headers["current_price"][latest])
+
+    if since is None:
+        if not snapshot_store.list_segments(symbol, side) and not snapshot_store.csv_path(symbol, side).exists():
+            raise FileNotFoundError(f"Dados não encontrados: {symbol} ({side})")
+        return None
+    return {"codes": codes, "volumes": volumes, "current_price": current_price, "since": since}
+
+
+def _histogram_bars(totals: dict | None, top: int = None, bucket_size: float = 100.0) -> dict | None:
+    """
+    Monta as barras a partir dos totais de `_accumulate` e identifica a faixa
+    do preço de mercado mais recente. Retorna None se não houver dados.
+    """
+    if totals is None:
+        return None
 
-    latest = df.sort_values("datetime_local", ascending=False).iloc[0]
-    current_price = latest["current_price"]
-    current_bucket = (current_price // bucket_size) * bucket_size
+    price_buckets, volumes = totals["codes"] * bucket_size, totals["volumes"]
+    current_price = totals["current_price"]
+    current_bucket = float(bucket_codes(current_price, bucket_size) * bucket_size)
 
     if top:
-        grouped = grouped.nlargest(top, "volume")
+        # Maiores volumes (empates resolvidos pela menor faixa), reapresentados em ordem de preço
+        keep = np.sort(np.argsort(-volumes, kind="stable")[:top])
+        price_buckets, volumes = price_buckets[keep], volumes[keep]
+
+    return {
+        "price_buckets": price_buckets,
+        "volumes": volumes,
+        "current_price": current_price,
+        "current_bucket": current_bucket,
+        "since": totals["since"],
+    }
+
+
+def _create_histogram(totals: dict | None, title_base: str, side: str, top: int = None, bucket_size: float = 100.0,
+                      include_plotlyjs: bool = True):
+    # Plotly é importado só no primeiro uso: a captura e a subida da API não o carregam
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    with metrics.span("histogram.bars"):
+        bars = _histogram_bars(totals, top, bucket_size)
+    if bars is None:
+        return f"<p style='color:red;'>{title_base} – Dados insuficientes</p>"
 
-    grouped = grouped.sort_values("price_bucket")
+    current_bucket = bars["current_bucket"]
 
     # Define cores com base no lado (ASK ou BID)
     colors = []
-    for pb in grouped["price_bucket"]:
+    for pb in bars["price_buckets"]:
         if abs(pb - current_bucket) < 1e-8:
             colors.append("yellow")  # current price
         elif side == "ASK" and pb > current_bucket:
@@ -55,49 +111,86 @@ def _create_histogram(df: pd.DataFrame, title_base: str, side: str, top: int = N
         else:
             colors.append("indigo")  # neutro
 
-    min_time = df["datetime_local"].min()
+    min_time = datetime.fromtimestamp(bars["since"])
     legenda_tempo = min_time.strftime("desde %H:%M do dia %d/%m")
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=[f"{p:.2f}" for p in grouped["price_bucket"]],
-        y=grouped["volume"],
-        marker_color=colors
-    ))
-
-    fig.update_layout(
-        title=f"{title_base} {legenda_tempo}",
-        xaxis_title="Faixa de Preço",
-        yaxis_title="Volume Total",
-        xaxis=dict(type="category"),
-        template="plotly_white",
-        height=400
-    )
-
-    return pio.to_html(fig, full_html=False)
-
-
-def generate_histograms(symbol: str, top: int = None, minutes: int = 60, bucket_size: float = 100.0):
+    with metrics.span("histogram.figure"):
+        fig = go.Figure()
+        fig.add_trace(go.Bar(
+            x=[f"{p:.2f}" for p in bars["price_buckets"]],
+            y=bars["volumes"],
+            marker_color=colors
+        ))
+
+        fig.update_layout(
+            title=f"{title_base} {legenda_tempo}",
+            xaxis_title="Faixa de Preço",
+            yaxis_title="Volume Total",
+            xaxis=dict(type="category"),
+            template="plotly_white",
+            height=400
+        )
+
+    with metrics.span("histogram.to_html") as serialized:
+        html = pio.to_html(fig, full_html=False, include_plotlyjs=include_plotlyjs)
+        serialized["bytes"] = len(html)
+    return html
+
+
+def generate_histograms(symbol: str, top: int = None, minutes: int = 60, bucket_size: float = 100.0,
+                        start: datetime = None, end: datetime = None, include_script: bool = True):
     """
     Gera histogramas de liquidez para bids e asks.
     - symbol: símbolo da cripto, ex: BTC
     - top: número de maiores barras a exibir
     - minutes: tempo de histórico a considerar (0 = todos)
     - bucket_size: tamanho do intervalo de preço para cada barra
+    - start/end: janela explícita (tem precedência sobre `minutes`)
+    - include_script: inclui a tag do Plotly.js (False em páginas com vários símbolos)
     """
-    bids_path = Path(f"data/bids/{symbol}.csv")
-    asks_path = Path(f"data/asks/{symbol}.csv")
-
-    bids_df = _load_filtered_data(bids_path, minutes_back=minutes)
-    asks_df = _load_filtered_data(asks_path, minutes_back=minutes)
+    bids_data = _accumulate(symbol, "bids", minutes_back=minutes, start=start, end=end, bucket_size=bucket_size)
+    asks_data = _accumulate(symbol, "asks", minutes_back=minutes, start=start, end=end, bucket_size=bucket_size)
 
-    bids_hist = _create_histogram(bids_df, f"Histograma de Liquidez – BIDS ({symbol})", side="BID", top=top, bucket_size=bucket_size)
-    asks_hist = _create_histogram(asks_df, f"Histograma de Liquidez – ASKS ({symbol})", side="ASK", top=top, bucket_size=bucket_size)
+    bids_hist = _create_histogram(bids_data, f"Histograma de Liquidez – BIDS ({symbol})", side="BID", top=top,
+                                  bucket_size=bucket_size, include_plotlyjs=include_script)
+    asks_hist = _create_histogram(asks_data, f"Histograma de Liquidez – ASKS ({symbol})", side="ASK", top=top,
+                                  bucket_size=bucket_size, include_plotlyjs=include_script)
 
     return (
-        '<script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>'
-        '<div style="display: flex; flex-direction: column; gap: 30px; padding: 20px;">'
+        (PLOTLY_SCRIPT if include_script else '')
+        + '<div style="display: flex; flex-direction: column; gap: 30px; padding: 20px;">'
         f'{asks_hist}'
         f'{bids_hist}'
         '</div>'
     )
+
+
+def generate_histogram_payload(symbol: str, top: int = None, minutes: int = 60, bucket_size: float = 100.0,
+                               start: datetime = None, end: datetime = None) -> dict:
+    """
+    Versão de dados dos histogramas (sem Plotly no servidor): faixas, volumes,
+    faixa do preço de mercado e início dos dados de cada lado.
+    """
+    payload = {"symbol": symbol, "bucket_size": bucket_size}
+    for side in ("asks", "bids"):
+        totals = _accumulate(symbol, side, minutes_back=minutes, start=start, end=end, bucket_size=bucket_size)
+        with metrics.span("histogram.bars"):
+            bars = _histogram_bars(totals, top, bucket_size)
+        if bars is not None:
+            bars["price_buckets"] = bars["price_buckets"].tolist()
+            bars["volumes"] = bars["volumes"].tolist()
+        payload[side] = bars
+    return payload
+
+
+def generate_histogram_json(symbol: str, top: int = None, minutes: int = 60, bucket_size: float = 100.0,
+                            start: datetime = None, end: datetime = None) -> str:
+    """
+    Payload de `generate_histogram_payload` já serializado em JSON (formato do
+    cache e do pool de renderização).
+    """
+    payload = generate_histogram_payload(symbol, top, minutes, bucket_size, start, end)
+    with metrics.span("histogram.serialize") as serialized:
+        body = json.dumps(payload, separators=(",", ":"))
+        serialized["bytes"] = len(body)
+    return body
@@ -0,0 +1,143 @@
+"""
+Heatmap ao vivo: depois de cada captura, envia aos navegadores conectados só a
+coluna do bucket de tempo mais recente (volumes por faixa de preço + preço de
+mercado), em vez de cada cliente recarregar e recalcular o grid inteiro.
+
+A coluna é calculada uma vez por visão (símbolo, lado, buckets) e a mesma
+mensagem é repassada a todos os inscritos nela. Cada inscrito tem uma fila
+limitada; quem não consome a tempo é desconectado (recebe um aviso para
+recarregar) em vez de segurar a captura ou acumular memória.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services.heatmap import build_heatmap_grid
+from app.services.heatmap_grid import bucket_seconds
+from app.services.snapshot_store import symbol_key
+
+
+class Subscriber:
+    """
+    Um navegador conectado. `None` na fila significa que ele foi descartado.
+    """
+
+    def __init__(self, symbol: str, view: tuple, queue_size: int):
+        self.symbol = symbol_key(symbol)
+        self.view = view
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+def column_message(symbol: str, view: tuple, timestamp: int) -> str | None:
+    """
+    Serializa a coluna do bucket de tempo que contém `timestamp`. Lê só a
+    janela desse bucket (agregados ou dados brutos).
+    """
+    side, bucket_price, bucket_time = view
+    step = bucket_seconds(bucket_time)
+    bucket_start = timestamp // step * step
+    grid, err = build_heatmap_grid(symbol, bucket_price, bucket_time, side,
+                                   start=datetime.fromtimestamp(bucket_start, tz=timezone.utc))
+    if isinstance(err, str) or grid.empty:
+        return None
+
+    volumes = grid.z[:, -1]
+    occupied = volumes != 0
+    market_price = float(grid.market_price[-1])
+    return json.dumps({
+        "time_bucket": int(grid.time_buckets[-1]),
+        "price_buckets": np.asarray(grid.price_buckets, dtype=np.float64)[occupied].tolist(),
+        "volumes": volumes[occupied].tolist(),
+        "market_price": None if np.isnan(market_price) else market_price,
+        "bucket_price": float(grid.bucket_price),
+        "timestamp": timestamp,
+    }, separators=(",", ":"))
+
+
+class LiveHeatmap:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[Subscriber]] = {}
+        self._publishing: dict[str, asyncio.Task] = {}
+        self._pending: dict[str, int] = {}
+        self.published = 0
+        self.messages = 0
+        self.dropped = 0
+
+    def subscribe(self, symbol: str, side: str | None, bucket_price: float | None, bucket_time: str) -> Subscriber:
+        subscriber = Subscriber(symbol, (side, bucket_price, bucket_time), self.queue_size)
+        self._subscribers.setdefault(subscriber.symbol, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.symbol)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.symbol]
+
+    def notify(self, symbol: str, timestamp: int):
+        """
+        Chamado pelo agendador após gravar um snapshot. Não bloqueia: o envio
+        roda numa task própria e, se a anterior ainda estiver em andamento,
+        só a captura mais recente é publicada em seguida.
+        """
+        key = symbol_key(symbol)
+        if not self._subscribers.get(key):
+            return
+        task = self._publishing.get(key)
+        if task is not None and not task.done():
+            self._pending[key] = timestamp
+            return
+        self._publishing[key] = asyncio.create_task(self._publish(symbol, key, timestamp))
+
+    async def _publish(self, symbol: str, key: str, timestamp: int):
+        while timestamp is not None:
+            subscribers = list(self._subscribers.get(key, ()))
+            views = {subscriber.view for subscriber in subscribers}
+            try:
+                messages = dict(zip(views, await asyncio.gather(
+                    *(asyncio.to_thread(column_message, symbol, view, timestamp) for view in views)
+                )))
+            except Exception as e:
+                print(f"[live] Erro ao montar coluna de {symbol}: {e}")
+                messages = {}
+
+            for subscriber in subscribers:
+                message = messages.get(subscriber.view)
+                if message is None or subscriber.dropped:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                    self.messages += 1
+                except asyncio.QueueFull:
+                    self._drop(subscriber)
+            self.published += 1
+            timestamp = self._pending.pop(key, None)
+
+    def _drop(self, subscriber: Subscriber):
+        """
+        Desconecta um cliente lento: descarta o que estava na fila dele e deixa
+        só o aviso de descarte.
+        """
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "messages": self.messages,
+            "dropped_clients": self.dropped,
+        }
+
+
+live_heatmap = LiveHeatmap(settings.live_queue_size)
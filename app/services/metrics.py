@@ -0,0 +1,276 @@
+"""
+Instrumentação dos caminhos quentes (captura, gravação, heatmap, histograma).
+
+`span("etapa")` mede o tempo de um trecho e soma as linhas/bytes processados
+em histogramas e contadores por etapa; tudo sai em `/metrics` no formato texto
+do Prometheus, junto com o atraso dos agendadores por símbolo, o atraso do
+event loop (`monitor_event_loop`) e os contadores que os módulos expõem via
+`register_collector`.
+
+Processos à parte (renderização e workers de captura) não servem `/metrics`:
+com `forwarding` ligado, as observações ficam pendentes e são enviadas ao
+processo da API (`drain` → `apply`), junto com o resultado da renderização ou
+no heartbeat do worker.
+
+Com `settings.profiling_enabled`, uma requisição com `?profile=1` (ou o
+cabeçalho `X-Profile: 1`) coleta as etapas pelas quais passou (`profiling`) e
+as devolve no cabeçalho `Server-Timing`.
+"""
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+PREFIX = "htf_"
+# Limites (segundos) dos histogramas de tempo
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Observações guardadas para envio ao processo da API (as mais antigas são descartadas)
+MAX_PENDING = 50_000
+# Intervalo de amostragem do atraso do event loop
+LOOP_MONITOR_SECONDS = 0.1
+
+_HELP = {
+    "stage_seconds": ("histogram", "Tempo de cada etapa instrumentada"),
+    "stage_rows_total": ("counter", "Linhas (níveis ou snapshots) processadas por etapa"),
+    "stage_bytes_total": ("counter", "Bytes processados por etapa"),
+    "scheduler_lag_seconds": ("histogram", "Atraso de cada disparo do agendador em relação ao limite do intervalo"),
+    "event_loop_lag_seconds": ("histogram", "Atraso do event loop da API em acordar um sleep"),
+    "event_loop_blocked_total": ("counter", "Amostras em que o event loop ficou bloqueado acima do limite"),
+    "http_request_seconds": ("histogram", "Tempo das requisições HTTP por rota"),
+}
+
+_profile: contextvars.ContextVar[list | None] = contextvars.ContextVar("profile", default=None)
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for k, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[k] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, _Histogram]] = {}
+        self._collectors: list[Callable[[], Iterable[tuple]]] = []
+        self.forwarding = False
+        self._pending: deque = deque(maxlen=MAX_PENDING)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        if self.forwarding:
+            self._pending.append(("counter", name, labels, value))
+            return
+        key = _key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if self.forwarding:
+            self._pending.append(("histogram", name, labels, value))
+            return
+        key = _key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(TIME_BUCKETS)
+            histogram.observe(value)
+
+    def drain(self) -> list[tuple]:
+        """
+        Retira as observações pendentes (processos com `forwarding`), para
+        enviá-las ao processo da API.
+        """
+        events = []
+        while self._pending:
+            events.append(self._pending.popleft())
+        return events
+
+    def apply(self, events: list[tuple]):
+        """
+        Incorpora as observações recebidas de outro processo.
+        """
+        for kind, name, labels, value in events:
+            if kind == "counter":
+                self.inc(name, value, **labels)
+            else:
+                self.observe(name, value, **labels)
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple]]):
+        """
+        `collector()` é chamado a cada leitura de `/metrics` e gera tuplas
+        (nome, tipo, ajuda, rótulos, valor) com contadores mantidos pelo módulo.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Todas as métricas no formato texto de exposição do Prometheus.
+        """
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in series.items()}
+                          for name, series in self.histograms.items()}
+
+        for name, series in sorted(counters.items()):
+            kind, help_text = _HELP.get(name, ("counter", name))
+            lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} {kind}"]
+            lines += [f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}" for key, value in sorted(series.items())]
+
+        for name, series in sorted(histograms.items()):
+            help_text = _HELP.get(name, ("histogram", name))[1]
+            lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} histogram"]
+            for key, (counts, total, count, buckets) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + (math.inf,), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {count}")
+
+        collected: dict[str, tuple[str, str, list]] = {}
+        for collector in self._collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    if value is not None:
+                        collected.setdefault(name, (kind, help_text, []))[2].append((_key(labels), value))
+            except Exception as e:
+                lines.append(f"# erro no coletor {getattr(collector, '__name__', collector)}: {e}")
+        for name, (kind, help_text, samples) in sorted(collected.items()):
+            lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} {kind}"]
+            lines += [f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}" for key, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(stage: str, rows: int = None, nbytes: int = None):
+    """
+    Mede o bloco como a etapa `stage` (histograma `stage_seconds`). Linhas e
+    bytes podem vir nos argumentos ou ser preenchidos dentro do bloco:
+
+        with span("heatmap.load") as s:
+            columns = ...
+            s["rows"] = len(columns["price"])
+    """
+    info = {"rows": rows, "bytes": nbytes}
+    started = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(stage, time.perf_counter() - started, info["rows"], info["bytes"])
+
+
+def record(stage: str, seconds: float, rows: int = None, nbytes: int = None):
+    """
+    Registra uma etapa já medida (também usado para as etapas vindas de outro processo).
+    """
+    registry.observe("stage_seconds", seconds, stage=stage)
+    if rows:
+        registry.inc("stage_rows_total", rows, stage=stage)
+    if nbytes:
+        registry.inc("stage_bytes_total", nbytes, stage=stage)
+    profile = _profile.get()
+    if profile is not None:
+        profile.append((stage, seconds, rows, nbytes))
+
+
+@contextmanager
+def profiling():
+    """
+    Coleta as etapas executadas dentro do bloco (inclusive em threads e no
+    pool de renderização, que repassam as suas). Gera a lista de
+    (etapa, segundos, linhas, bytes).
+    """
+    stages: list = []
+    token = _profile.set(stages)
+    try:
+        yield stages
+    finally:
+        _profile.reset(token)
+
+
+def current_profile() -> list | None:
+    return _profile.get()
+
+
+def extend_profile(stages: list):
+    """
+    Acrescenta ao perfil da requisição atual as etapas medidas em outro processo
+    (o histograma já foi atualizado por `apply`).
+    """
+    profile = _profile.get()
+    if profile is not None:
+        profile.extend(stages)
+
+
+def server_timing(stages: list, total_seconds: float) -> str:
+    """
+    Cabeçalho `Server-Timing` com o tempo somado por etapa, na ordem em que apareceram.
+    """
+    totals: dict[str, list] = {}
+    for stage, seconds, rows, nbytes in stages:
+        entry = totals.setdefault(stage, [0.0, 0, 0])
+        entry[0] += seconds
+        entry[1] += rows or 0
+        entry[2] += nbytes or 0
+    parts = []
+    for stage, (seconds, rows, nbytes) in totals.items():
+        description = ", ".join(part for part in (f"{rows} linhas" if rows else "", f"{nbytes} bytes" if nbytes else "") if part)
+        parts.append(f"{stage.replace('.', '_')};dur={seconds * 1000:.2f}" + (f';desc="{description}"' if description else ""))
+    parts.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(parts)
+
+
+async def monitor_event_loop(threshold_seconds: float):
+    """
+    Dorme `LOOP_MONITOR_SECONDS` em laço e mede quanto o event loop demora a
+    acordar além disso: o atraso vai para `event_loop_lag_seconds` e amostras
+    acima de `threshold_seconds` contam como bloqueio.
+    """
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_MONITOR_SECONDS)
+        lag = max(time.perf_counter() - started - LOOP_MONITOR_SECONDS, 0.0)
+        registry.observe("event_loop_lag_seconds", lag)
+        if lag > threshold_seconds:
+            registry.inc("event_loop_blocked_total")
@@ -1,79 +1,149 @@
+import asyncio
 import csv
-import requests
-from pathlib import Path
+import logging
+import httpx
 from datetime import datetime
 from app.config.settings import settings
+from app.services import candles, heatmap_aggregates, heatmap_tiles, metrics, snapshot_store
+from app.services.book_levels import OrderBook
+from app.services.snapshot_writer import snapshot_writer
 
+# O httpx registra cada requisição em INFO; com várias capturas por segundo isso só polui o log
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
-def get_current_price(symbol: str) -> float:
+# Cliente HTTP assíncrono compartilhado (pool de conexões keep-alive)
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Retorna o cliente HTTP assíncrono compartilhado, criando-o sob demanda.
+    Todas as capturas reutilizam as mesmas conexões com a exchange.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=settings.exchange_base_url,
+            timeout=settings.http_timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_connections,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    """
+    Fecha o cliente HTTP compartilhado, liberando as conexões do pool.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_current_price(symbol: str) -> float:
     """
     Consulta o preço atual de mercado da criptomoeda via API da Binance.
     """
-    url = "https://api.binance.com/api/v3/ticker/price"
-    response = requests.get(url, params={"symbol": symbol.upper()}, timeout=10)
+    with metrics.span("capture.fetch_price"):
+        response = await get_http_client().get("/api/v3/ticker/price", params={"symbol": symbol.upper()})
     response.raise_for_status()
     return float(response.json()["price"])
 
 
-def capture_order_book(symbol: str):
+def depth_limit_for(symbol: str) -> int:
     """
-    Captura os dados atuais do order book (bids e asks) da Binance
-    e adiciona nos arquivos .csv correspondentes, incluindo timestamp,
-    data legível e o preço de mercado no momento.
+    Profundidade capturada do símbolo (`depth_limits` por símbolo, senão `depth_limit`).
+    """
+    return settings.depth_limits.get(symbol.upper(), settings.depth_limit)
+
+
+async def fetch_depth(symbol: str, limit: int = None) -> dict:
+    """
+    Consulta o order book (bids e asks) atual do símbolo via API da Binance.
     """
-    base_url = "https://api.binance.com/api/v3/depth"
     params = {
         "symbol": symbol.upper(),
-        "limit": settings.depth_limit
+        "limit": limit or depth_limit_for(symbol)
     }
-    response = requests.get(base_url, params=params, timeout=10)
+    with metrics.span("capture.fetch_depth", nbytes=0) as fetch:
+        response = await get_http_client().get("/api/v3/depth", params=params)
+        fetch["bytes"] = len(response.content)
     response.raise_for_status()
-    data = response.json()
+    with metrics.span("capture.decode", nbytes=len(response.content)):
+        return response.json()
 
-    symbol_prefix = symbol.replace("USDT", "")
-    bids_path = Path(f"data/bids/{symbol_prefix}.csv")
-    asks_path = Path(f"data/asks/{symbol_prefix}.csv")
 
-    bids_path.parent.mkdir(parents=True, exist_ok=True)
-    asks_path.parent.mkdir(parents=True, exist_ok=True)
+async def capture_order_book(symbol: str, timestamp: int = None):
+    """
+    Captura os dados atuais do order book (bids e asks) da Binance
+    e grava no armazenamento configurado, incluindo timestamp,
+    data legível e o preço de mercado no momento.
+
+    As consultas de profundidade e de preço são feitas em paralelo; a
+    conversão do livro roda fora do event loop e a gravação é feita em lote
+    pelo writer. `timestamp` permite gravar o instante agendado (alinhado ao
+    relógio) em vez do instante da resposta. Retorna o timestamp gravado.
+    """
+    with metrics.span("capture.total") as total:
+        data, current_price = await asyncio.gather(fetch_depth(symbol), get_current_price(symbol))
 
-    current_price = get_current_price(symbol)
-    now = datetime.now()
-    timestamp = int(now.timestamp())
-    datetime_local = now.strftime("%Y-%m-%d %H:%M:%S")
+        if timestamp is None:
+            timestamp = int(datetime.now().timestamp())
+        datetime_local = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
 
-    _append_order_book_csv(bids_path, data["bids"], timestamp, datetime_local, current_price, symbol, "BID")
-    _append_order_book_csv(asks_path, data["asks"], timestamp, datetime_local, current_price, symbol, "ASK")
+        with metrics.span("capture.parse") as parse:
+            book = await asyncio.to_thread(OrderBook.from_depth, data)
+            parse["rows"] = total["rows"] = len(book.bids) + len(book.asks)
+        await write_order_book(symbol, book, timestamp, datetime_local, current_price)
+    return timestamp
+
+
+async def write_order_book(symbol: str, book: OrderBook, timestamp: int, datetime_local: str, current_price: float):
+    """
+    Entrega o snapshot ao writer e aguarda, sem bloquear o event loop, até o
+    lote em que ele entrou estar gravado.
+    """
+    with metrics.span("capture.write_wait"):
+        await asyncio.wrap_future(snapshot_writer.submit(symbol, book, timestamp, datetime_local, current_price))
+
+
+def store_order_book(symbol: str, book: OrderBook, timestamp: int, datetime_local: str, current_price: float):
+    """
+    Grava bids e asks de uma captura no armazenamento configurado
+    (colunar por padrão, ou os arquivos .csv legados), do melhor nível para o
+    pior. Versão síncrona: bloqueia até o lote do snapshot ser gravado.
+    """
+    snapshot_writer.submit(symbol, book, timestamp, datetime_local, current_price).result()
 
 
 def reset_order_book_files(symbol: str):
     """
-    Limpa os arquivos .csv e escreve apenas o cabeçalho no início da execução.
+    Apaga o histórico do símbolo. Só é chamado no início da captura com
+    `reset_history_on_start`; por padrão o histórico é preservado entre
+    execuções. No formato csv, deixa apenas o cabeçalho nos arquivos.
     """
-    symbol_prefix = symbol.replace("USDT", "")
-    bids_path = Path(f"data/bids/{symbol_prefix}.csv")
-    asks_path = Path(f"data/asks/{symbol_prefix}.csv")
+    if settings.storage_format != "csv":
+        for side in snapshot_store.SIDES:
+            snapshot_store.reset(symbol, side)
+        heatmap_aggregates.reset(symbol)
+        candles.reset(symbol)
+        heatmap_tiles.reset(symbol)
+        return
+
+    bids_path = snapshot_store.csv_path(symbol, "bids")
+    asks_path = snapshot_store.csv_path(symbol, "asks")
 
     bids_path.parent.mkdir(parents=True, exist_ok=True)
     asks_path.parent.mkdir(parents=True, exist_ok=True)
 
     with open(bids_path, "w", newline="") as f:
         writer = csv.writer(f)
-        writer.writerow(["timestamp", "datetime_local", "price", "volume", "current_price"])
+        writer.writerow(snapshot_store.CSV_COLUMNS)
 
     with open(asks_path, "w", newline="") as f:
         writer = csv.writer(f)
-        writer.writerow(["timestamp", "datetime_local", "price", "volume", "current_price"])
-
+        writer.writerow(snapshot_store.CSV_COLUMNS)
 
-def _append_order_book_csv(file_path: Path, entries: list, timestamp: int, datetime_local: str, current_price: float, symbol: str, side: str):
-    """
-    Acrescenta linhas no CSV com os dados capturados, incluindo timestamp,
-    data legível e preço atual. Também exibe no console o que será salvo.
-    """
-    with open(file_path, mode="a", newline="") as csv_file:
-        writer = csv.writer(csv_file)
-        for price, volume in entries:
-            row = [timestamp, datetime_local, price, volume, current_price]
-            print(f"[{datetime_local}] [{side}] {symbol} → {row}")
-            writer.writerow(row)
@@ -0,0 +1,126 @@
+"""
+Cache dos heatmaps/histogramas renderizados.
+
+As entradas são indexadas por (tipo, símbolo, lado, bucket de preço, bucket de
+tempo, janela) e descartadas por LRU quando passam do limite de entradas ou de
+bytes. O agendador invalida as entradas de um símbolo sempre que grava um novo
+snapshot dele. Requisições idênticas simultâneas compartilham um único cálculo.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from app.config.settings import settings
+from app.services import metrics
+from app.services.snapshot_store import symbol_key
+
+
+class RenderCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple[str, int]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._generations: dict[str, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(kind: str, symbol: str, side: str | None, bucket_price, bucket_time, window: tuple, *extra) -> tuple:
+        return (kind, symbol_key(symbol), side, bucket_price, bucket_time, window, *extra)
+
+    async def get_or_compute(self, key: tuple, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Retorna o valor em cache ou calcula com `compute`. Se o mesmo cálculo já
+        estiver em andamento, aguarda o resultado dele em vez de repeti-lo.
+
+        O cálculo roda numa task própria, que todos os interessados (inclusive
+        quem o iniciou) aguardam via `asyncio.shield`: o cancelamento de uma
+        requisição não cancela o cálculo para as outras que aguardam.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(key, compute))
+            # Evita o aviso de exceção não lida quando todos os interessados desistiram
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: tuple, compute: Callable[[], Awaitable[str]]) -> str:
+        generation = self._generations.get(key[1], 0)
+        try:
+            value = await compute()
+        finally:
+            self._inflight.pop(key, None)
+        # Só guarda se nenhum snapshot novo do símbolo chegou durante o cálculo
+        if generation == self._generations.get(key[1], 0):
+            self._store(key, value)
+        return value
+
+    def _store(self, key: tuple, value: str):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self, symbol: str):
+        """
+        Descarta as entradas do símbolo (chamado após cada snapshot gravado).
+        """
+        key_symbol = symbol_key(symbol)
+        self._generations[key_symbol] = self._generations.get(key_symbol, 0) + 1
+        for key in [key for key in self._entries if key[1] == key_symbol]:
+            _, size = self._entries.pop(key)
+            self._bytes -= size
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+render_cache = RenderCache(settings.render_cache_max_entries, settings.render_cache_max_bytes)
+
+
+def _collect_metrics():
+    stats = render_cache.stats()
+    yield "render_cache_entries", "gauge", "Entradas no cache de renderização", {}, stats["entries"]
+    yield "render_cache_bytes", "gauge", "Bytes ocupados pelo cache de renderização", {}, stats["bytes"]
+    for result in ("hits", "misses", "coalesced"):
+        yield "render_cache_lookups_total", "counter", "Consultas ao cache por resultado", {"result": result}, stats[result]
+    yield "render_cache_evictions_total", "counter", "Entradas descartadas por LRU", {}, stats["evictions"]
+
+
+metrics.registry.register_collector(_collect_metrics)
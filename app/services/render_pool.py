@@ -0,0 +1,203 @@
+"""
+Pool de processos para a renderização de heatmaps e histogramas.
+
+A leitura, a agregação e principalmente a serialização do Plotly/JSON seguram
+o GIL; numa thread, um heatmap grande ainda trava o event loop e todas as
+outras requisições (inclusive `/capture/status`). Aqui esse trabalho roda em
+até `render_workers` processos, com no máximo `render_queue_limit` renderizações
+aceitas (em execução + na fila). Acima disso, ou se o resultado não sair em
+`render_timeout_seconds`, o chamador recebe `RenderOverloaded` (503 nos
+endpoints) em vez de ficar esperando. Uma renderização que passou do tempo
+continua ocupando a vaga até o processo terminá-la, então o limite vale de fato.
+
+Cada processo mantém os próprios agregados do heatmap (das últimas
+`aggregate_horizon_hours`), carregados em segundo plano assim que o processo
+sobe e atualizados do disco a cada consulta (`heatmap_aggregates.refresh`). As etapas medidas no processo
+(`metrics.span`) voltam junto com o resultado e entram nas métricas e no
+perfil da requisição na API. Com `render_workers = 0` a renderização volta a
+rodar numa thread do processo da API.
+
+Os processos sobem no primeiro uso; com `render_warmup`, a API os sobe e
+aquece em segundo plano logo após iniciar (`warm_up`).
+"""
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import signal
+import threading
+from datetime import datetime
+from typing import Callable
+
+from app.config.settings import settings
+from app.services import metrics
+
+# Prioridade extra (nice) dos processos de renderização
+RENDER_NICE = 10
+
+_context = multiprocessing.get_context("spawn")
+
+
+class RenderOverloaded(Exception):
+    """
+    Fila de renderização cheia ou renderização acima do tempo limite.
+    """
+
+
+def _init_worker(overrides: dict):
+    # Replica a configuração da API, inclusive alterações feitas em tempo de execução
+    for name, value in type(settings)(**overrides):
+        setattr(settings, name, value)
+    # Com poucos núcleos, o processo da API tem prioridade sobre as renderizações
+    if hasattr(os, "nice"):
+        os.nice(RENDER_NICE)
+    # As métricas são servidas pela API: as observações voltam com cada resultado
+    metrics.registry.forwarding = True
+    # Ctrl+C chega a todo o grupo de processos: quem encerra o pool é a API
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Carga inicial dos agregados em segundo plano, em vez de na primeira consulta (sob o tempo limite)
+    threading.Thread(target=_warm_aggregates, name="aggregates-warmup", daemon=True).start()
+
+
+def _warm_aggregates():
+    from app.services import heatmap_aggregates
+
+    for symbol in settings.symbols:
+        try:
+            heatmap_aggregates.refresh(symbol)
+        except Exception as e:
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [render] Erro ao carregar os agregados de {symbol}: {e}")
+
+
+def _warm_up() -> int:
+    """
+    Carrega os módulos pesados da renderização (pandas e Plotly, importados só
+    no primeiro uso) e serializa uma figura mínima, para a primeira requisição
+    não pagar esse custo. Retorna o pid do processo aquecido.
+    """
+    # Só carrega o módulo: o pandas é usado pelas renderizações e importá-lo custa caro na primeira vez
+    import pandas  # noqa: F401
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    pio.to_html(go.Figure(go.Heatmap(z=[[0.0]])), full_html=False, include_plotlyjs=False)
+    return os.getpid()
+
+
+def _instrumented(func: Callable, args: tuple, kwargs: dict):
+    with metrics.profiling() as stages:
+        result = func(*args, **kwargs)
+    return result, metrics.registry.drain(), stages
+
+
+class RenderPool:
+    def __init__(self):
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=settings.render_workers, mp_context=_context,
+                initializer=_init_worker, initargs=(settings.model_dump(),),
+            )
+        return self._executor
+
+    def _release(self, future: concurrent.futures.Future):
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.errors += 1
+            else:
+                self.completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Executa `func(*args, **kwargs)` no pool e retorna o resultado. `func` e
+        os argumentos precisam ser serializáveis (funções de módulo, sem lambdas).
+        Levanta `RenderOverloaded` se a fila estiver cheia ou o tempo acabar.
+        """
+        if settings.render_workers <= 0:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+        with self._lock:
+            if self.pending >= settings.render_queue_limit:
+                self.rejected += 1
+                raise RenderOverloaded(f"Fila de renderização cheia ({self.pending} pendentes)")
+            self.pending += 1
+            self.submitted += 1
+        try:
+            future = self._get_executor().submit(_instrumented, func, args, kwargs)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            result, events, stages = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                                            settings.render_timeout_seconds)
+        except asyncio.TimeoutError:
+            # Some da fila se ainda não começou; se já está rodando, termina e libera a vaga sozinha
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise RenderOverloaded(f"Renderização passou de {settings.render_timeout_seconds:g}s")
+        except concurrent.futures.process.BrokenProcessPool:
+            # Um processo morreu (ex.: falta de memória): o próximo pedido cria um pool novo
+            self.shutdown(wait=False)
+            raise
+        metrics.registry.apply(events)
+        metrics.extend_profile(stages)
+        return result
+
+    def warm_up(self) -> list[int]:
+        """
+        Sobe os processos do pool e aquece cada um; com `render_workers = 0`,
+        aquece o próprio processo da API. Bloqueia até terminar (rodar numa thread).
+        """
+        if settings.render_workers <= 0:
+            return [_warm_up()]
+        # Um envio por processo: o executor cria um processo novo para cada tarefa sem processo livre
+        futures = [self._get_executor().submit(_warm_up) for _ in range(settings.render_workers)]
+        return sorted({future.result() for future in futures})
+
+    def shutdown(self, wait: bool = True):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "processos": settings.render_workers,
+                "limite_fila": settings.render_queue_limit,
+                "pendentes": self.pending,
+                "enviadas": self.submitted,
+                "concluidas": self.completed,
+                "recusadas": self.rejected,
+                "tempo_esgotado": self.timeouts,
+                "erros": self.errors,
+            }
+
+
+render_pool = RenderPool()
+
+
+def _collect_metrics():
+    stats = render_pool.stats()
+    yield "render_pending", "gauge", "Renderizações aceitas (em execução + na fila)", {}, stats["pendentes"]
+    for name, key, help_text in (("render_completed_total", "concluidas", "Renderizações concluídas"),
+                                 ("render_rejected_total", "recusadas", "Renderizações recusadas por fila cheia"),
+                                 ("render_timeouts_total", "tempo_esgotado", "Renderizações acima do tempo limite"),
+                                 ("render_errors_total", "erros", "Renderizações com erro")):
+        yield name, "counter", help_text, {}, stats[key]
+
+
+metrics.registry.register_collector(_collect_metrics)
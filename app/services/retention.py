@@ -0,0 +1,126 @@
+"""
+Retenção do histórico colunar em camadas.
+
+Os snapshots brutos são consolidados em camadas cada vez mais grossas
+(`settings.retention_tiers`, ex.: 1min × 1.0 e depois 1h × 10.0): cada bucket de
+tempo da camada guarda o volume somado por bucket de preço e o preço médio de
+mercado. A consolidação é incremental — cada camada continua a partir do
+último bucket que já tem — e só fecha buckets completos; a primeira camada
+sai dos dados brutos e cada camada seguinte sai da anterior.
+
+A expiração apaga segmentos inteiros: brutos mais antigos que
+`raw_retention_hours` e camadas mais antigas que o `retention_days` delas, mas
+só depois de o trecho estar consolidado na camada seguinte (a última camada
+expira só pelo prazo). As leituras escolhem a camada em `snapshot_store.read_plan`.
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.config.settings import RetentionTier, settings
+from app.services import heatmap_aggregates, snapshot_store
+from app.services.book_levels import bucket_codes, group_cells
+from app.services.heatmap_grid import bucket_seconds
+
+# Janela lida da camada de origem por vez (limita a memória da consolidação)
+CHUNK_SECONDS = 86400
+# Buckets que terminaram há menos que isto ainda podem receber capturas atrasadas
+SETTLE_SECONDS = 120
+
+
+def _roll_up(symbol: str, side: str, source: str | None, tier: RetentionTier, start: int, end: int) -> int:
+    """
+    Consolida na camada `tier` os dados de `source` (None = brutos) em `[start, end)`.
+    `start` e `end` são múltiplos da resolução da camada. Retorna os buckets gravados.
+    """
+    seconds = bucket_seconds(tier.bucket_time)
+    chunk = max(seconds, CHUNK_SECONDS // seconds * seconds)
+    written = 0
+    for chunk_start in range(start, end, chunk):
+        chunk_end = min(chunk_start + chunk, end)
+        headers, levels = snapshot_store.read_snapshots(symbol, side, chunk_start, chunk_end - 1, source)
+        if len(headers) == 0 or len(levels) == 0:
+            continue
+
+        header_buckets = headers["timestamp"] // seconds * seconds
+        codes = bucket_codes(np.asarray(levels["price"]), tier.bucket_price)
+        times, cell_codes, sums = group_cells(np.repeat(header_buckets, headers["count"]), seconds,
+                                              codes, np.asarray(levels["volume"]))
+
+        # Preço médio de mercado por bucket de tempo
+        buckets, inverse = np.unique(header_buckets, return_inverse=True)
+        market = np.bincount(inverse, weights=headers["current_price"]) / np.bincount(inverse)
+
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(times)) + 1, [len(times)]])
+        cell_buckets = times[bounds[:-1]]
+        snapshot_store.append_snapshots(
+            symbol, side,
+            cell_buckets.tolist(),
+            market[np.searchsorted(buckets, cell_buckets)].tolist(),
+            [np.column_stack([cell_codes[a:b] * tier.bucket_price, sums[a:b]])
+             for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist())],
+            tier=tier.bucket_time,
+        )
+        written += len(cell_buckets)
+    return written
+
+
+def _compact_side(symbol: str, side: str, now: float) -> dict:
+    result = {"buckets": {}, "segmentos_apagados": 0}
+
+    # Consolidação: bruto → primeira camada → segunda camada...
+    source = None
+    source_end = int(now) - SETTLE_SECONDS
+    for tier in settings.retention_tiers:
+        seconds = bucket_seconds(tier.bucket_time)
+        last = snapshot_store.last_timestamp(symbol, side, tier.bucket_time)
+        if last is not None:
+            start = last + seconds
+        else:
+            first = snapshot_store.first_timestamp(symbol, side, source)
+            start = None if first is None else first // seconds * seconds
+        end = source_end // seconds * seconds
+        if start is not None and start < end:
+            result["buckets"][tier.bucket_time] = _roll_up(symbol, side, source, tier, start, end)
+        source, source_end = tier.bucket_time, end
+
+    # Expiração: cada nível só perde o que a camada seguinte já consolidou
+    stores = [(None, settings.raw_retention_hours * 3600)] + \
+             [(tier.bucket_time, tier.retention_days * 86400) for tier in settings.retention_tiers]
+    for position, (store, keep_seconds) in enumerate(stores):
+        if keep_seconds <= 0:
+            continue
+        before = now - keep_seconds
+        if position + 1 < len(stores):
+            following = stores[position + 1][0]
+            last = snapshot_store.last_timestamp(symbol, side, following)
+            if last is None:
+                continue
+            before = min(before, last + bucket_seconds(following))
+        dropped = snapshot_store.drop_segments(symbol, side, int(before), store)
+        result["segmentos_apagados"] += len(dropped)
+
+    if settings.compress_closed_segments:
+        for tier in settings.retention_tiers:
+            snapshot_store.compress_closed(symbol, side, tier.bucket_time)
+    return result
+
+
+def compact(symbol: str) -> dict:
+    """
+    Consolida e expira o histórico do símbolo (os dois lados). Retorna um
+    resumo por lado: buckets gravados por camada e segmentos apagados.
+    """
+    if settings.storage_format == "csv":
+        return {}
+    now = time.time()
+    summary = {side: _compact_side(symbol, side, now) for side in snapshot_store.SIDES}
+
+    # Os agregados em memória só precisam cobrir o que ainda existe em bruto
+    heatmap_aggregates.prune_expired(symbol)
+
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [retention] {symbol} → "
+          + ", ".join(f"{side}: {result['buckets']} buckets, {result['segmentos_apagados']} segmentos apagados"
+                      for side, result in summary.items()))
+    return summary
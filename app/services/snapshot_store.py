@@ -0,0 +1,649 @@
+"""
+Armazenamento colunar binário dos snapshots de order book.
+
+Cada lado (bids/asks) de cada símbolo fica em `data/<lado>/<SÍMBOLO>/`, dividido
+em segmentos diários (UTC); um dia que passa de `segment_max_bytes` continua em
+`<AAAAMMDD>-001`, `<AAAAMMDD>-002`... Um segmento é formado por três arquivos
+append-only:
+
+- `<AAAAMMDD>.levels`: pares float64 (price, volume) de todos os níveis, em sequência;
+- `<AAAAMMDD>.snapshots`: um registro de cabeçalho por snapshot
+  (timestamp, current_price, quantidade de níveis);
+- `<AAAAMMDD>.index`: índice lateral (timestamp, linha inicial em `.levels`),
+  usado para localizar uma janela `[start, end]` por busca binária.
+
+A ordem de escrita é níveis → índice → cabeçalho e os leitores só consideram
+os cabeçalhos completos, então nunca leem um snapshot pela metade. Os appends
+não são atômicos entre si: uma gravação interrompida deixa bytes a mais em
+`.levels`/`.index` (ou um cabeçalho parcial), que o writer corta de volta ao
+tamanho dado pelos cabeçalhos na primeira gravação do segmento em cada
+processo (`_recover`), antes de acrescentar. Os leitores nunca alteram os
+arquivos; fazem memory-map e leem apenas as linhas da janela pedida.
+
+Segmentos fechados (que não são mais o último do símbolo/lado) podem ter o
+`.levels` comprimido em `.levels.gz`; cabeçalhos e índice continuam crus, então
+a busca da janela não muda e só as linhas lidas são descomprimidas.
+
+As camadas de retenção (`tiers/<bucket_time>/` dentro da pasta do símbolo/lado)
+usam o mesmo formato: cada "snapshot" de uma camada é um bucket de tempo, com
+o volume somado por bucket de preço. `read_columns` escolhe de qual camada ler.
+"""
+import csv
+import gzip
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services.heatmap_grid import bucket_seconds
+
+DATA_DIR = Path("data")
+SIDES = ("bids", "asks")
+LEVEL_DTYPE = np.dtype([("price", "<f8"), ("volume", "<f8")])
+HEADER_DTYPE = np.dtype([("timestamp", "<i8"), ("current_price", "<f8"), ("count", "<i8")])
+INDEX_DTYPE = np.dtype([("timestamp", "<i8"), ("offset", "<i8")])
+SEGMENT_SECONDS = 86400
+COMPRESS_LEVEL = 6
+CSV_COLUMNS = ["timestamp", "datetime_local", "price", "volume", "current_price"]
+
+# Segmentos já conferidos por `_recover` neste processo
+_recovered: set[Path] = set()
+
+
+def symbol_key(symbol: str) -> str:
+    """
+    Nome usado nos arquivos do símbolo (ex: BTCUSDT → BTC).
+    """
+    return symbol.upper().replace("USDT", "")
+
+
+def csv_path(symbol: str, side: str) -> Path:
+    return DATA_DIR / side / f"{symbol_key(symbol)}.csv"
+
+
+def store_dir(symbol: str, side: str, tier: str = None) -> Path:
+    """
+    Pasta dos segmentos brutos do símbolo/lado ou, com `tier`, de uma camada de retenção.
+    """
+    directory = DATA_DIR / side / symbol_key(symbol)
+    return directory if tier is None else directory / "tiers" / tier
+
+
+def to_epoch(value: datetime | None) -> int | None:
+    """
+    Converte um datetime em epoch (segundos). Datas sem fuso são tratadas
+    como horário local do servidor, como o `datetime_local` da captura.
+    """
+    return None if value is None else int(value.timestamp())
+
+
+def _segment_name(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _segment_start(segment: Path) -> int:
+    day = datetime.strptime(segment.name[:8], "%Y%m%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp())
+
+
+def list_segments(symbol: str, side: str, start: int = None, end: int = None, tier: str = None) -> list[Path]:
+    """
+    Retorna os segmentos do símbolo/lado em ordem cronológica (sem extensão),
+    descartando os que não cruzam a janela `[start, end]` (epoch em segundos).
+    """
+    directory = store_dir(symbol, side, tier)
+    if not directory.exists():
+        return []
+    segments = sorted(path.with_suffix("") for path in directory.glob("*.snapshots"))
+    if start is not None:
+        segments = [seg for seg in segments if _segment_start(seg) + SEGMENT_SECONDS > start]
+    if end is not None:
+        segments = [seg for seg in segments if _segment_start(seg) <= end]
+    return segments
+
+
+def _active_segment(directory: Path, timestamp: int) -> Path:
+    """
+    Segmento que recebe snapshots do dia de `timestamp`: a última parte do dia,
+    ou uma parte nova se ela já passou de `segment_max_bytes` ou foi comprimida.
+    """
+    day = _segment_name(timestamp)
+    # Sem a extensão, `<dia>` vem antes de `<dia>-001` (com ela, "." > "-" inverteria a ordem)
+    parts = sorted(path.with_suffix("") for path in directory.glob(f"{day}*.snapshots"))
+    if not parts:
+        return directory / day
+    segment = parts[-1]
+    levels_path = segment.with_suffix(".levels")
+    closed = not levels_path.exists() and segment.with_suffix(".levels.gz").exists()
+    if closed or (settings.segment_max_bytes and levels_path.exists()
+                  and levels_path.stat().st_size >= settings.segment_max_bytes):
+        return directory / f"{day}-{len(parts):03d}"
+    return segment
+
+
+def _index_from_headers(headers: np.ndarray) -> np.ndarray:
+    index = np.empty(len(headers), dtype=INDEX_DTYPE)
+    index["timestamp"] = headers["timestamp"]
+    if len(headers):
+        index["offset"][0] = 0
+        np.cumsum(headers["count"][:-1], out=index["offset"][1:])
+    return index
+
+
+def _truncate(path: Path, size: int):
+    if path.exists() and path.stat().st_size > size:
+        os.truncate(path, size)
+
+
+def _recover(segment: Path):
+    """
+    Alinha `.levels` e `.index` com os cabeçalhos completos do segmento antes
+    de acrescentar: corta o que uma gravação interrompida deixou depois do
+    último cabeçalho (e um cabeçalho parcial) e refaz o índice se estiver
+    ausente ou incompleto (segmentos anteriores ao índice).
+    """
+    headers_path = segment.with_suffix(".snapshots")
+    n_headers = headers_path.stat().st_size // HEADER_DTYPE.itemsize if headers_path.exists() else 0
+    _truncate(headers_path, n_headers * HEADER_DTYPE.itemsize)
+    headers = np.fromfile(headers_path, dtype=HEADER_DTYPE, count=n_headers) if n_headers else \
+        np.empty(0, HEADER_DTYPE)
+    _truncate(segment.with_suffix(".levels"), int(headers["count"].sum()) * LEVEL_DTYPE.itemsize)
+    index_path = segment.with_suffix(".index")
+    n_index = index_path.stat().st_size // INDEX_DTYPE.itemsize if index_path.exists() else 0
+    if n_index < n_headers:
+        _index_from_headers(headers).tofile(index_path)
+    else:
+        _truncate(index_path, n_headers * INDEX_DTYPE.itemsize)
+    _recovered.add(segment)
+
+
+def append_snapshots(symbol: str, side: str, timestamps: list[int], current_prices: list[float],
+                     levels: list[np.ndarray], tier: str = None) -> list[Path]:
+    """
+    Acrescenta um lote de snapshots (matrizes N×2 de price/volume, em ordem de
+    timestamp) com um único append por arquivo e por segmento. Retorna os
+    segmentos que receberam dados.
+    """
+    directory = store_dir(symbol, side, tier)
+    directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    first = 0
+    while first < len(timestamps):
+        day = _segment_name(timestamps[first])
+        last = first + 1
+        while last < len(timestamps) and _segment_name(timestamps[last]) == day:
+            last += 1
+        segment = _active_segment(directory, timestamps[first])
+        if segment not in _recovered:
+            _recover(segment)
+
+        batch = [np.ascontiguousarray(lv, dtype=np.float64).reshape(-1, 2) for lv in levels[first:last]]
+        counts = np.array([len(lv) for lv in batch], dtype=np.int64)
+        headers = np.empty(last - first, dtype=HEADER_DTYPE)
+        headers["timestamp"] = timestamps[first:last]
+        headers["current_price"] = current_prices[first:last]
+        headers["count"] = counts
+        try:
+            with open(segment.with_suffix(".levels"), "ab") as f:
+                offset = f.tell() // LEVEL_DTYPE.itemsize
+                f.write(np.concatenate(batch).tobytes())
+            index = np.empty(last - first, dtype=INDEX_DTYPE)
+            index["timestamp"] = headers["timestamp"]
+            index["offset"][0] = offset
+            np.cumsum(counts[:-1], out=index["offset"][1:])
+            index["offset"][1:] += offset
+            with open(segment.with_suffix(".index"), "ab") as f:
+                f.write(index.tobytes())
+            with open(segment.with_suffix(".snapshots"), "ab") as f:
+                f.write(headers.tobytes())
+        except BaseException:
+            # Append interrompido (ex.: disco cheio): o próximo confere o segmento de novo
+            _recovered.discard(segment)
+            raise
+
+        written.append(segment)
+        first = last
+    return written
+
+
+def append_snapshot(symbol: str, side: str, timestamp: int, current_price: float, levels: np.ndarray):
+    """
+    Acrescenta um snapshot (matriz N×2 de price/volume) ao segmento do dia.
+    """
+    append_snapshots(symbol, side, [timestamp], [current_price], [levels])
+
+
+def compress_closed(symbol: str, side: str, tier: str = None) -> list[Path]:
+    """
+    Comprime o `.levels` dos segmentos fechados (todos menos o último) que
+    ainda estiverem crus. O arquivo comprimido é escrito à parte e renomeado
+    antes de o original ser apagado, então um leitor sempre encontra um dos dois.
+    """
+    compressed = []
+    for segment in list_segments(symbol, side, tier=tier)[:-1]:
+        levels_path = segment.with_suffix(".levels")
+        if not levels_path.exists():
+            continue
+        target = segment.with_suffix(".levels.gz")
+        partial = segment.with_suffix(".levels.gz.tmp")
+        with open(levels_path, "rb") as src, gzip.open(partial, "wb", compresslevel=COMPRESS_LEVEL) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(partial, target)
+        levels_path.unlink()
+        compressed.append(segment)
+    return compressed
+
+
+def reset(symbol: str, side: str):
+    """
+    Remove todos os segmentos do símbolo/lado, camadas de retenção inclusive.
+    """
+    shutil.rmtree(store_dir(symbol, side), ignore_errors=True)
+
+
+def _header_count(segment: Path) -> int:
+    return segment.with_suffix(".snapshots").stat().st_size // HEADER_DTYPE.itemsize
+
+
+def _header_timestamp(segment: Path, position: int) -> int:
+    header = np.fromfile(segment.with_suffix(".snapshots"), dtype=HEADER_DTYPE, count=1,
+                         offset=position * HEADER_DTYPE.itemsize)
+    return int(header["timestamp"][0])
+
+
+def first_timestamp(symbol: str, side: str, tier: str = None) -> int | None:
+    """
+    Timestamp do snapshot mais antigo guardado (None se não houver dados).
+    """
+    for segment in list_segments(symbol, side, tier=tier):
+        if _header_count(segment):
+            return _header_timestamp(segment, 0)
+    return None
+
+
+def last_timestamp(symbol: str, side: str, tier: str = None) -> int | None:
+    """
+    Timestamp do snapshot mais recente guardado (None se não houver dados).
+    """
+    for segment in reversed(list_segments(symbol, side, tier=tier)):
+        count = _header_count(segment)
+        if count:
+            return _header_timestamp(segment, count - 1)
+    return None
+
+
+def drop_segments(symbol: str, side: str, before: int, tier: str = None) -> list[Path]:
+    """
+    Apaga os segmentos cujo snapshot mais recente é anterior a `before`.
+    O último segmento (o que recebe as gravações) nunca é apagado. O cabeçalho
+    sai primeiro, para que novos leitores deixem de enxergar o segmento.
+    """
+    dropped = []
+    for segment in list_segments(symbol, side, tier=tier)[:-1]:
+        count = _header_count(segment)
+        if count and _header_timestamp(segment, count - 1) >= before:
+            break
+        for suffix in (".snapshots", ".index", ".levels", ".levels.gz"):
+            segment.with_suffix(suffix).unlink(missing_ok=True)
+        dropped.append(segment)
+    return dropped
+
+
+def read_plan(symbol: str, side: str, start: int = None, end: int = None) -> list[tuple[str | None, int | None, int | None]]:
+    """
+    Decide de onde ler a janela `[start, end]`: da camada mais fina (bruto
+    primeiro) que ainda guarda o início da janela e, para o trecho mais recente
+    que essa camada ainda não consolidou, das camadas mais finas seguintes, até
+    o bruto. Retorna trechos (camada ou None para o bruto, início, fim).
+    """
+    stores = [None] + [tier.bucket_time for tier in settings.retention_tiers]
+    firsts = [first_timestamp(symbol, side, store) for store in stores]
+    available = [first for first in firsts if first is not None]
+    if not available:
+        return [(None, start, end)]
+    target = min(available) if start is None else start
+    covering = [k for k, first in enumerate(firsts) if first is not None and first <= target]
+    chosen = covering[0] if covering else firsts.index(min(available))
+    if chosen == 0:
+        return [(None, start, end)]
+
+    plan, position = [], start
+    for k in range(chosen, 0, -1):
+        last = last_timestamp(symbol, side, stores[k])
+        if last is None:
+            continue
+        watermark = last + bucket_seconds(stores[k])
+        if position is None or position < watermark:
+            plan.append((stores[k], position, watermark - 1 if end is None else min(end, watermark - 1)))
+            position = watermark
+        if end is not None and position > end:
+            return plan
+    plan.append((None, position, end))
+    return plan
+
+
+def _load_index(segment: Path, n_headers: int) -> np.ndarray:
+    """
+    Faz memory-map do índice do segmento. Se ele estiver ausente ou incompleto
+    (segmentos gravados antes do índice existir), é montado em memória a partir
+    dos cabeçalhos; o arquivo só é refeito pelo writer (`_recover`).
+    """
+    index_path = segment.with_suffix(".index")
+    n_index = index_path.stat().st_size // INDEX_DTYPE.itemsize if index_path.exists() else 0
+    if n_index < n_headers:
+        return _index_from_headers(np.fromfile(segment.with_suffix(".snapshots"), dtype=HEADER_DTYPE,
+                                               count=n_headers))
+    return np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(n_headers,))
+
+
+def _window(segment: Path, start: int = None, end: int = None) -> tuple[int, int, int]:
+    """
+    Cabeçalhos `[first, last)` do segmento dentro da janela `[start, end]` e a
+    linha de `.levels` onde o primeiro deles começa.
+    """
+    n_headers = segment.with_suffix(".snapshots").stat().st_size // HEADER_DTYPE.itemsize
+    if n_headers == 0 or (start is None and end is None):
+        return 0, n_headers, 0
+    index = _load_index(segment, n_headers)
+    timestamps = index["timestamp"]
+    first = int(np.searchsorted(timestamps, start, side="left")) if start is not None else 0
+    last = int(np.searchsorted(timestamps, end, side="right")) if end is not None else n_headers
+    if first >= last:
+        return 0, 0, 0
+    return first, last, int(index["offset"][first])
+
+
+def _read_headers(segment: Path, first: int, last: int) -> np.ndarray:
+    return np.fromfile(segment.with_suffix(".snapshots"), dtype=HEADER_DTYPE, count=last - first,
+                       offset=first * HEADER_DTYPE.itemsize)
+
+
+def _read_segment(segment: Path, start: int = None, end: int = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lê os cabeçalhos completos de um segmento dentro da janela `[start, end]`
+    e faz memory-map apenas das linhas de níveis correspondentes.
+    """
+    first, last, row_offset = _window(segment, start, end)
+    if first >= last:
+        return np.empty(0, HEADER_DTYPE), np.empty(0, LEVEL_DTYPE)
+    headers = _read_headers(segment, first, last)
+    return headers, _read_levels(segment, row_offset, int(headers["count"].sum()))
+
+
+def _read_levels(segment: Path, row_offset: int, n_levels: int) -> np.ndarray:
+    """
+    Linhas `[row_offset, row_offset + n_levels)` do `.levels` do segmento:
+    memory-map do arquivo cru ou, se o segmento já foi comprimido, leitura do `.levels.gz`.
+    """
+    if n_levels == 0:
+        return np.empty(0, LEVEL_DTYPE)
+    try:
+        return np.memmap(segment.with_suffix(".levels"), dtype=LEVEL_DTYPE, mode="r",
+                         offset=row_offset * LEVEL_DTYPE.itemsize, shape=(n_levels,))
+    except FileNotFoundError:
+        with gzip.open(segment.with_suffix(".levels.gz"), "rb") as f:
+            f.seek(row_offset * LEVEL_DTYPE.itemsize)
+            return np.frombuffer(f.read(n_levels * LEVEL_DTYPE.itemsize), dtype=LEVEL_DTYPE)
+
+
+def read_snapshots(symbol: str, side: str, start: int = None, end: int = None,
+                   tier: str = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Retorna (cabeçalhos, níveis) dos snapshots do símbolo/lado na janela
+    `[start, end]` (epoch em segundos; None = sem limite), dos dados brutos ou
+    de uma camada de retenção. Os níveis de cada snapshot ficam contíguos, na
+    ordem dos cabeçalhos.
+    """
+    parts = [_read_segment(segment, start, end) for segment in list_segments(symbol, side, start, end, tier)]
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return np.empty(0, HEADER_DTYPE), np.empty(0, LEVEL_DTYPE)
+    if len(parts) == 1:
+        return parts[0]
+    return np.concatenate([h for h, _ in parts]), np.concatenate([lv for _, lv in parts])
+
+
+def _iter_segment(segment: Path, start: int, end: int, chunk_rows: int):
+    """
+    Percorre a janela do segmento em blocos de snapshots inteiros com até
+    `chunk_rows` níveis (um snapshot maior que isso sai sozinho).
+    """
+    first, last, row_offset = _window(segment, start, end)
+    if first < last:
+        yield from _iter_blocks(segment, _read_headers(segment, first, last), row_offset, chunk_rows)
+
+
+def _iter_blocks(segment: Path, headers: np.ndarray, row_offset: int, chunk_rows: int):
+    """
+    Divide `headers` (cujos níveis começam na linha `row_offset` do segmento)
+    em blocos (cabeçalhos, níveis) de até `chunk_rows` níveis. Segmentos
+    comprimidos são descomprimidos em sequência, sem voltar ao início a cada bloco.
+    """
+    ends = np.cumsum(headers["count"])
+    compressed = None
+    try:
+        position = 0
+        while position < len(headers):
+            done = int(ends[position - 1]) if position else 0
+            stop = max(int(np.searchsorted(ends, done + chunk_rows, side="right")), position + 1)
+            n_levels = int(ends[stop - 1]) - done
+            if compressed is None:
+                try:
+                    levels = np.memmap(segment.with_suffix(".levels"), dtype=LEVEL_DTYPE, mode="r",
+                                       offset=(row_offset + done) * LEVEL_DTYPE.itemsize,
+                                       shape=(n_levels,)) if n_levels else np.empty(0, LEVEL_DTYPE)
+                except FileNotFoundError:
+                    compressed = gzip.open(segment.with_suffix(".levels.gz"), "rb")
+                    compressed.seek((row_offset + done) * LEVEL_DTYPE.itemsize)
+            if compressed is not None:
+                levels = np.frombuffer(compressed.read(n_levels * LEVEL_DTYPE.itemsize), dtype=LEVEL_DTYPE)
+            yield headers[position:stop], levels
+            position = stop
+    finally:
+        if compressed is not None:
+            compressed.close()
+
+
+def iter_snapshots(symbol: str, side: str, start: int = None, end: int = None,
+                   chunk_rows: int = None) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Mesmos dados de `read_columns` (incluindo as camadas de retenção, conforme
+    `read_plan`), em ordem de gravação, como blocos (cabeçalhos, níveis) de até
+    `chunk_rows` níveis (padrão `settings.read_chunk_rows`). A memória usada não
+    depende do tamanho da janela.
+    """
+    chunk_rows = chunk_rows or settings.read_chunk_rows
+    if settings.storage_format == "csv":
+        yield from _iter_csv_snapshots(symbol, side, start, end, chunk_rows)
+        return
+    for tier, part_start, part_end in read_plan(symbol, side, start, end):
+        for segment in list_segments(symbol, side, part_start, part_end, tier):
+            yield from _iter_segment(segment, part_start, part_end, chunk_rows)
+
+
+def read_headers(symbol: str, side: str, start: int = None, end: int = None) -> np.ndarray:
+    """
+    Só os cabeçalhos (timestamp, current_price, quantidade de níveis) da janela
+    `[start, end]`, incluindo as camadas de retenção conforme `read_plan`, sem
+    tocar nos níveis (nem descomprimir segmentos fechados).
+    """
+    if settings.storage_format == "csv":
+        parts = [headers for headers, _ in _iter_csv_snapshots(symbol, side, start, end, settings.read_chunk_rows)]
+    else:
+        parts = []
+        for tier, part_start, part_end in read_plan(symbol, side, start, end):
+            for segment in list_segments(symbol, side, part_start, part_end, tier):
+                first, last, _ = _window(segment, part_start, part_end)
+                if first < last:
+                    parts.append(_read_headers(segment, first, last))
+    return np.concatenate(parts) if parts else np.empty(0, HEADER_DTYPE)
+
+
+def read_since(symbol: str, side: str, cursor: tuple[str, int] | None,
+               with_levels: bool = True) -> tuple[np.ndarray, np.ndarray, tuple[str, int] | None]:
+    """
+    Lê os snapshots gravados depois do `cursor` (segmento, quantidade de
+    cabeçalhos já lidos nele) e retorna (cabeçalhos, níveis, novo cursor).
+    Usado por quem mantém agregados incrementais sobre o armazenamento. Com
+    `with_levels=False` os níveis voltam vazios.
+    """
+    headers_parts, levels_parts = [], []
+    new_cursor = cursor
+    for segment in list_segments(symbol, side):
+        if cursor is not None and segment.name < cursor[0]:
+            continue
+        already = cursor[1] if cursor is not None and segment.name == cursor[0] else 0
+        n_headers = segment.with_suffix(".snapshots").stat().st_size // HEADER_DTYPE.itemsize
+        new_cursor = (segment.name, max(n_headers, already))
+        if n_headers <= already:
+            continue
+        headers = _read_headers(segment, already, n_headers)
+        headers_parts.append(headers)
+        if with_levels:
+            row_offset = int(_load_index(segment, n_headers)["offset"][already])
+            levels_parts.append(_read_levels(segment, row_offset, int(headers["count"].sum())))
+
+    if not headers_parts:
+        return np.empty(0, HEADER_DTYPE), np.empty(0, LEVEL_DTYPE), new_cursor
+    if not levels_parts:
+        return np.concatenate(headers_parts), np.empty(0, LEVEL_DTYPE), new_cursor
+    if len(headers_parts) == 1:
+        return headers_parts[0], levels_parts[0], new_cursor
+    return np.concatenate(headers_parts), np.concatenate(levels_parts), new_cursor
+
+
+def cursor_at(symbol: str, side: str, timestamp: int) -> tuple[str, int] | None:
+    """
+    Cursor de `read_since`/`iter_since` que pula os segmentos inteiros que
+    terminam antes de `timestamp` (o segmento que o contém é lido desde o começo).
+    """
+    segments = list_segments(symbol, side)
+    if not segments:
+        return None
+    crossing = [segment for segment in segments if _segment_start(segment) + SEGMENT_SECONDS > timestamp]
+    return (crossing[0].name, 0) if crossing else (segments[-1].name, _header_count(segments[-1]))
+
+
+def iter_since(symbol: str, side: str, cursor: tuple[str, int] | None,
+               chunk_rows: int = None) -> Iterator[tuple[np.ndarray, np.ndarray, tuple[str, int]]]:
+    """
+    Mesmos snapshots de `read_since`, em blocos (cabeçalhos, níveis, cursor logo
+    depois do bloco) de até `chunk_rows` níveis (padrão `settings.read_chunk_rows`).
+    A carga inicial de quem mantém agregados sobre o histórico inteiro não
+    depende do tamanho dele em memória.
+    """
+    chunk_rows = chunk_rows or settings.read_chunk_rows
+    for segment in list_segments(symbol, side):
+        if cursor is not None and segment.name < cursor[0]:
+            continue
+        already = cursor[1] if cursor is not None and segment.name == cursor[0] else 0
+        n_headers = segment.with_suffix(".snapshots").stat().st_size // HEADER_DTYPE.itemsize
+        if n_headers <= already:
+            continue
+        headers = _read_headers(segment, already, n_headers)
+        row_offset = int(_load_index(segment, n_headers)["offset"][already])
+        for block_headers, levels in _iter_blocks(segment, headers, row_offset, chunk_rows):
+            already += len(block_headers)
+            yield block_headers, levels, (segment.name, already)
+
+
+def read_columns(symbol: str, side: str, start: int = None, end: int = None) -> dict[str, np.ndarray] | None:
+    """
+    Retorna as colunas por nível (timestamp, price, volume, current_price),
+    no mesmo formato das linhas do CSV, restritas à janela `[start, end]`,
+    ou None se não houver dados. Trechos que só existem nas camadas de
+    retenção vêm delas (uma linha por bucket de tempo × bucket de preço, com o
+    volume somado), conforme `read_plan`.
+    """
+    if settings.storage_format == "csv":
+        return _read_csv_columns(symbol, side, start, end)
+
+    parts = [read_snapshots(symbol, side, part_start, part_end, tier)
+             for tier, part_start, part_end in read_plan(symbol, side, start, end)]
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return None
+    headers = np.concatenate([h for h, _ in parts]) if len(parts) > 1 else parts[0][0]
+    levels = np.concatenate([lv for _, lv in parts]) if len(parts) > 1 else parts[0][1]
+    counts = headers["count"]
+    return {
+        "timestamp": np.repeat(headers["timestamp"], counts),
+        "price": np.asarray(levels["price"]),
+        "volume": np.asarray(levels["volume"]),
+        "current_price": np.repeat(headers["current_price"], counts),
+    }
+
+
+def _read_csv_columns(symbol: str, side: str, start: int = None, end: int = None) -> dict[str, np.ndarray] | None:
+    # O formato csv não tem índice: a janela é aplicada depois da leitura completa
+    import pandas as pd
+
+    path = csv_path(symbol, side)
+    if not path.exists():
+        return None
+    df = pd.read_csv(path, usecols=["timestamp", "price", "volume", "current_price"])
+    if start is not None:
+        df = df[df["timestamp"] >= start]
+    if end is not None:
+        df = df[df["timestamp"] <= end]
+    if df.empty:
+        return None
+    return {column: df[column].to_numpy() for column in df.columns}
+
+
+def _iter_csv_snapshots(symbol: str, side: str, start: int, end: int, chunk_rows: int):
+    # Lê o CSV em pedaços; cada sequência de linhas com o mesmo timestamp vira um "snapshot"
+    import pandas as pd
+
+    path = csv_path(symbol, side)
+    if not path.exists():
+        return
+    for df in pd.read_csv(path, usecols=["timestamp", "price", "volume", "current_price"], chunksize=chunk_rows):
+        if start is not None:
+            df = df[df["timestamp"] >= start]
+        if end is not None:
+            df = df[df["timestamp"] <= end]
+        if df.empty:
+            continue
+        timestamps = df["timestamp"].to_numpy()
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(timestamps)) + 1])
+        headers = np.empty(len(starts), HEADER_DTYPE)
+        headers["timestamp"] = timestamps[starts]
+        headers["current_price"] = df["current_price"].to_numpy()[starts]
+        headers["count"] = np.diff(np.append(starts, len(timestamps)))
+        levels = np.empty(len(df), LEVEL_DTYPE)
+        levels["price"] = df["price"].to_numpy()
+        levels["volume"] = df["volume"].to_numpy()
+        yield headers, levels
+
+
+def iter_csv_rows(symbol: str, side: str):
+    """
+    Gera as linhas do histórico no formato CSV original
+    (timestamp, datetime_local, price, volume, current_price), cabeçalho incluso.
+    Usado pela exportação consumida pelo rkd-htf-core. Só lê os dados brutos:
+    o que a retenção já expirou (`raw_retention_hours`) não entra.
+    """
+    yield CSV_COLUMNS
+    for segment in list_segments(symbol, side):
+        headers, levels = _read_segment(segment)
+        offset = 0
+        for timestamp, current_price, count in headers.tolist():
+            datetime_local = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            for price, volume in levels[offset:offset + count].tolist():
+                yield [timestamp, datetime_local, repr(price), repr(volume), current_price]
+            offset += count
+
+
+def export_csv(symbol: str, side: str, file_path: Path) -> Path:
+    """
+    Exporta o histórico colunar do símbolo/lado para um arquivo CSV.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, "w", newline="") as f:
+        csv.writer(f).writerows(iter_csv_rows(symbol, side))
+    return file_path
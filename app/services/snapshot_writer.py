@@ -0,0 +1,272 @@
+"""
+Gravação em lote dos snapshots capturados (group commit).
+
+A captura entrega o snapshot ao writer e aguarda a confirmação. O writer junta
+os snapshots de todos os símbolos que chegam dentro de `writer_flush_seconds`
+(ou até somar `writer_flush_bytes`) e grava o lote de uma vez: um append por
+arquivo por lote, em vez de abrir os arquivos a cada snapshot e, no csv,
+escrever e imprimir linha a linha. Quem aguarda só é liberado depois que o
+lote está em disco, então as ações pós-captura (cache, heatmap ao vivo)
+sempre enxergam o snapshot. Os agregados do heatmap, os candles e a pirâmide
+de tiles são atualizados numa thread à parte, que junta os símbolos avisados
+enquanto a passada anterior roda: nem a gravação nem a captura esperam por
+eles, um erro nessa atualização não vira erro de gravação e as consultas
+incorporam o que ainda faltar.
+
+Depois de cada lote sai uma linha de log estruturada por snapshot. Quando um
+segmento do armazenamento colunar fecha (virada do dia ou tamanho máximo),
+os segmentos fechados são comprimidos numa thread à parte.
+"""
+import concurrent.futures
+import csv
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import candles, heatmap_aggregates, heatmap_tiles, metrics, snapshot_store
+from app.services.book_levels import OrderBook
+
+
+class _Pending:
+    def __init__(self, symbol: str, timestamp: int, datetime_local: str, current_price: float,
+                 levels: dict[str, np.ndarray]):
+        self.symbol = symbol
+        self.timestamp = timestamp
+        self.datetime_local = datetime_local
+        self.current_price = current_price
+        self.levels = levels
+        self.nbytes = sum(side_levels.nbytes for side_levels in levels.values())
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        # O snapshot entra no lote de qualquer jeito: quem desistir de esperar
+        # (captura cancelada) não pode cancelar o Future antes da gravação
+        self.future.set_running_or_notify_cancel()
+
+
+class SnapshotWriter:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: list[_Pending] = []
+        self._pending_bytes = 0
+        self._first_at: float | None = None
+        self._force = False
+        self._closing = False
+        self._thread: threading.Thread | None = None
+        self._last_segment: dict[tuple[str, str], str] = {}
+        self._compressing: set[tuple[str, str]] = set()
+        # Símbolos com lotes gravados ainda não incorporados aos agregados (ordem de chegada)
+        self._refresh_cond = threading.Condition()
+        self._refresh_symbols: dict[str, None] = {}
+        self._refresher: threading.Thread | None = None
+        self.batches = 0
+        self.snapshots = 0
+        self.bytes = 0
+        self.errors = 0
+        self.last_batch_size = 0
+        self.last_flush_ms: float | None = None
+
+    def submit(self, symbol: str, book: OrderBook, timestamp: int, datetime_local: str,
+               current_price: float) -> concurrent.futures.Future:
+        """
+        Enfileira um snapshot e retorna um Future concluído quando o lote dele for gravado.
+        """
+        item = _Pending(symbol, timestamp, datetime_local, current_price,
+                        {side: book.side(side).levels() for side in snapshot_store.SIDES})
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+            first = not self._pending
+            if first:
+                self._first_at = time.monotonic()
+            self._pending.append(item)
+            self._pending_bytes += item.nbytes
+            # Acorda a thread no primeiro snapshot do lote (começa a contar o prazo) e ao encher o buffer
+            if first or self._pending_bytes >= settings.writer_flush_bytes:
+                self._cond.notify_all()
+        return item.future
+
+    def flush(self):
+        """
+        Grava imediatamente o que estiver pendente e espera terminar.
+        """
+        with self._cond:
+            futures = [item.future for item in self._pending]
+            if futures:
+                self._force = True
+                self._cond.notify_all()
+        concurrent.futures.wait(futures)
+
+    def close(self):
+        """
+        Grava o que estiver pendente e encerra a thread do writer.
+        """
+        with self._cond:
+            thread = self._thread
+            self._closing = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    self._thread = None
+                    return
+                while not (self._closing or self._force or self._pending_bytes >= settings.writer_flush_bytes):
+                    remaining = self._first_at + settings.writer_flush_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                self._pending_bytes = 0
+                self._force = False
+
+            start = time.perf_counter()
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [writer] Erro ao gravar lote de {len(batch)} snapshots: {e}")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            elapsed_ms = elapsed * 1000
+            batch_bytes = sum(item.nbytes for item in batch)
+            metrics.record("writer.flush", elapsed, len(batch), batch_bytes)
+
+            self.batches += 1
+            self.snapshots += len(batch)
+            self.bytes += batch_bytes
+            self.last_batch_size = len(batch)
+            self.last_flush_ms = round(elapsed_ms, 2)
+            for item in batch:
+                print(f"[{item.datetime_local}] [snapshot] symbol={item.symbol} timestamp={item.timestamp} "
+                      f"bids={len(item.levels['bids'])} asks={len(item.levels['asks'])} "
+                      f"current_price={item.current_price} lote={len(batch)} gravacao_ms={elapsed_ms:.1f}")
+                item.future.set_result(None)
+            self._refresh_derived(batch)
+
+    def _write(self, batch: list[_Pending]):
+        # Agrupa por símbolo/lado mantendo a ordem de chegada
+        groups: dict[tuple[str, str], list[_Pending]] = {}
+        for item in batch:
+            for side in snapshot_store.SIDES:
+                groups.setdefault((item.symbol, side), []).append(item)
+
+        if settings.storage_format == "csv":
+            for (symbol, side), items in groups.items():
+                _append_csv(symbol, side, items)
+            return
+
+        for (symbol, side), items in groups.items():
+            segments = snapshot_store.append_snapshots(
+                symbol, side,
+                [item.timestamp for item in items],
+                [item.current_price for item in items],
+                [item.levels[side] for item in items],
+            )
+            self._check_rotation(symbol, side, segments[-1].name)
+
+    def _refresh_derived(self, batch: list[_Pending]):
+        # Só avisa a thread de atualização: a thread do writer segue para o próximo lote
+        if settings.storage_format == "csv":
+            return
+        with self._refresh_cond:
+            self._refresh_symbols.update(dict.fromkeys(item.symbol for item in batch))
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(target=self._refresh_loop, name="writer-refresher", daemon=True)
+                self._refresher.start()
+            self._refresh_cond.notify()
+
+    def _refresh_loop(self):
+        # Uma passada por símbolo cobre todos os lotes gravados até ela começar
+        while True:
+            with self._refresh_cond:
+                while not self._refresh_symbols:
+                    self._refresh_cond.wait()
+                symbols, self._refresh_symbols = list(self._refresh_symbols), {}
+            with metrics.span("writer.refresh_aggregates"):
+                for symbol in symbols:
+                    try:
+                        heatmap_aggregates.refresh(symbol)
+                        candles.refresh(symbol)
+                        heatmap_tiles.notify(symbol)
+                    except Exception as e:
+                        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [writer] Erro ao atualizar os agregados de "
+                              f"{symbol}: {e}")
+
+    def _check_rotation(self, symbol: str, side: str, segment: str):
+        """
+        Comprime os segmentos fechados quando o segmento ativo muda (e uma vez
+        por símbolo/lado ao iniciar, para os que fecharam com o processo parado).
+        """
+        key = (snapshot_store.symbol_key(symbol), side)
+        if self._last_segment.get(key) == segment or not settings.compress_closed_segments:
+            return
+        if key in self._compressing:
+            # Compressão anterior ainda em andamento: tenta de novo no próximo lote
+            return
+        self._last_segment[key] = segment
+        self._compressing.add(key)
+        threading.Thread(target=self._compress, args=(symbol, side, key),
+                         name="segment-compressor", daemon=True).start()
+
+    def _compress(self, symbol: str, side: str, key: tuple[str, str]):
+        try:
+            for segment in snapshot_store.compress_closed(symbol, side):
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [writer] Segmento {side}/{segment.name} "
+                      f"de {symbol} comprimido.")
+        except Exception as e:
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [writer] Erro ao comprimir segmentos de {symbol}: {e}")
+        finally:
+            self._compressing.discard(key)
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "lotes": self.batches,
+            "snapshots": self.snapshots,
+            "bytes": self.bytes,
+            "pendentes": pending,
+            "erros": self.errors,
+            "ultimo_lote": self.last_batch_size,
+            "ultima_gravacao_ms": self.last_flush_ms,
+        }
+
+
+def _collect_metrics():
+    stats = snapshot_writer.stats()
+    yield "writer_batches_total", "counter", "Lotes gravados pelo writer", {}, stats["lotes"]
+    yield "writer_snapshots_total", "counter", "Snapshots gravados pelo writer", {}, stats["snapshots"]
+    yield "writer_errors_total", "counter", "Lotes com erro de gravação", {}, stats["erros"]
+    yield "writer_pending", "gauge", "Snapshots aguardando o próximo lote", {}, stats["pendentes"]
+
+
+def _append_csv(symbol: str, side: str, items: list[_Pending]):
+    """
+    Acrescenta as linhas de vários snapshots ao CSV do lado com uma única
+    abertura do arquivo. Arquivos novos recebem o cabeçalho.
+    """
+    path = snapshot_store.csv_path(symbol, side)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    new_file = not path.exists() or path.stat().st_size == 0
+    with open(path, mode="a", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        if new_file:
+            writer.writerow(snapshot_store.CSV_COLUMNS)
+        for item in items:
+            writer.writerows([item.timestamp, item.datetime_local, price, volume, item.current_price]
+                             for price, volume in item.levels[side].tolist())
+
+
+snapshot_writer = SnapshotWriter()
+metrics.registry.register_collector(_collect_metrics)
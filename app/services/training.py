@@ -0,0 +1,325 @@
+"""
+Treino do modelo base (CPU) sobre o dataset de features do order book.
+
+O modelo é uma regressão logística em NumPy que prevê se o retorno futuro num
+horizonte do dataset (`dataset_horizons_seconds`) é positivo, treinada com SGD
+em mini-lotes. Os lotes saem direto dos shards do dataset por memory-map (em
+ordem aleatória de shard e de linha), então o histórico nunca precisa caber em
+memória. As últimas `VALIDATION_FRACTION` linhas (as mais recentes) ficam fora
+do treino e medem o acerto a cada época.
+
+Cada treino roda como um job numa thread em segundo plano: primeiro atualiza o
+dataset (`dataset.build`), depois calcula média/desvio das features e treina,
+gravando um checkpoint ao fim de cada época em `data/models/<SÍMBOLO>/`. Um
+novo treino do mesmo símbolo continua do checkpoint (se a especificação for a
+mesma) até completar o total de épocas pedido.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import dataset, snapshot_store
+
+# Fração final (mais recente) do dataset usada só para validação
+VALIDATION_FRACTION = 0.1
+# Regularização L2 dos pesos
+L2 = 1e-4
+# Linhas lidas por vez nas passagens completas (estatísticas e validação)
+SCAN_ROWS = 65536
+# Jobs concluídos mantidos na listagem
+MAX_FINISHED_JOBS = 20
+
+
+def model_dir(symbol: str) -> Path:
+    return snapshot_store.DATA_DIR / "models" / snapshot_store.symbol_key(symbol)
+
+
+def checkpoint_path(symbol: str) -> Path:
+    return model_dir(symbol) / "logistic.npz"
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+class TrainingCancelled(Exception):
+    pass
+
+
+class TrainingJob:
+    def __init__(self, symbol: str, epochs: int, learning_rate: float, batch_size: int, horizon_seconds: int,
+                 resume: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.symbol = symbol
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.horizon_seconds = horizon_seconds
+        self.resume = resume
+        self.status = "na_fila"
+        self.epoch = 0
+        self.batches_done = 0
+        self.batches_total = 0
+        self.history: list[dict] = []
+        self.accuracy: float | None = None
+        self.message = ""
+        self.created_at = datetime.now()
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self._cancel = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("concluido", "cancelado", "erro")
+
+    @property
+    def progress(self) -> float:
+        if self.status == "concluido":
+            return 1.0
+        if not self.epochs or not self.batches_total:
+            return 0.0
+        done = (self.epoch + self.batches_done / self.batches_total) / self.epochs
+        return round(min(done, 1.0), 4)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise TrainingCancelled()
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "status": self.status,
+            "epoch": self.epoch,
+            "epochs": self.epochs,
+            "progress": self.progress,
+            "learning_rate": self.learning_rate,
+            "batch_size": self.batch_size,
+            "horizon_seconds": self.horizon_seconds,
+            "history": list(self.history),
+            "accuracy": self.accuracy,
+            "message": self.message,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "started_at": self.started_at.isoformat(timespec="seconds") if self.started_at else None,
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+        }
+
+
+jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _split(shards: list) -> list[tuple[int, int, int]]:
+    """
+    Linhas de treino e de validação de cada shard: (índice do shard, fim do
+    treino, total), com a validação nas últimas linhas do dataset.
+    """
+    total = sum(len(shard[0]) for shard in shards)
+    cutoff = total - int(round(total * VALIDATION_FRACTION))
+    split, offset = [], 0
+    for k, shard in enumerate(shards):
+        rows = len(shard[0])
+        split.append((k, int(np.clip(cutoff - offset, 0, rows)), rows))
+        offset += rows
+    return split
+
+
+def _standardization(shards: list, split: list, job: TrainingJob) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Média e desvio de cada feature nas linhas de treino, em blocos.
+    """
+    n_features = shards[0][1].shape[1]
+    total, total_sq, count = np.zeros(n_features), np.zeros(n_features), np.zeros(n_features)
+    for k, train_end, _ in split:
+        features = shards[k][1]
+        for start in range(0, train_end, SCAN_ROWS):
+            job.check_cancelled()
+            block = np.asarray(features[start:min(start + SCAN_ROWS, train_end)], dtype=np.float64)
+            valid = ~np.isnan(block)
+            block = np.where(valid, block, 0.0)
+            total += block.sum(axis=0)
+            total_sq += (block * block).sum(axis=0)
+            count += valid.sum(axis=0)
+    count = np.maximum(count, 1)
+    mean = total / count
+    std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0.0))
+    return mean, np.where(std > 1e-12, std, 1.0)
+
+
+def _batch(features: np.ndarray, labels: np.ndarray, rows: np.ndarray, label_index: int,
+           mean: np.ndarray, std: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    y = np.asarray(labels[rows, label_index], dtype=np.float64)
+    valid = ~np.isnan(y)
+    x = (np.asarray(features[rows[valid]], dtype=np.float64) - mean) / std
+    return np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0), (y[valid] > 0).astype(np.float64)
+
+
+def _evaluate(shards: list, split: list, label_index: int, w: np.ndarray, b: float,
+              mean: np.ndarray, std: np.ndarray) -> dict:
+    """
+    Perda, acerto e acerto da classe majoritária nas linhas de validação.
+    """
+    loss, hits, positives, count = 0.0, 0, 0, 0
+    for k, train_end, rows in split:
+        features, labels = shards[k][1], shards[k][2]
+        for start in range(train_end, rows, SCAN_ROWS):
+            x, y = _batch(features, labels, np.arange(start, min(start + SCAN_ROWS, rows)), label_index, mean, std)
+            if not len(y):
+                continue
+            p = np.clip(_sigmoid(x @ w + b), 1e-7, 1 - 1e-7)
+            loss -= float(np.sum(y * np.log(p) + (1 - y) * np.log(1 - p)))
+            hits += int(np.sum((p > 0.5) == (y > 0.5)))
+            positives += int(y.sum())
+            count += len(y)
+    if not count:
+        return {"val_loss": None, "val_accuracy": None, "baseline_accuracy": None}
+    return {
+        "val_loss": round(loss / count, 6),
+        "val_accuracy": round(hits / count, 4),
+        "baseline_accuracy": round(max(positives, count - positives) / count, 4),
+    }
+
+
+def _load_checkpoint(job: TrainingJob, n_features: int) -> dict | None:
+    path = checkpoint_path(job.symbol)
+    if not job.resume or not path.exists():
+        return None
+    with np.load(path) as checkpoint:
+        state = {name: checkpoint[name] for name in checkpoint.files}
+    if len(state["w"]) != n_features or int(state["horizon_seconds"]) != job.horizon_seconds:
+        # Especificação mudou (features ou horizonte): começa do zero
+        return None
+    return state
+
+
+def _save_checkpoint(job: TrainingJob, w: np.ndarray, b: float, mean: np.ndarray, std: np.ndarray, epoch: int):
+    path = checkpoint_path(job.symbol)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, w=w, b=np.float64(b), mean=mean, std=std, epoch=np.int64(epoch),
+             horizon_seconds=np.int64(job.horizon_seconds), history=np.array(json.dumps(job.history)))
+    os.replace(tmp, path)
+
+
+def _train(job: TrainingJob):
+    job.status = "preparando"
+    dataset.build(job.symbol)
+    manifest = dataset.load_manifest(job.symbol)
+    shards = dataset.open_shards(job.symbol)
+    if manifest is None or not shards:
+        raise ValueError(f"Dataset vazio para {job.symbol}: capture mais histórico antes de treinar")
+    label_name = f"return_{job.horizon_seconds}s"
+    if label_name not in manifest["labels"]:
+        raise ValueError(f"Horizonte {job.horizon_seconds}s não está no dataset ({', '.join(manifest['labels'])})")
+    label_index = manifest["labels"].index(label_name)
+    split = _split(shards)
+    n_features = shards[0][1].shape[1]
+
+    state = _load_checkpoint(job, n_features)
+    if state is not None:
+        w, b = state["w"].astype(np.float64), float(state["b"])
+        mean, std = state["mean"], state["std"]
+        job.epoch = int(state["epoch"])
+        job.history = json.loads(str(state["history"]))
+    else:
+        mean, std = _standardization(shards, split, job)
+        w, b = np.zeros(n_features), 0.0
+
+    job.status = "treinando"
+    rng = np.random.default_rng()
+    job.batches_total = sum(-(-train_end // job.batch_size) for _, train_end, _ in split) or 1
+    while job.epoch < job.epochs:
+        started = time.perf_counter()
+        job.batches_done = 0
+        loss, seen = 0.0, 0
+        for k in rng.permutation(len(split)):
+            _, train_end, _ = split[k]
+            features, labels = shards[k][1], shards[k][2]
+            order = rng.permutation(train_end)
+            for start in range(0, train_end, job.batch_size):
+                job.check_cancelled()
+                # Linhas do lote em ordem crescente: leitura sequencial no memory-map
+                x, y = _batch(features, labels, np.sort(order[start:start + job.batch_size]), label_index, mean, std)
+                job.batches_done += 1
+                if not len(y):
+                    continue
+                p = _sigmoid(x @ w + b)
+                error = p - y
+                w -= job.learning_rate * (x.T @ error / len(y) + L2 * w)
+                b -= job.learning_rate * float(error.mean())
+                p = np.clip(p, 1e-7, 1 - 1e-7)
+                loss -= float(np.sum(y * np.log(p) + (1 - y) * np.log(1 - p)))
+                seen += len(y)
+
+        metrics = _evaluate(shards, split, label_index, w, b, mean, std)
+        job.epoch += 1
+        job.history.append({
+            "epoch": job.epoch,
+            "seconds": round(time.perf_counter() - started, 3),
+            "train_loss": round(loss / seen, 6) if seen else None,
+            "samples": seen,
+            **metrics,
+        })
+        _save_checkpoint(job, w, b, mean, std, job.epoch)
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [training] {job.symbol} época {job.epoch}/{job.epochs} → "
+              f"{job.history[-1]}")
+
+    metrics = _evaluate(shards, split, label_index, w, b, mean, std)
+    job.accuracy = metrics["val_accuracy"]
+    job.message = (f"Modelo treinado: {job.epoch} épocas, acerto de validação {metrics['val_accuracy']} "
+                   f"(classe majoritária: {metrics['baseline_accuracy']}).")
+
+
+def _run(job: TrainingJob):
+    job.started_at = datetime.now()
+    try:
+        _train(job)
+        job.status = "concluido"
+    except TrainingCancelled:
+        job.status = "cancelado"
+        job.message = f"Cancelado na época {job.epoch + 1}; o checkpoint guarda as épocas concluídas."
+    except Exception as e:
+        job.status = "erro"
+        job.message = str(e)
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] [training] Erro no treino de {job.symbol}: {e}")
+    finally:
+        job.finished_at = datetime.now()
+
+
+def start_job(symbol: str, epochs: int, learning_rate: float, batch_size: int = 512,
+              horizon_seconds: int = None, resume: bool = True) -> TrainingJob:
+    """
+    Inicia um treino em segundo plano. Levanta RuntimeError se já houver um
+    treino em andamento para o símbolo (o checkpoint é por símbolo).
+    """
+    if horizon_seconds is None:
+        horizon_seconds = settings.dataset_horizons_seconds[0]
+    key = snapshot_store.symbol_key(symbol)
+    with _jobs_lock:
+        for job in jobs.values():
+            if snapshot_store.symbol_key(job.symbol) == key and not job.finished:
+                raise RuntimeError(f"Já existe um treino em andamento para {symbol} (job {job.id})")
+        job = TrainingJob(symbol, epochs, learning_rate, batch_size, horizon_seconds, resume)
+        jobs[job.id] = job
+        finished = [job_id for job_id, other in jobs.items() if other.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del jobs[job_id]
+    job._thread = threading.Thread(target=_run, args=(job,), name=f"training-{job.id}", daemon=True)
+    job._thread.start()
+    return job
+
+
+def get_job(job_id: str) -> TrainingJob | None:
+    return jobs.get(job_id)
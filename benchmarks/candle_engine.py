@@ -0,0 +1,108 @@
+"""
+Benchmark dos candles (`app/services/candles.py`).
+
+Grava um histórico sintético de N dias (um snapshot a cada `--step` segundos,
+poucos níveis, já que os candles só leem os cabeçalhos), carrega os candles em
+memória e compara o tempo de pedir os últimos `--limit` candles da memória e
+recalculando a partir do histórico gravado (leitura dos cabeçalhos + resample
+vetorizado). Mede também o custo de incorporar cada snapshot novo (`refresh`)
+e confere que os candles em memória são iguais aos recalculados, inclusive
+depois dos snapshots incrementais.
+
+Uso:
+    python -m benchmarks.candle_engine --days 7 --step 5 --limit 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import candles, snapshot_store  # noqa: E402
+from app.services.heatmap_grid import bucket_seconds  # noqa: E402
+
+SYMBOL = "BTCUSDT"
+START = 1_700_006_400
+LEVELS = 5
+
+
+def _write(timestamps: np.ndarray, rng: np.random.Generator, last_price: float) -> float:
+    prices = last_price + np.cumsum(rng.normal(0, 2, len(timestamps)))
+    offsets = np.arange(1, LEVELS + 1) * 0.5
+    for side, sign in (("bids", -1), ("asks", 1)):
+        snapshot_store.append_snapshots(
+            SYMBOL, side, timestamps.tolist(), prices.tolist(),
+            [np.column_stack([price + sign * offsets, np.ones(LEVELS)]) for price in prices],
+        )
+    return float(prices[-1])
+
+
+def _timed(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def _recomputed(interval: str, limit: int | None) -> list[dict]:
+    headers = snapshot_store.read_headers(SYMBOL, candles.PRICE_SIDE)
+    columns = candles.ohlc(headers["timestamp"], headers["current_price"], bucket_seconds(interval))
+    rows = [dict(zip(columns, row)) for row in zip(*(column.tolist() for column in columns.values()))]
+    return rows[-limit:] if limit else rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--step", type=int, default=5, help="Segundos entre snapshots")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=200, help="Snapshots incrementais a medir")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    settings.aggregate_time_buckets = []
+    settings.retention_tiers = []
+    rng = np.random.default_rng(7)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            end = START + args.days * 86400
+            price = _write(np.arange(START, end, args.step), rng, 60000.0)
+            n_snapshots = (end - START) // args.step
+
+            started = time.perf_counter()
+            candles.refresh(SYMBOL)
+            load_s = time.perf_counter() - started
+
+            update_ms = []
+            for k in range(args.updates):
+                price = _write(np.array([end + k * args.step]), rng, price)
+                started = time.perf_counter()
+                candles.refresh(SYMBOL)
+                update_ms.append((time.perf_counter() - started) * 1000)
+
+            print(f"{n_snapshots} snapshots; carga inicial {load_s:.2f}s; refresh por snapshot "
+                  f"p50 {statistics.median(update_ms):.3f}ms\n")
+            print(f"{'intervalo':<10}{'memória':>12}{'recalculado':>14}{'iguais':>8}")
+            for interval in settings.candle_intervals + ["7min"]:
+                memory = _timed(lambda: candles.get_candles(SYMBOL, interval, limit=args.limit), args.repeat)
+                recomputed = _timed(lambda: _recomputed(interval, args.limit), args.repeat)
+                same = candles.get_candles(SYMBOL, interval) == _recomputed(interval, None)
+                print(f"{interval:<10}{memory * 1000:>10.2f}ms{recomputed * 1000:>12.2f}ms{str(same):>8}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Benchmark do pipeline de captura contra a exchange local (`stub_exchange`).
+
+Compara a captura antiga (requests bloqueante + escrita no event loop) com a
+captura assíncrona (cliente httpx compartilhado + escrita fora do loop),
+medindo a latência do event loop e as capturas por segundo à medida que o
+número de símbolos cresce.
+
+Uso:
+    python -m benchmarks.capture_pipeline --symbols 1 2 4 8 16 --rounds 5
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+import requests  # noqa: E402
+
+from app.config.settings import settings  # noqa: E402
+from app.services import order_book, snapshot_store  # noqa: E402
+from app.services.book_levels import OrderBook  # noqa: E402
+from benchmarks.stub_exchange import StubExchange  # noqa: E402
+
+
+def _legacy_capture(symbol: str):
+    """
+    Reproduz a captura original: duas chamadas bloqueantes e escrita síncrona.
+    """
+    response = requests.get(f"{settings.exchange_base_url}/api/v3/depth",
+                            params={"symbol": symbol, "limit": settings.depth_limit}, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    price = requests.get(f"{settings.exchange_base_url}/api/v3/ticker/price",
+                         params={"symbol": symbol}, timeout=10)
+    price.raise_for_status()
+    book = OrderBook.from_depth(data)
+    timestamp = int(datetime.now().timestamp())
+    for side in snapshot_store.SIDES:
+        snapshot_store.append_snapshot(symbol, side, timestamp, float(price.json()["price"]), book.side(side).levels())
+
+
+async def _legacy_round(symbols: list[str]):
+    for symbol in symbols:
+        _legacy_capture(symbol)
+
+
+async def _async_round(symbols: list[str]):
+    await asyncio.gather(*(order_book.capture_order_book(symbol) for symbol in symbols))
+
+
+async def _probe_loop(samples: list[float], stop: asyncio.Event, period: float = 0.005):
+    """
+    Mede o atraso do event loop: quanto cada `sleep(period)` passa do esperado.
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        samples.append(time.perf_counter() - start - period)
+
+
+async def _run(mode: str, symbols: list[str], rounds: int) -> dict:
+    round_fn = _legacy_round if mode == "legacy" else _async_round
+    samples: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_loop(samples, stop))
+    await asyncio.sleep(0.02)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await round_fn(symbols)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe
+    await order_book.close_http_client()
+
+    samples.sort()
+    return {
+        "captures_per_s": len(symbols) * rounds / elapsed,
+        "loop_p50_ms": statistics.median(samples) * 1000 if samples else 0.0,
+        "loop_p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000 if samples else 0.0,
+        "loop_max_ms": samples[-1] * 1000 if samples else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--levels", type=int, default=800)
+    parser.add_argument("--flush-seconds", type=float, default=settings.writer_flush_seconds,
+                        help="prazo do group commit do writer (a captura assíncrona espera o lote ser gravado)")
+    args = parser.parse_args()
+
+    settings.depth_limit = args.levels
+    settings.writer_flush_seconds = args.flush_seconds
+    print(f"{'modo':<8}{'símbolos':>10}{'capt/s':>10}{'loop p50':>11}{'loop p99':>11}{'loop max':>11}")
+    with StubExchange(latency=args.latency_ms / 1000, levels=args.levels) as stub, \
+            tempfile.TemporaryDirectory() as workdir:
+        settings.exchange_base_url = stub.base_url
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for count in args.symbols:
+                symbols = [f"SYM{i}USDT" for i in range(count)]
+                for mode in ("legacy", "async"):
+                    # Silencia o print por linha do CSV para não medir o terminal
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        result = asyncio.run(_run(mode, symbols, args.rounds))
+                    print(f"{mode:<8}{count:>10}{result['captures_per_s']:>10.1f}"
+                          f"{result['loop_p50_ms']:>9.1f}ms{result['loop_p99_ms']:>9.1f}ms"
+                          f"{result['loop_max_ms']:>9.1f}ms")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Benchmark da captura em processos separados (`CAPTURE_WORKERS`).
+
+Sobe a exchange local num processo à parte e, para cada configuração, captura
+os símbolos em laço contínuo (`capture_interval_seconds = 0`) durante alguns
+segundos: primeiro dentro do processo da API (0 workers) e depois com 1, 2,
+4... workers. Mede as capturas por segundo e o atraso do event loop do
+processo da API, que é o que as requisições HTTP sentem.
+
+Uso:
+    python -m benchmarks.capture_workers --symbols 8 --workers 0 1 2 4 --seconds 10
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.schedules import order_book as schedule  # noqa: E402
+from app.services import snapshot_store  # noqa: E402
+from benchmarks.capture_pipeline import _probe_loop  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def _stub_process(latency_ms: float, port: int):
+    """
+    Exchange local em outro processo, para não disputar o GIL com a API medida.
+    """
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_exchange",
+                                "--port", str(port), "--latency-ms", str(latency_ms)],
+                               stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                break
+            time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@contextlib.contextmanager
+def _silence_stdout():
+    """
+    Silencia os prints de captura, inclusive os dos workers (que herdam o fd 1).
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+def _stored_snapshots(symbols: list[str]) -> int:
+    return sum(len(snapshot_store.read_snapshots(symbol, side)[0])
+               for symbol in symbols for side in snapshot_store.SIDES)
+
+
+async def _run(workers: int, symbols: list[str], seconds: float) -> dict:
+    settings.capture_workers = workers
+    samples: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_loop(samples, stop))
+
+    await schedule.start_schedule()
+    # Descarta o tempo de subida dos processos
+    await asyncio.sleep(3 if workers else 0.5)
+    before, samples[:] = _stored_snapshots(symbols), []
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    captured = _stored_snapshots(symbols) - before
+    elapsed = time.perf_counter() - start
+    await schedule.stop_schedule()
+
+    stop.set()
+    await probe
+    samples.sort()
+    return {
+        # Cada captura grava um snapshot de bids e um de asks
+        "captures_per_s": captured / 2 / elapsed,
+        "loop_p50_ms": statistics.median(samples) * 1000 if samples else 0.0,
+        "loop_p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000 if samples else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    settings.symbols = symbols
+    settings.capture_interval_seconds = 0
+    # Em laço contínuo o prazo do group commit só limitaria a vazão medida
+    settings.writer_flush_seconds = 0.0
+    print(f"{'workers':<9}{'capt/s':>10}{'loop p50':>11}{'loop p99':>11}")
+    with _stub_process(args.latency_ms, _free_port()) as base_url, tempfile.TemporaryDirectory() as workdir:
+        settings.exchange_base_url = base_url
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for workers in args.workers:
+                with _silence_stdout():
+                    result = asyncio.run(_run(workers, symbols, args.seconds))
+                print(f"{workers:<9}{result['captures_per_s']:>10.1f}"
+                      f"{result['loop_p50_ms']:>9.1f}ms{result['loop_p99_ms']:>9.1f}ms")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
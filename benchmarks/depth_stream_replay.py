@@ -0,0 +1,106 @@
+"""
+Benchmark/verificação da captura por stream contra `stub_depth_feed`.
+
+Conecta um `DepthStream` ao stream local, deixa os eventos correrem por
+alguns segundos (opcionalmente com eventos descartados para forçar
+ressincronização), pausa o stream e confere se o livro local ficou idêntico
+ao livro verdadeiro. Em paralelo grava snapshots do livro local na cadência
+pedida, como faz o agendador.
+
+Uso:
+    python -m benchmarks.depth_stream_replay --seconds 5 --rate 500 --gap-rate 0.001 --snapshot-interval 0.25
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import order_book  # noqa: E402
+from app.services.depth_stream import DepthStream, capture_from_stream  # noqa: E402
+from benchmarks.stub_depth_feed import StubDepthFeed  # noqa: E402
+from benchmarks.stub_exchange import StubExchange  # noqa: E402
+
+
+async def _run(feed: StubDepthFeed, seconds: float, snapshot_interval: float) -> dict:
+    stream = DepthStream("BTCUSDT")
+    feeder = asyncio.create_task(stream.run())
+    snapshots = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        await asyncio.sleep(snapshot_interval)
+        # Silencia o print por snapshot gravado
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            snapshots += await capture_from_stream(stream)
+    elapsed = time.perf_counter() - start
+
+    # Pausa o stream e espera o livro local alcançar o último evento publicado
+    feed.paused.set()
+    deadline = time.perf_counter() + 5
+    while time.perf_counter() < deadline:
+        if stream.book is not None and stream.book.last_update_id == feed.last_update_id:
+            break
+        await asyncio.sleep(0.05)
+
+    feeder.cancel()
+    await asyncio.gather(feeder, return_exceptions=True)
+    await order_book.close_http_client()
+
+    # Compara os níveis gravados (`depth_limit`): além da profundidade do
+    # snapshot inicial o livro local é, por construção, incompleto
+    book = stream.book
+    depth = settings.depth_limit
+    matches = (
+        book is not None
+        and book.last_update_id == feed.last_update_id
+        and book.bids.levels(depth).tolist() == [list(level) for level in sorted(feed.bids.items(), reverse=True)[:depth]]
+        and book.asks.levels(depth).tolist() == [list(level) for level in sorted(feed.asks.items())[:depth]]
+    )
+    return {
+        "events": stream.events,
+        "events_per_s": stream.events / elapsed,
+        "resyncs": stream.resyncs,
+        "reconnects": stream.reconnects,
+        "snapshots": snapshots,
+        "matches": matches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--rate", type=float, default=500.0)
+    parser.add_argument("--gap-rate", type=float, default=0.0)
+    parser.add_argument("--snapshot-interval", type=float, default=0.25)
+    parser.add_argument("--record", help="JSONL gravado: snapshot na primeira linha, eventos nas demais")
+    args = parser.parse_args()
+
+    with StubDepthFeed(rate=args.rate, gap_rate=args.gap_rate, record=args.record) as feed, \
+            StubExchange(latency=0.0, depth_source=feed.depth_body) as stub, \
+            tempfile.TemporaryDirectory() as workdir:
+        settings.exchange_base_url = stub.base_url
+        settings.exchange_ws_url = feed.ws_url
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            result = asyncio.run(_run(feed, args.seconds, args.snapshot_interval))
+        finally:
+            os.chdir(cwd)
+
+    print(f"eventos recebidos:   {result['events']} ({result['events_per_s']:.0f}/s)")
+    print(f"eventos descartados: {feed.dropped}")
+    print(f"ressincronizações:   {result['resyncs']}")
+    print(f"reconexões:          {result['reconnects']}")
+    print(f"snapshots gravados:  {result['snapshots']}")
+    print(f"livro local == verdadeiro: {'sim' if result['matches'] else 'NÃO'}")
+    return 0 if result["matches"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
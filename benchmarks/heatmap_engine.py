@@ -0,0 +1,114 @@
+"""
+Benchmark do cálculo do heatmap sobre dados brutos: o caminho antigo em pandas
+(fuso convertido em todas as linhas, `groupby` + `reindex` num MultiIndex,
+linha de mercado com `argmin` por bucket) contra o motor NumPy atual
+(`grid_from_columns`: códigos inteiros, `np.bincount` na matriz e fuso só nos
+snapshots), com dados sintéticos de bids + asks.
+
+O caminho antigo precisa de várias cópias das colunas; acima de
+`--legacy-max-rows` ele é pulado para não estourar a memória. Quando os dois
+rodam, o benchmark confere que as matrizes são iguais.
+
+Uso:
+    python -m benchmarks.heatmap_engine --rows 1000000 10000000 50000000 --bucket-time 15min
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.services.heatmap import definir_bucket_size, grid_from_columns, nearest_bucket_index  # noqa: E402
+from app.services.heatmap_grid import TIMEZONE  # noqa: E402
+
+
+def _synthetic_side(rows: int, levels: int, bid: bool, rng: np.random.Generator) -> dict[str, np.ndarray]:
+    """
+    Colunas no formato de `read_columns`: um snapshot por minuto com `levels`
+    níveis ao redor de um preço em passeio aleatório.
+    """
+    snapshots = max(rows // levels, 1)
+    timestamps = 1_700_000_000 + np.arange(snapshots, dtype=np.int64) * 60
+    current_price = 60000 + np.cumsum(rng.normal(0, 5, snapshots))
+    offsets = np.arange(1, levels + 1) * 0.5
+    price = (current_price[:, None] + (-offsets if bid else offsets)).ravel()
+    return {
+        "timestamp": np.repeat(timestamps, levels),
+        "price": np.round(price, 2),
+        "volume": rng.random(snapshots * levels),
+        "current_price": np.repeat(current_price, levels),
+    }
+
+
+def _legacy(parts: list[dict], bucket_time: str) -> tuple[np.ndarray, list[str]]:
+    """
+    Reproduz o caminho antigo: DataFrame por lado, concat, groupby e argmin.
+    """
+    frames = []
+    for part in parts:
+        df = pd.DataFrame(part)
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s").dt.tz_localize("UTC").dt.tz_convert(TIMEZONE)
+        frames.append(df)
+    combined_df = pd.concat(frames)
+    bucket_size = definir_bucket_size(combined_df["price"].min(), combined_df["price"].max())
+    combined_df["price_bucket"] = (combined_df["price"] // bucket_size) * bucket_size
+    combined_df["time_bucket"] = combined_df["timestamp"].dt.floor(bucket_time)
+    price_buckets = np.sort(combined_df["price_bucket"].unique())
+    time_buckets = pd.DatetimeIndex(np.sort(combined_df["time_bucket"].unique()))
+    index_grid = pd.MultiIndex.from_product([price_buckets, time_buckets], names=["price_bucket", "time_bucket"])
+    grouped = (
+        combined_df.groupby(["price_bucket", "time_bucket"])["volume"]
+        .sum()
+        .reindex(index_grid, fill_value=0)
+        .sort_index()
+    )
+    market_line = combined_df.groupby("time_bucket")["current_price"].mean().reindex(time_buckets).ffill().bfill()
+    line_y = [f"{price_buckets[np.abs(price_buckets - price).argmin()]:.2f}" for price in market_line]
+    return grouped.values.reshape(len(price_buckets), len(time_buckets)), line_y
+
+
+def _engine(parts: list[dict], bucket_time: str) -> tuple[np.ndarray, list[str]]:
+    grid = grid_from_columns(parts, None, bucket_time)
+    labels = np.char.mod("%.2f", grid.price_buckets)
+    return grid.z, labels[nearest_bucket_index(grid.price_buckets, grid.market_price)].tolist()
+
+
+def _timed(func, *args) -> tuple[float, tuple]:
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument("--levels", type=int, default=800)
+    parser.add_argument("--bucket-time", default="15min")
+    parser.add_argument("--legacy-max-rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    print(f"{'linhas':>12}{'grid':>14}{'pandas':>10}{'numpy':>10}{'ganho':>9}  iguais")
+    for rows in args.rows:
+        rng = np.random.default_rng(7)
+        parts = [_synthetic_side(rows // 2, args.levels, bid, rng) for bid in (True, False)]
+        engine_s, (z, line_y) = _timed(_engine, parts, args.bucket_time)
+        shape = "×".join(str(n) for n in z.shape)
+
+        if rows <= args.legacy_max_rows:
+            legacy_s, (legacy_z, legacy_line) = _timed(_legacy, parts, args.bucket_time)
+            same = legacy_z.shape == z.shape and np.allclose(legacy_z, z) and legacy_line == line_y
+            print(f"{rows:>12,}{shape:>14}{legacy_s:>9.2f}s{engine_s:>9.2f}s{legacy_s / engine_s:>8.1f}x  {same}")
+        else:
+            print(f"{rows:>12,}{shape:>14}{'—':>10}{engine_s:>9.2f}s{'—':>9}  —")
+        del parts, z
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Benchmark da pirâmide de tiles do heatmap (`app/services/heatmap_tiles.py`).
+
+Grava um histórico sintético de N dias (`benchmarks.synthetic_book`), constrói
+a pirâmide e mede, para janelas de 10 minutos até o histórico inteiro, o tempo
+e o tamanho da resposta de uma viewport (`viewport_json`) e do heatmap de
+`/heatmap/data` sobre os dados brutos da mesma janela (`bucket_time` ~ janela /
+`--width`, bucket de preço automático). Mede também o custo de incorporar
+cada snapshot novo à pirâmide (`refresh`) e o tempo da carga inicial.
+
+Uso:
+    python -m benchmarks.heatmap_tiles --days 7 --interval 60 --levels 500
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import heatmap_tiles  # noqa: E402
+from app.services.heatmap import generate_heatmap_json  # noqa: E402
+from benchmarks.synthetic_book import START, write_history  # noqa: E402
+
+SYMBOL = "BTCUSDT"
+WINDOWS = [("10min", 600), ("1h", 3600), ("1d", 86400), ("7d", 7 * 86400), ("tudo", None)]
+
+
+def _timed(func, repeat: int) -> tuple[float, int]:
+    samples, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(func())
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), size
+
+
+def _raw(start: int, end: int, width: int) -> str:
+    bucket_time = f"{max((end - start) // width, 1)}s"
+    return generate_heatmap_json(SYMBOL, None, bucket_time, None, datetime.fromtimestamp(start, tz=timezone.utc),
+                                 datetime.fromtimestamp(end, tz=timezone.utc))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=7.0)
+    parser.add_argument("--interval", type=float, default=60.0, help="Segundos entre snapshots")
+    parser.add_argument("--levels", type=int, default=500, help="Níveis por lado")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=256)
+    parser.add_argument("--updates", type=int, default=50, help="Snapshots incrementais a medir")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    settings.aggregate_time_buckets = []
+    settings.retention_tiers = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            summary = write_history(SYMBOL, args.days * 24, args.interval, args.levels, storage_format="columnar")
+            print(f"{summary['snapshots']} snapshots, {summary['rows']} níveis")
+
+            started = time.perf_counter()
+            heatmap_tiles.refresh(SYMBOL)
+            heatmap_tiles.flush()
+            print(f"Carga inicial da pirâmide: {time.perf_counter() - started:.1f}s")
+
+            end = START + int(args.days * 86400) - 1
+            print(f"\n{'janela':<8}{'nível':>6}{'células':>10}{'tiles ms':>10}{'tiles KiB':>11}"
+                  f"{'brutos ms':>11}{'brutos KiB':>12}")
+            for name, seconds in WINDOWS:
+                start = START if seconds is None or seconds > end - START else end - seconds
+                viewport = lambda: heatmap_tiles.viewport_json(SYMBOL, None, start, end, None, None,  # noqa: E731
+                                                               args.width, args.height)
+                payload = json.loads(viewport())
+                tiles_seconds, tiles_size = _timed(viewport, args.repeat)
+                raw_seconds, raw_size = _timed(lambda: _raw(start, end, args.width), args.repeat)
+                print(f"{name:<8}{payload['level']:>6}{payload['shape'][0] * payload['shape'][1]:>10}"
+                      f"{tiles_seconds * 1000:>10.1f}{tiles_size / 1024:>11.0f}"
+                      f"{raw_seconds * 1000:>11.1f}{raw_size / 1024:>12.0f}")
+
+            samples = []
+            for k in range(args.updates):
+                write_history(SYMBOL, args.interval / 3600, args.interval, args.levels, seed=k,
+                              start=end + 1 + int(k * args.interval))
+                started = time.perf_counter()
+                heatmap_tiles.refresh(SYMBOL)
+                samples.append(time.perf_counter() - started)
+            print(f"\nrefresh por snapshot: p50 {statistics.median(samples) * 1000:.2f} ms, "
+                  f"máx. {max(samples) * 1000:.2f} ms")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Benchmark de memória dos histogramas sobre todo o histórico (`minutes=0`).
+
+Grava um histórico sintético de N dias (um snapshot por minuto por lado) e
+mede, com `tracemalloc`, o pico de memória alocada e o tempo do caminho antigo
+(todas as colunas carregadas de uma vez) e do acumulado em blocos
+(`snapshot_store.iter_snapshots`). O pico do caminho antigo cresce com o
+histórico; o do acumulado fica limitado por `--chunk-rows`. O benchmark também
+confere que as barras são iguais.
+
+Uso:
+    python -m benchmarks.histogram_memory --days 1 4 16 --levels 800 --chunk-rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import snapshot_store  # noqa: E402
+from app.services.book_levels import bucket_codes  # noqa: E402
+from app.services.histogram import _accumulate, _histogram_bars  # noqa: E402
+
+SYMBOL = "BTCUSDT"
+START = 1_700_006_400  # meia-noite UTC
+
+
+def _write_history(days_from: int, days_to: int, levels: int, rng: np.random.Generator):
+    offsets = np.arange(1, levels + 1) * 0.5
+    for day in range(days_from, days_to):
+        timestamps = START + day * 86400 + np.arange(1440) * 60
+        current_prices = 60000 + np.cumsum(rng.normal(0, 5, len(timestamps)))
+        for side, sign in (("bids", -1), ("asks", 1)):
+            snapshot_store.append_snapshots(
+                SYMBOL, side, timestamps.tolist(), current_prices.tolist(),
+                [np.column_stack([np.round(price + sign * offsets, 2), rng.random(levels)]) for price in current_prices],
+            )
+
+
+def _legacy(side: str, bucket_size: float) -> dict:
+    """
+    Caminho antigo: `read_columns` da janela inteira e agregação de uma vez.
+    """
+    columns = snapshot_store.read_columns(SYMBOL, side)
+    timestamps = columns["timestamp"]
+    codes, inverse = np.unique(bucket_codes(columns["price"], bucket_size), return_inverse=True)
+    latest = len(timestamps) - 1 - int(np.argmax(timestamps[::-1]))
+    return {"codes": codes, "volumes": np.bincount(inverse, weights=columns["volume"]),
+            "current_price": float(columns["current_price"][latest]), "since": int(timestamps.min())}
+
+
+def _measure(func, *args) -> tuple[float, float, object]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20, elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--levels", type=int, default=800)
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--bucket-size", type=float, default=100.0)
+    parser.add_argument("--compress", action="store_true", help="Comprime os segmentos fechados antes de medir")
+    args = parser.parse_args()
+
+    settings.aggregate_time_buckets = []
+    settings.retention_tiers = []
+    settings.read_chunk_rows = args.chunk_rows
+    rng = np.random.default_rng(7)
+
+    print(f"{'dias':>5}{'linhas':>14}{'antigo MiB':>12}{'antigo s':>10}{'blocos MiB':>12}{'blocos s':>10}  iguais")
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            written = 0
+            for days in sorted(args.days):
+                _write_history(written, days, args.levels, rng)
+                written = days
+                if args.compress:
+                    for side in snapshot_store.SIDES:
+                        snapshot_store.compress_closed(SYMBOL, side)
+
+                legacy_mib = legacy_s = chunked_mib = chunked_s = 0.0
+                same = True
+                for side in snapshot_store.SIDES:
+                    mib, seconds, legacy = _measure(_legacy, side, args.bucket_size)
+                    legacy_mib, legacy_s = max(legacy_mib, mib), legacy_s + seconds
+                    mib, seconds, chunked = _measure(_accumulate, SYMBOL, side, 0, None, None, args.bucket_size)
+                    chunked_mib, chunked_s = max(chunked_mib, mib), chunked_s + seconds
+                    a, b = _histogram_bars(legacy, None, args.bucket_size), _histogram_bars(chunked, None, args.bucket_size)
+                    same = same and np.array_equal(a["price_buckets"], b["price_buckets"]) \
+                        and np.allclose(a["volumes"], b["volumes"]) \
+                        and a["current_price"] == b["current_price"] and a["since"] == b["since"]
+
+                rows = days * 1440 * args.levels
+                print(f"{days:>5}{rows:>14,}{legacy_mib:>12.1f}{legacy_s:>10.2f}{chunked_mib:>12.1f}{chunked_s:>10.2f}  {same}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Benchmark do tempo de subida: importação dos pontos de entrada.
+
+Para cada ponto de entrada (`app.main`, a API, e `app.capture`, só a captura),
+importa o módulo `--repeat` vezes em interpretadores novos e reporta a mediana
+do tempo de importação, a memória residente máxima do processo (`ru_maxrss`)
+e quais módulos pesados foram carregados. Sai com código 1 se um ponto de
+entrada carregar um módulo que não deveria (pandas/Plotly na subida da API;
+também FastAPI na captura) ou, com `--max-seconds`, se a mediana passar do
+limite. O tempo relativo à linha de base fica com `python -m benchmarks.suite
+--cases startup.import startup.import_capture`.
+
+Uso:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 10 --max-seconds 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Módulos pesados acompanhados
+HEAVY = ["numpy", "pandas", "plotly", "fastapi", "jinja2", "pyarrow"]
+# Ponto de entrada -> módulos que ele não pode carregar na importação
+ENTRY_POINTS = {
+    "app.main": ["pandas", "plotly"],
+    "app.capture": ["pandas", "plotly", "fastapi", "jinja2"],
+}
+
+_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+heavy = {heavy!r}
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [name for name in heavy if name in sys.modules],
+}}))
+"""
+
+
+def _probe(module: str, workdir: str, env: dict) -> dict:
+    code = _PROBE.format(module=module, heavy=HEAVY)
+    output = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Limite para a mediana do tempo de importação de cada ponto de entrada")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    env.setdefault("APP_NAME", "benchmark")
+    env.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+    failures = []
+    print(f"{'ponto de entrada':<18}{'mediana s':>11}{'mín. s':>9}{'RSS MiB':>10}  módulos pesados")
+    with tempfile.TemporaryDirectory() as workdir:
+        # `app.main` monta `static/` relativo ao diretório atual
+        os.makedirs(os.path.join(workdir, "static"))
+        for module in args.entry_points:
+            runs = [_probe(module, workdir, env) for _ in range(args.repeat)]
+            seconds = [run["seconds"] for run in runs]
+            median = statistics.median(seconds)
+            loaded = runs[-1]["loaded"]
+            print(f"{module:<18}{median:>11.3f}{min(seconds):>9.3f}"
+                  f"{statistics.median(run['rss_mib'] for run in runs):>10.0f}  {', '.join(loaded) or '-'}")
+            forbidden = [name for name in ENTRY_POINTS[module] if name in loaded]
+            if forbidden:
+                failures.append(f"{module} carrega {', '.join(forbidden)} na importação")
+            if args.max_seconds is not None and median > args.max_seconds:
+                failures.append(f"{module} leva {median:.3f}s para importar (limite {args.max_seconds:g}s)")
+
+    for failure in failures:
+        print(f"REGRESSÃO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
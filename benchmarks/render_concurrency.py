@@ -0,0 +1,163 @@
+"""
+Benchmark de latência dos endpoints leves enquanto heatmaps pesados estão
+sendo renderizados.
+
+Sobe a API (só o router de order book) num processo separado, sobre um
+histórico sintético, e dispara `--heavy` renderizações de heatmap simultâneas
+em laço (resolução fora dos agregados e bucket de preço diferente a cada
+pedido, para não cair no cache). Ao mesmo tempo mede a latência de
+`/order-books/capture/status` a cada `--probe-ms`. Compara a renderização numa
+thread da API (`render_workers=0`) com o pool de processos e conta as
+respostas 503 (fila cheia ou tempo esgotado).
+
+Uso:
+    python -m benchmarks.render_concurrency --days 1 --heavy 4 --seconds 15 --workers 0 2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import snapshot_store  # noqa: E402
+
+SYMBOL = "BTCUSDT"
+START = 1_700_006_400
+
+
+def _write_history(days: int, levels: int):
+    rng = np.random.default_rng(7)
+    offsets = np.arange(1, levels + 1) * 0.5
+    for day in range(days):
+        timestamps = START + day * 86400 + np.arange(1440) * 60
+        prices = 60000 + np.cumsum(rng.normal(0, 5, len(timestamps)))
+        for side, sign in (("bids", -1), ("asks", 1)):
+            snapshot_store.append_snapshots(
+                SYMBOL, side, timestamps.tolist(), prices.tolist(),
+                [np.column_stack([np.round(price + sign * offsets, 2), rng.random(levels)]) for price in prices],
+            )
+
+
+def _serve(port: int, workdir: str, render_workers: int, queue_limit: int, timeout: float):
+    import uvicorn
+    from fastapi import FastAPI
+
+    os.chdir(workdir)
+    settings.aggregate_time_buckets = []
+    settings.render_workers = render_workers
+    settings.render_queue_limit = queue_limit
+    settings.render_timeout_seconds = timeout
+
+    from app.routers import order_book
+    from app.services.render_pool import render_pool
+
+    app = FastAPI()
+    app.include_router(order_book.router, prefix="/order-books")
+    app.add_event_handler("shutdown", render_pool.shutdown)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            await client.get("/order-books/cache/stats")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("API não subiu")
+
+
+async def _load(base_url: str, heavy: int, seconds: float, probe_ms: float) -> dict:
+    result = {"light": [], "heavy_ok": 0, "heavy_503": 0, "heavy_s": []}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await _wait_ready(client)
+        # Aquece o pool (sobe os processos) antes de medir
+        await client.get("/order-books/heatmap", params={"symbol": SYMBOL, "bucket_time": "7min", "bucket_price": 0.99})
+        deadline = time.perf_counter() + seconds
+        counter = iter(range(10**9))
+
+        async def _heavy():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.get("/order-books/heatmap", params={
+                    "symbol": SYMBOL, "bucket_time": "7min", "bucket_price": 1.0 + next(counter) * 0.001})
+                if response.status_code == 503:
+                    result["heavy_503"] += 1
+                    await asyncio.sleep(0.2)
+                else:
+                    result["heavy_ok"] += 1
+                    result["heavy_s"].append(time.perf_counter() - started)
+
+        async def _probe():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await client.get("/order-books/capture/status")
+                result["light"].append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(probe_ms / 1000)
+
+        await asyncio.gather(_probe(), *(_heavy() for _ in range(heavy)))
+    return result
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--levels", type=int, default=800)
+    parser.add_argument("--heavy", type=int, default=4, help="Renderizações pesadas simultâneas")
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--probe-ms", type=float, default=50.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2], help="render_workers a comparar")
+    parser.add_argument("--queue-limit", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'processos':>9}{'leve p50':>10}{'leve p99':>10}{'leve max':>10}{'pesados':>9}{'pesado p50':>12}{'503':>6}")
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            _write_history(args.days, args.levels)
+            # A API roda dentro do diretório temporário; os templates são relativos à raiz do projeto
+            os.symlink(os.path.join(cwd, "app"), "app", target_is_directory=True)
+        finally:
+            os.chdir(cwd)
+
+        for render_workers in args.workers:
+            port = _free_port()
+            server = context.Process(target=_serve, args=(port, workdir, render_workers, args.queue_limit, args.timeout))
+            server.start()
+            try:
+                result = asyncio.run(_load(f"http://127.0.0.1:{port}", args.heavy, args.seconds, args.probe_ms))
+            finally:
+                server.terminate()
+                server.join()
+            light = result["light"]
+            heavy_p50 = statistics.median(result["heavy_s"]) if result["heavy_s"] else 0.0
+            print(f"{render_workers:>9}{_percentile(light, 50):>8.1f}ms{_percentile(light, 99):>8.1f}ms"
+                  f"{max(light, default=0):>8.1f}ms{result['heavy_ok']:>9}{heavy_p50:>11.2f}s{result['heavy_503']:>6}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Benchmark do agendador de capturas contra a exchange local (`stub_exchange`).
+
+Compara o laço antigo (captura e depois `sleep(intervalo)`, que acumula a
+latência da exchange a cada volta) com o agendador alinhado ao relógio
+(`aligned_ticks`): quantas capturas cada símbolo faz no período, o período
+médio real, a distância do início de cada captura até o limite do intervalo
+(hh:mm:ss exatos; mediana e máximo) e a maior diferença entre símbolos no mesmo disparo. No fim, a
+exchange responde 429 por alguns segundos para conferir o backoff.
+
+Uso:
+    python -m benchmarks.scheduler_alignment --symbols 8 --interval 1 --seconds 10
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.schedules import order_book as schedule  # noqa: E402
+from app.services import order_book  # noqa: E402
+from benchmarks.stub_exchange import StubExchange  # noqa: E402
+
+
+async def _legacy_schedule(symbol: str, on_capture):
+    """
+    Reproduz o laço original: captura e só então dorme o intervalo inteiro.
+    """
+    while schedule.running:
+        try:
+            on_capture(symbol, await order_book.capture_order_book(symbol))
+        except Exception:
+            pass
+        await asyncio.sleep(settings.capture_interval_seconds)
+
+
+async def _run(mode: str, symbols: list[str], seconds: float) -> dict:
+    starts: dict[str, list[float]] = {symbol: [] for symbol in symbols}
+    original_capture = order_book.capture_order_book
+
+    async def timed_capture(symbol: str, timestamp: int = None):
+        starts[symbol].append(time.time())
+        return await original_capture(symbol, timestamp)
+
+    order_book.capture_order_book = timed_capture
+    schedule.capture_order_book = timed_capture
+    runner = _legacy_schedule if mode == "legacy" else schedule._run_schedule
+    schedule.running = True
+    tasks = [asyncio.create_task(runner(symbol, lambda symbol, timestamp: None)) for symbol in symbols]
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        schedule.running = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        order_book.capture_order_book = original_capture
+        schedule.capture_order_book = original_capture
+        await order_book.close_http_client()
+
+    interval = settings.capture_interval_seconds
+    periods = [b - a for times in starts.values() for a, b in zip(times, times[1:])]
+    offsets = [t % interval for times in starts.values() for t in times]
+    # Diferença entre o primeiro e o último símbolo em cada volta
+    rounds = min(len(times) for times in starts.values())
+    spreads = [max(times[i] for times in starts.values()) - min(times[i] for times in starts.values())
+               for i in range(rounds)]
+    return {
+        "captures": sum(len(times) for times in starts.values()) / len(symbols),
+        "period_s": statistics.mean(periods) if periods else 0.0,
+        "offset_p50_ms": statistics.median(offsets) * 1000 if offsets else 0.0,
+        "offset_max_ms": max(offsets) * 1000 if offsets else 0.0,
+        "spread_max_ms": max(spreads) * 1000 if spreads else 0.0,
+    }
+
+
+async def _run_throttled(stub: StubExchange, symbols: list[str], seconds: float, throttle: float) -> dict:
+    schedule.backoff.reset()
+    schedule.running = True
+    tasks = [asyncio.create_task(schedule._run_schedule(symbol, lambda symbol, timestamp: None)) for symbol in symbols]
+    await asyncio.sleep(1)
+    requests_before = stub.requests
+    stub.throttle(throttle)
+    await asyncio.sleep(seconds)
+    schedule.running = False
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await order_book.close_http_client()
+    return {
+        "requests": stub.requests - requests_before,
+        "throttled": stub.throttled,
+        "stats": {symbol: schedule.tick_stats[symbol].as_dict() for symbol in symbols},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=8)
+    parser.add_argument("--interval", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--throttle-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    settings.capture_interval_seconds = args.interval
+    settings.capture_jitter_seconds = 0.0
+    settings.max_inflight_captures = args.symbols
+    print(f"{'modo':<9}{'capturas':>10}{'período':>10}{'limite p50':>12}{'limite max':>12}{'dif. símbolos':>15}")
+    with StubExchange(latency=args.latency_ms / 1000) as stub, tempfile.TemporaryDirectory() as workdir:
+        settings.exchange_base_url = stub.base_url
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for mode in ("legacy", "aligned"):
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    result = asyncio.run(_run(mode, symbols, args.seconds))
+                print(f"{mode:<9}{result['captures']:>10.1f}{result['period_s']:>9.3f}s"
+                      f"{result['offset_p50_ms']:>10.0f}ms{result['offset_max_ms']:>10.0f}ms"
+                      f"{result['spread_max_ms']:>13.0f}ms")
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(_run_throttled(stub, symbols, args.seconds, args.throttle_seconds))
+        finally:
+            os.chdir(cwd)
+
+    stats = result["stats"][symbols[0]]
+    print(f"\n429 por {args.throttle_seconds:.0f}s: {result['throttled']} respostas limitadas de "
+          f"{result['requests']} requisições; {symbols[0]}: {stats['limitados_pela_exchange']} limitadas, "
+          f"{stats['pulados']} disparos pulados, {stats['capturas']} capturas")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Benchmark da gravação dos snapshots: escrita imediata (um snapshot por vez,
+como antes do writer) contra o writer em lote (group commit), nos formatos
+csv e colunar.
+
+Cada rodada simula um disparo do agendador: todos os símbolos entregam um
+snapshot ao mesmo tempo e a rodada termina quando todos estão gravados. O csv
+imediato reproduz a escrita antiga, linha a linha com um print por linha
+(enviado para /dev/null, então o custo do terminal nem entra na conta).
+
+Uso:
+    python -m benchmarks.snapshot_writer --symbols 16 --rounds 50 --levels 800
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import snapshot_store  # noqa: E402
+from app.services.book_levels import BookSide, OrderBook  # noqa: E402
+from app.services.snapshot_writer import snapshot_writer  # noqa: E402
+
+
+def _random_book(levels: int, rng: np.random.Generator) -> OrderBook:
+    offsets = np.arange(1, levels + 1) * 0.01
+    return OrderBook(
+        BookSide(True, np.round(60000 - offsets[::-1], 2), rng.random(levels) * 2),
+        BookSide(False, np.round(60000 + offsets, 2), rng.random(levels) * 2),
+    )
+
+
+def _legacy_csv(symbol: str, book: OrderBook, timestamp: int, datetime_local: str, current_price: float):
+    """
+    Escrita antiga do csv: abre o arquivo por lado e imprime cada linha gravada.
+    """
+    for side, label in (("bids", "BID"), ("asks", "ASK")):
+        path = snapshot_store.csv_path(symbol, side)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, mode="a", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            for price, volume in book.side(side).levels().tolist():
+                row = [timestamp, datetime_local, price, volume, current_price]
+                print(f"[{datetime_local}] [{label}] {symbol} → {row}")
+                writer.writerow(row)
+
+
+def _legacy_columnar(symbol: str, book: OrderBook, timestamp: int, datetime_local: str, current_price: float):
+    for side in snapshot_store.SIDES:
+        snapshot_store.append_snapshot(symbol, side, timestamp, current_price, book.side(side).levels())
+
+
+def _run(mode: str, storage: str, symbols: list[str], books: list[OrderBook], rounds: int) -> float:
+    settings.storage_format = storage
+    legacy = _legacy_csv if storage == "csv" else _legacy_columnar
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for i in range(rounds):
+                timestamp = 1_700_000_000 + i
+                if mode == "imediato":
+                    for symbol, book in zip(symbols, books):
+                        legacy(symbol, book, timestamp, "2023-11-14 22:13:20", 60000.0)
+                else:
+                    futures = [snapshot_writer.submit(symbol, book, timestamp, "2023-11-14 22:13:20", 60000.0)
+                               for symbol, book in zip(symbols, books)]
+                    concurrent.futures.wait(futures)
+            snapshot_writer.close()
+        finally:
+            os.chdir(cwd)
+    return len(symbols) * rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--levels", type=int, default=800)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    books = [_random_book(args.levels, rng) for _ in symbols]
+    settings.aggregate_time_buckets = []
+    settings.compress_closed_segments = False
+    # Sem prazo: o lote é tudo o que chegou enquanto o anterior era gravado
+    settings.writer_flush_seconds = 0.0
+
+    print(f"{'formato':<10}{'modo':<10}{'snapshots/s':>13}")
+    for storage in ("csv", "columnar"):
+        for mode in ("imediato", "lote"):
+            rate = _run(mode, storage, symbols, books, args.rounds)
+            print(f"{storage:<10}{mode:<10}{rate:>13.1f}")
+    stats = snapshot_writer.stats()
+    print(f"\nwriter: {stats['lotes']} lotes, {stats['snapshots']} snapshots")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
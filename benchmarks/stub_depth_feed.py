@@ -0,0 +1,187 @@
+"""
+Stream de diff-depth de mentira para testar a captura por WebSocket.
+
+Mantém um livro "verdadeiro" e publica as alterações dele no formato do
+`<symbol>@depth` da Binance (`U`, `u`, `b`, `a`). O snapshot REST
+(`/api/v3/depth`, via `StubExchange`) sai do mesmo livro com o
+`lastUpdateId` correspondente. Os eventos podem ser sintéticos ou
+reproduzidos de um arquivo JSONL gravado (primeira linha = snapshot,
+demais = eventos). `gap_rate` descarta eventos de propósito para exercitar a
+ressincronização.
+
+Uso isolado:
+    python -m benchmarks.stub_depth_feed --port 8901 --rate 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from websockets.asyncio.server import serve
+
+
+class StubDepthFeed:
+    """
+    Servidor WebSocket em thread própria que publica `rate` eventos por segundo.
+    """
+
+    def __init__(self, port: int = 0, rate: float = 100.0, levels: int = 1000, gap_rate: float = 0.0,
+                 record: str = None, mid: float = 60000.0, tick: float = 0.01, seed: int = 7):
+        self.rate = rate
+        self.gap_rate = gap_rate
+        self.published = 0
+        self.dropped = 0
+        self.paused = threading.Event()
+        self._rng = random.Random(seed)
+        self._mid = mid
+        self._tick = tick
+        self._port = port
+        self._lock = threading.Lock()
+        self._clients: set = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve_forever, daemon=True)
+
+        self._replay = None
+        if record:
+            with open(record) as f:
+                snapshot = json.loads(f.readline())
+                self._replay = [json.loads(line) for line in f if line.strip()]
+        else:
+            snapshot = {
+                "lastUpdateId": 1,
+                "bids": [[mid - (i + 1) * tick, self._rng.random() * 2] for i in range(levels)],
+                "asks": [[mid + (i + 1) * tick, self._rng.random() * 2] for i in range(levels)],
+            }
+        self.last_update_id = int(snapshot["lastUpdateId"])
+        self.bids = {round(float(p), 2): round(float(q), 8) for p, q in snapshot["bids"]}
+        self.asks = {round(float(p), 2): round(float(q), 8) for p, q in snapshot["asks"]}
+
+    # --- livro verdadeiro -------------------------------------------------
+
+    def depth_body(self, limit: int) -> bytes:
+        """
+        Snapshot REST consistente com o último evento publicado.
+        """
+        with self._lock:
+            bids = sorted(self.bids.items(), reverse=True)[:limit]
+            asks = sorted(self.asks.items())[:limit]
+            last_update_id = self.last_update_id
+        return json.dumps({
+            "lastUpdateId": last_update_id,
+            "bids": [[f"{p:.2f}", f"{q:.8f}"] for p, q in bids],
+            "asks": [[f"{p:.2f}", f"{q:.8f}"] for p, q in asks],
+        }).encode()
+
+    def _next_event(self) -> dict | None:
+        if self._replay is not None:
+            return self._replay.pop(0) if self._replay else None
+
+        def changes(side: int) -> list:
+            out = []
+            for _ in range(self._rng.randint(1, 8)):
+                price = round(self._mid + side * self._rng.randint(1, 1200) * self._tick, 2)
+                quantity = 0.0 if self._rng.random() < 0.3 else self._rng.random() * 2
+                out.append([f"{price:.2f}", f"{quantity:.8f}"])
+            return out
+
+        first = self.last_update_id + 1
+        return {"e": "depthUpdate", "E": int(time.time() * 1000), "U": first,
+                "u": first + self._rng.randint(0, 3), "b": changes(-1), "a": changes(1)}
+
+    def _apply(self, event: dict):
+        with self._lock:
+            for levels, book in ((event["b"], self.bids), (event["a"], self.asks)):
+                for price, quantity in levels:
+                    price, quantity = round(float(price), 2), float(quantity)
+                    if quantity == 0.0:
+                        book.pop(price, None)
+                    else:
+                        book[price] = quantity
+            self.last_update_id = event["u"]
+
+    # --- servidor ---------------------------------------------------------
+
+    async def _handler(self, websocket):
+        self._clients.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self._clients.discard(websocket)
+
+    async def _publish(self):
+        interval = 1 / self.rate
+        next_at = time.perf_counter()
+        while True:
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            if self.paused.is_set() or not self._clients:
+                next_at = time.perf_counter()
+                continue
+            event = self._next_event()
+            if event is None:
+                continue
+            self._apply(event)
+            if self.gap_rate and self._rng.random() < self.gap_rate:
+                self.dropped += 1
+                continue
+            message = json.dumps(event)
+            for websocket in list(self._clients):
+                try:
+                    await websocket.send(message)
+                except Exception:
+                    self._clients.discard(websocket)
+            self.published += 1
+
+    async def _main(self):
+        async with serve(self._handler, "127.0.0.1", self._port) as server:
+            self._server = server
+            self._ready.set()
+            await self._publish()
+
+    def _serve_forever(self):
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self._main())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    @property
+    def ws_url(self) -> str:
+        host, port = next(iter(self._server.sockets)).getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    from benchmarks.stub_exchange import StubExchange
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--rest-port", type=int, default=8900)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--gap-rate", type=float, default=0.0)
+    parser.add_argument("--record", help="JSONL gravado: snapshot na primeira linha, eventos nas demais")
+    args = parser.parse_args()
+    with StubDepthFeed(port=args.port, rate=args.rate, gap_rate=args.gap_rate, record=args.record) as feed, \
+            StubExchange(port=args.rest_port, latency=0.0, depth_source=feed.depth_body) as stub:
+        print(f"Stream em {feed.ws_url}, REST em {stub.base_url} (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,118 @@
+"""
+Exchange local de mentira para benchmarks: responde `/api/v3/depth` e
+`/api/v3/ticker/price` no mesmo formato da Binance, com latência artificial.
+
+Uso isolado:
+    python -m benchmarks.stub_exchange --port 8900 --latency-ms 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def build_depth_payload(levels: int, mid: float = 60000.0, tick: float = 0.01, seed: int = 7) -> bytes:
+    """
+    Monta uma resposta de depth com `levels` níveis de cada lado.
+    """
+    rng = random.Random(seed)
+    bids = [[f"{mid - (i + 1) * tick:.2f}", f"{rng.random() * 2:.8f}"] for i in range(levels)]
+    asks = [[f"{mid + (i + 1) * tick:.2f}", f"{rng.random() * 2:.8f}"] for i in range(levels)]
+    return json.dumps({"lastUpdateId": 1, "bids": bids, "asks": asks}).encode()
+
+
+class StubExchange:
+    """
+    Servidor HTTP em thread própria. `latency` simula o tempo de rede da exchange.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.05, levels: int = 800, depth_source=None):
+        self.latency = latency
+        # Opcional: função limit → corpo do depth (ex.: livro vivo do `stub_depth_feed`)
+        self.depth_source = depth_source
+        self.requests = 0
+        self.throttled = 0
+        self._throttle_until = 0.0
+        self._depth = {}
+        self._levels = levels
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                stub.requests += 1
+                time.sleep(stub.latency)
+                retry_after = stub._throttle_until - time.time()
+                if retry_after > 0:
+                    stub.throttled += 1
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(max(1, round(retry_after))))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if url.path == "/api/v3/depth":
+                    limit = int(query.get("limit", [stub._levels])[0])
+                    body = stub.depth_source(limit) if stub.depth_source else stub._depth.get(limit)
+                    if body is None:
+                        body = stub._depth.setdefault(limit, build_depth_payload(limit))
+                elif url.path == "/api/v3/ticker/price":
+                    symbol = query.get("symbol", ["BTCUSDT"])[0]
+                    body = json.dumps({"symbol": symbol, "price": "60000.00"}).encode()
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        # Clientes encerrados no meio de uma resposta (ex.: workers parados) não interessam ao benchmark
+        self._server.handle_error = lambda request, client_address: None
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def throttle(self, seconds: float):
+        """
+        Responde 429 (com `Retry-After`) a todas as requisições pelos próximos `seconds` segundos.
+        """
+        self._throttle_until = time.time() + seconds
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    with StubExchange(port=args.port, latency=args.latency_ms / 1000) as stub:
+        print(f"Stub exchange em {stub.base_url} (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
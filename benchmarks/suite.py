@@ -0,0 +1,292 @@
+"""
+Suíte de benchmarks com linha de base salva.
+
+Gera históricos sintéticos determinísticos (`benchmarks.synthetic_book`) em
+alguns tamanhos e mede, para cada um:
+
+- `capture_write.columnar` / `capture_write.csv`: snapshots entregues ao writer
+  da captura em rodadas de `--symbols` símbolos (como um disparo do
+  agendador), com latência por rodada;
+- `heatmap.raw`: heatmap JSON numa resolução fora dos agregados (dados brutos);
+- `heatmap.aggregated`: heatmap JSON numa resolução padrão (agregados em memória);
+- `histogram`: histogramas JSON sobre todo o histórico;
+- `startup.refresh`: carga fria dos agregados do heatmap e dos candles sobre o
+  histórico (o que a API faz na primeira consulta depois de reiniciar);
+- `startup.import` / `startup.import_capture`: tempo para importar `app.main` /
+  o ponto de entrada só de captura (`app.capture`) num processo novo (uma vez,
+  independente do tamanho).
+
+Cada caso reporta latência (p50/p99 das repetições), vazão (níveis ou
+snapshots por segundo) e pico de memória alocada (`tracemalloc`, numa execução
+à parte). Com uma linha de base salva (`--baseline`, padrão
+`benchmarks/baseline.json`), cada métrica é comparada com ela e o comando sai
+com código 1 se alguma piorar mais que `--tolerance`. `--save-baseline`
+grava os resultados atuais como nova linha de base. As medidas dependem da
+máquina: compare sempre com uma linha de base gerada no mesmo ambiente.
+
+Uso:
+    python -m benchmarks.suite --sizes small medium
+    python -m benchmarks.suite --sizes small medium --save-baseline
+    python -m benchmarks.suite --sizes large --cases heatmap.raw histogram --baseline /tmp/base.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import candles, heatmap_aggregates  # noqa: E402
+from app.services.book_levels import BookSide, OrderBook  # noqa: E402
+from app.services.heatmap import generate_heatmap_json  # noqa: E402
+from app.services.histogram import generate_histogram_json  # noqa: E402
+from app.services.snapshot_writer import snapshot_writer  # noqa: E402
+from benchmarks.synthetic_book import generate, write_history  # noqa: E402
+
+SYMBOL = "BTCUSDT"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Histórico de cada tamanho: horas, segundos entre snapshots e níveis por lado
+SIZES = {
+    "small": {"hours": 6, "interval": 60, "levels": 200},
+    "medium": {"hours": 24, "interval": 30, "levels": 500},
+    "large": {"hours": 72, "interval": 30, "levels": 1000},
+}
+CASES = ["capture_write.columnar", "capture_write.csv", "heatmap.raw", "heatmap.aggregated", "histogram",
+         "startup.refresh", "startup.import", "startup.import_capture"]
+# Módulo importado por cada caso de tempo de importação
+IMPORTS = {"startup.import": "app.main", "startup.import_capture": "app.capture"}
+# Métricas comparadas com a linha de base: True = maior é melhor
+COMPARED = {"p50_ms": False, "throughput": True, "peak_mib": False}
+
+
+def _books(hours: float, interval: float, levels: int, limit: int) -> list[tuple[int, float, OrderBook]]:
+    books = []
+    for timestamps, current_prices, bids, asks in generate(SYMBOL, hours, interval, levels):
+        for timestamp, current_price, bid, ask in zip(timestamps.tolist(), current_prices.tolist(), bids, asks):
+            # BookSide guarda os preços em ordem crescente
+            books.append((timestamp, current_price, OrderBook(
+                BookSide(True, bid[::-1, 0].copy(), bid[::-1, 1].copy()),
+                BookSide(False, ask[:, 0].copy(), ask[:, 1].copy()),
+            )))
+            if len(books) >= limit:
+                return books
+    return books
+
+
+def _capture_write(storage_format: str, books: list, symbols: int):
+    """
+    Rodadas de `symbols` snapshots entregues ao writer ao mesmo tempo; retorna
+    a duração de cada rodada (até o lote estar gravado).
+    """
+    settings.storage_format = storage_format
+    names = [f"SYM{k}USDT" for k in range(symbols)]
+    durations = []
+    for timestamp, current_price, book in books[:len(books) // symbols * symbols:symbols]:
+        started = time.perf_counter()
+        datetime_local = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        futures = [snapshot_writer.submit(name, book, timestamp, datetime_local, current_price) for name in names]
+        snapshot_writer.flush()
+        for future in futures:
+            future.result()
+        durations.append(time.perf_counter() - started)
+    snapshot_writer.close()
+    settings.storage_format = "columnar"
+    return durations
+
+
+def _timed(func, repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def _peak_mib(func) -> float:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _cold_refresh():
+    heatmap_aggregates.reset(SYMBOL)
+    candles.reset(SYMBOL)
+    heatmap_aggregates.refresh(SYMBOL)
+    candles.refresh(SYMBOL)
+
+
+def _import_time(workdir: str, repeat: int, module: str) -> list[float]:
+    """
+    Tempo de `import <module>` num interpretador novo (descontado o interpretador vazio).
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+
+    def _run(code: str) -> float:
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, check=True)
+        return time.perf_counter() - started
+
+    empty = min(_run("pass") for _ in range(repeat))
+    return [max(_run(f"import {module}") - empty, 0.0) for _ in range(repeat)]
+
+
+def _result(durations: list[float], work: float, peak: float | None) -> dict:
+    p50 = statistics.median(durations)
+    return {
+        "p50_ms": round(p50 * 1000, 3),
+        "p99_ms": round(float(np.percentile(durations, 99)) * 1000, 3),
+        "throughput": round(work / p50, 1) if work and p50 > 0 else None,
+        "peak_mib": round(peak, 2) if peak is not None else None,
+    }
+
+
+def _run_size(name: str, spec: dict, cases: list[str], repeat: int, symbols: int, write_snapshots: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            summary = write_history(SYMBOL, spec["hours"], spec["interval"], spec["levels"], storage_format="columnar")
+            rows, snapshots = summary["rows"], summary["snapshots"]
+
+            for storage_format in ("columnar", "csv"):
+                case = f"capture_write.{storage_format}"
+                if case not in cases:
+                    continue
+                books = _books(spec["hours"], spec["interval"], spec["levels"], write_snapshots)
+                with tempfile.TemporaryDirectory() as writedir, contextlib.chdir(writedir), \
+                        open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    durations = _capture_write(storage_format, books, symbols)
+                    peak = _peak_mib(lambda: _capture_write(storage_format, books[:symbols * 20], symbols))
+                # Vazão em snapshots por segundo; latência por rodada
+                results[case] = _result(durations, symbols, peak)
+
+            if "heatmap.raw" in cases:
+                run = lambda: generate_heatmap_json(SYMBOL, None, "7min")  # noqa: E731
+                results["heatmap.raw"] = _result(_timed(run, repeat), rows, _peak_mib(run))
+            if "startup.refresh" in cases:
+                results["startup.refresh"] = _result(_timed(_cold_refresh, repeat), rows, _peak_mib(_cold_refresh))
+            if "heatmap.aggregated" in cases:
+                _cold_refresh()
+                run = lambda: generate_heatmap_json(SYMBOL, 10.0, "5min")  # noqa: E731
+                results["heatmap.aggregated"] = _result(_timed(run, repeat), rows, _peak_mib(run))
+            if "histogram" in cases:
+                run = lambda: generate_histogram_json(SYMBOL, None, 0, 10.0)  # noqa: E731
+                results["histogram"] = _result(_timed(run, repeat), rows, _peak_mib(run))
+        finally:
+            os.chdir(cwd)
+    print(f"\n{name}: {snapshots} snapshots, {rows} níveis")
+    return results
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for key, metrics in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            current, previous = metrics.get(metric), base.get(metric)
+            if not current or not previous:
+                continue
+            ratio = current / previous
+            worse = ratio < 1 / (1 + tolerance) if higher_is_better else ratio > 1 + tolerance
+            metrics.setdefault("vs_baseline", {})[metric] = round(ratio, 3)
+            if worse:
+                regressions.append(f"{key} {metric}: {previous} → {current} ({ratio:.2f}x)")
+    return regressions
+
+
+def _print_table(results: dict):
+    print(f"\n{'caso':<36}{'p50':>11}{'p99':>11}{'vazão/s':>14}{'pico MiB':>10}{'p50 vs base':>13}")
+    for key, metrics in results.items():
+        ratio = metrics.get("vs_baseline", {}).get("p50_ms")
+        throughput = f"{metrics['throughput']:,.0f}" if metrics["throughput"] else "-"
+        peak = f"{metrics['peak_mib']:.1f}" if metrics["peak_mib"] is not None else "-"
+        print(f"{key:<36}{metrics['p50_ms']:>9.1f}ms{metrics['p99_ms']:>9.1f}ms{throughput:>14}{peak:>10}"
+              f"{(f'{ratio:.2f}x' if ratio else '-'):>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--symbols", type=int, default=8, help="Símbolos por rodada nos casos capture_write")
+    parser.add_argument("--write-snapshots", type=int, default=400, help="Snapshots gravados nos casos capture_write")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Grava os resultados como nova linha de base")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Piora aceita antes de acusar regressão (0.3 = 30%%)")
+    parser.add_argument("--output", default=None, help="Grava os resultados em JSON")
+    args = parser.parse_args()
+
+    settings.render_workers = 0
+    settings.retention_tiers = []
+    # O histórico sintético é antigo (2023): sem horizonte, os agregados cobrem tudo
+    settings.aggregate_horizon_hours = 0
+    results = {}
+    for name in args.sizes:
+        for case, metrics in _run_size(name, SIZES[name], args.cases, args.repeat, args.symbols,
+                                       args.write_snapshots).items():
+            results[f"{name}/{case}"] = metrics
+    for case, module in IMPORTS.items():
+        if case in args.cases:
+            with tempfile.TemporaryDirectory() as workdir:
+                results[case] = _result(_import_time(workdir, args.repeat, module), 0, None)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": {name: SIZES[name] for name in args.sizes},
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = _compare(results, baseline, args.tolerance)
+        print(f"\nLinha de base: {args.baseline} ({baseline['meta']['date']}, {baseline['meta']['cpus']} CPUs)")
+    _print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nLinha de base gravada em {args.baseline}")
+    if regressions:
+        print("\nRegressões acima de {:.0%}:".format(args.tolerance))
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Gerador determinístico de histórico sintético de order book.
+
+Para cada símbolo, o `current_price` segue um passeio aleatório (retornos
+normais com volatilidade `--volatility` por snapshot) e cada lado do livro tem
+`--levels` níveis a partir do melhor preço, separados por `tick`, com um perfil
+de profundidade realista: pouco volume colado no preço, crescendo com a
+distância e com ruído log-normal. Além disso há paredes de liquidez em preços
+redondos (múltiplos de `wall_step`), cujo tamanho muda a cada hora (e que às
+vezes somem).
+A mesma semente (`--seed`) e os mesmos parâmetros geram sempre os mesmos
+arquivos; cada símbolo tem sua própria sequência, derivada do nome.
+
+Grava nos formatos suportados pela captura (`--format columnar` ou `csv`) em
+`data/` relativo ao diretório atual (ou `--data-dir`), do mesmo jeito que o
+writer da captura. Os outros benchmarks usam `generate`/`write_history`
+diretamente.
+
+Uso:
+    python -m benchmarks.synthetic_book --symbols BTCUSDT ETHUSDT --hours 24 --interval 60 --levels 500
+    python -m benchmarks.synthetic_book --symbols BTCUSDT --hours 6 --format csv --data-dir /tmp/htf
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Iterator
+
+import numpy as np
+
+os.environ.setdefault("APP_NAME", "benchmark")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.config.settings import settings  # noqa: E402
+from app.services import snapshot_store  # noqa: E402
+from app.services.snapshot_writer import _append_csv  # noqa: E402
+
+START = 1_700_006_400  # meia-noite UTC
+# Preço inicial, tick e distância entre paredes de liquidez por símbolo conhecido
+PROFILES = {
+    "BTCUSDT": (60000.0, 0.5, 100.0),
+    "ETHUSDT": (3000.0, 0.05, 10.0),
+    "SOLUSDT": (150.0, 0.01, 1.0),
+}
+DEFAULT_PROFILE = (100.0, 0.01, 1.0)
+# Snapshots gerados (e gravados) por vez
+CHUNK_SNAPSHOTS = 720
+
+
+def _rng(symbol: str, seed: int) -> np.random.Generator:
+    return np.random.default_rng([seed, zlib.crc32(symbol.upper().encode())])
+
+
+def _wall_volume(prices: np.ndarray, wall_step: float, hour: int, seed: int) -> np.ndarray:
+    """
+    Volume extra das paredes de liquidez: preços múltiplos de `wall_step` ganham
+    uma parede cujo tamanho depende do preço e da hora (estável dentro da hora).
+    """
+    on_wall = np.isclose(np.mod(prices + wall_step / 2, wall_step), wall_step / 2, atol=1e-6)
+    if not on_wall.any():
+        return np.zeros(len(prices))
+    walls = np.round(prices[on_wall] / wall_step).astype(np.int64)
+    # Hash determinístico de (parede, hora, semente) → presença e tamanho
+    mixed = (walls * 2654435761 + hour * 40503 + seed * 97) % 1000
+    size = np.where(mixed < 700, 40.0 + mixed / 10.0, 0.0)
+    volume = np.zeros(len(prices))
+    volume[on_wall] = size
+    return volume
+
+
+def generate(symbol: str, hours: float, interval: float = 60.0, levels: int = 500, seed: int = 7,
+             start: int = START, volatility: float = 0.0004) -> Iterator[tuple[np.ndarray, np.ndarray, list, list]]:
+    """
+    Gera o histórico em blocos de até `CHUNK_SNAPSHOTS` snapshots:
+    (timestamps, current_prices, bids, asks), com bids/asks como listas de
+    matrizes N×2 (price, volume), melhor nível primeiro.
+    """
+    rng = _rng(symbol, seed)
+    price, tick, wall_step = PROFILES.get(symbol.upper(), DEFAULT_PROFILE)
+    n_snapshots = int(hours * 3600 // interval)
+    distance = np.arange(levels)
+    # Perfil médio: pouco volume no topo, crescendo até ~1/3 da profundidade e caindo devagar
+    profile = 0.2 + 2.0 * (1 - np.exp(-distance / max(levels / 10, 1))) * np.exp(-distance / max(levels, 1))
+
+    for first in range(0, n_snapshots, CHUNK_SNAPSHOTS):
+        count = min(CHUNK_SNAPSHOTS, n_snapshots - first)
+        timestamps = start + ((first + np.arange(count)) * interval).astype(np.int64)
+        returns = rng.normal(0.0, volatility, count)
+        prices = price * np.exp(np.cumsum(returns))
+        price = float(prices[-1])
+        current_prices = np.round(prices / tick) * tick
+
+        bids, asks = [], []
+        noise = rng.lognormal(0.0, 0.6, (count, 2, levels))
+        spreads = rng.integers(1, 3, (count, 2))
+        for k in range(count):
+            hour = int(timestamps[k] // 3600)
+            for side, sign, out in ((0, -1, bids), (1, 1, asks)):
+                level_prices = current_prices[k] + sign * (spreads[k, side] + distance) * tick
+                level_prices = np.round(level_prices, 8)
+                volumes = profile * noise[k, side] + _wall_volume(level_prices, wall_step, hour, seed)
+                out.append(np.column_stack([level_prices, np.round(volumes, 5)]))
+        yield timestamps, current_prices, bids, asks
+
+
+def write_history(symbol: str, hours: float, interval: float = 60.0, levels: int = 500, seed: int = 7,
+                  storage_format: str = None, start: int = START, volatility: float = 0.0004) -> dict:
+    """
+    Gera e grava o histórico do símbolo no formato pedido (padrão:
+    `settings.storage_format`). Retorna um resumo (snapshots, níveis, segundos).
+    """
+    storage_format = storage_format or settings.storage_format
+    started = time.perf_counter()
+    snapshots, rows = 0, 0
+    for timestamps, current_prices, bids, asks in generate(symbol, hours, interval, levels, seed, start, volatility):
+        for side, side_levels in (("bids", bids), ("asks", asks)):
+            if storage_format == "csv":
+                items = [SimpleNamespace(timestamp=int(ts), current_price=float(cp), levels={side: lv},
+                                         datetime_local=datetime.fromtimestamp(int(ts)).strftime("%Y-%m-%d %H:%M:%S"))
+                         for ts, cp, lv in zip(timestamps, current_prices, side_levels)]
+                _append_csv(symbol, side, items)
+            else:
+                snapshot_store.append_snapshots(symbol, side, timestamps.tolist(), current_prices.tolist(), side_levels)
+            rows += sum(len(lv) for lv in side_levels)
+        snapshots += len(timestamps)
+    return {"symbol": symbol, "snapshots": snapshots, "rows": rows, "seconds": time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", nargs="+", default=["BTCUSDT"])
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--interval", type=float, default=60.0, help="Segundos entre snapshots")
+    parser.add_argument("--levels", type=int, default=500, help="Níveis por lado")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--volatility", type=float, default=0.0004, help="Desvio dos retornos por snapshot")
+    parser.add_argument("--format", choices=["columnar", "csv"], default="columnar")
+    parser.add_argument("--start", type=int, default=START, help="Epoch do primeiro snapshot")
+    parser.add_argument("--data-dir", default=None, help="Diretório onde fica a pasta data/ (padrão: o atual)")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        os.chdir(args.data_dir)
+    for symbol in args.symbols:
+        summary = write_history(symbol, args.hours, args.interval, args.levels, args.seed, args.format, args.start,
+                                args.volatility)
+        print(f"{symbol}: {summary['snapshots']} snapshots, {summary['rows']} níveis em {summary['seconds']:.1f}s "
+              f"({args.format}, {os.path.abspath(str(snapshot_store.DATA_DIR))})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
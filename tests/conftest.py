@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+# As configurações exigem APP_NAME e SYMBOLS (normalmente vindos do .env)
+os.environ.setdefault("APP_NAME", "tests")
+os.environ.setdefault("SYMBOLS", '["BTCUSDT"]')
+
+from app.services import snapshot_store  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    Armazenamento isolado numa pasta temporária.
+    """
+    monkeypatch.setattr(snapshot_store, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(snapshot_store, "_recovered", set())
+    return tmp_path / "data"
@@ -0,0 +1,37 @@
+import time
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import candles, snapshot_store
+
+
+def test_out_of_order_snapshot_updates_open_and_close():
+    series = candles._Series(60)
+    series.merge(candles.ohlc([70, 90], [10.0, 12.0], 60, with_bounds=True))
+    series.merge(candles.ohlc([180], [20.0], 60, with_bounds=True))
+    # Chegam depois: um anterior ao open do 1º candle e um posterior ao close dele
+    series.merge(candles.ohlc([65, 100, 119], [9.0, 13.0, 14.0], 60, with_bounds=True))
+    series.merge(candles.ohlc([61], [8.0], 60, with_bounds=True))
+
+    first = series.window(None, None, None)[0]
+    assert first == {"open_time": 60, "open": 8.0, "high": 14.0, "low": 8.0, "close": 14.0, "samples": 6}
+    assert series.window(120, None, None)[0]["close"] == 20.0
+
+
+def test_refresh_prunes_candles_outside_horizon(data_dir, monkeypatch):
+    monkeypatch.setattr(settings, "candle_intervals", ["1min"])
+    monkeypatch.setattr(settings, "aggregate_horizon_hours", 1.0)
+    now = int(time.time()) // 60 * 60
+    for k in range(6):
+        timestamp = now - 2 * 3600 + k * 30 * 60
+        snapshot_store.append_snapshot("BTCUSDT", "bids", timestamp, 100.0 + k, np.array([[100.0 + k, 1.0]]))
+    candles.reset("BTCUSDT")
+
+    candles.refresh("BTCUSDT")
+
+    series = candles._state("BTCUSDT").series[60]
+    assert series.open_time and series.open_time[0] >= now - 3600 - 60
+    # A janela completa começa antes do que está em memória: sai do armazenamento
+    full = candles.get_candles("BTCUSDT", "1min")
+    assert [candle["open"] for candle in full] == [100.0 + k for k in range(6)]
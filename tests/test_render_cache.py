@@ -0,0 +1,30 @@
+import asyncio
+
+from app.services.render_cache import RenderCache
+
+
+def test_cancelled_leader_does_not_cancel_coalesced_waiters():
+    async def scenario():
+        cache = RenderCache(max_entries=10, max_bytes=1 << 20)
+        key = cache.make_key("heatmap", "BTCUSDT", "bids", 1.0, "1min", (None, None))
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "grid"
+
+        leader = asyncio.ensure_future(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await waiter == "grid"
+        assert leader.cancelled()
+        assert cache.stats()["coalesced"] == 1
+        assert await cache.get_or_compute(key, compute) == "grid"
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(scenario())
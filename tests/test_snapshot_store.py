@@ -0,0 +1,25 @@
+import numpy as np
+
+from app.config.settings import settings
+from app.services import snapshot_store
+
+DAY = 1699920000  # 2023-11-14 00:00 UTC
+
+
+def _levels(n: int, price: float) -> np.ndarray:
+    return np.column_stack([price + np.arange(n, dtype=np.float64), np.ones(n)])
+
+
+def test_appends_go_to_newest_part_after_rotation(data_dir, monkeypatch):
+    # Cada snapshot tem 10 níveis × 16 bytes = 160 bytes: a parte passa do limite no 4º
+    monkeypatch.setattr(settings, "segment_max_bytes", 600)
+    for k in range(6):
+        snapshot_store.append_snapshot("BTCUSDT", "bids", DAY + 60 * k, 100.0, _levels(10, 100.0 + k))
+
+    segments = snapshot_store.list_segments("BTCUSDT", "bids")
+    assert [segment.name for segment in segments] == ["20231114", "20231114-001"]
+    assert [snapshot_store._header_count(segment) for segment in segments] == [4, 2]
+
+    headers, levels = snapshot_store.read_snapshots("BTCUSDT", "bids")
+    assert headers["timestamp"].tolist() == [DAY + 60 * k for k in range(6)]
+    assert levels["price"][::10].tolist() == [100.0 + k for k in range(6)]